@@ -0,0 +1,123 @@
+"""
+直播源解析微基准
+生成合成的 M3U 播放列表，对比改造前的正则解析（整体解码后 split，代码照搬自改造前的 main.py）
+与当前逐块流式解析的耗时和内存峰值，并校验两者得到的线路完全一致；
+split 为当前解析器配合整体 split，用于区分流式读取本身与记录解析的开销。
+
+用法: python benchmarks/bench_parser.py [--lines 500000] [--repeat 3]
+"""
+import argparse
+import os
+import re
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+def build_m3u(line_count):
+    """生成约 line_count 行的 M3U 内容（字节串）"""
+    parts = ["#EXTM3U\n"]
+    for index in range(line_count // 2):
+        category = f"分类{index % 40}"
+        name = f"CCTV-{index % 17 + 1}" if index % 3 == 0 else f"频道{index % 5000}"
+        parts.append(f'#EXTINF:-1 tvg-id="{index}" tvg-name="{name}" group-title="{category}",{name}\n')
+        parts.append(f"http://198.51.100.{index % 250}:8080/live/{index}.m3u8\n")
+    return "".join(parts).encode("utf-8")
+
+
+def baseline_clean_channel_name(channel_name):
+    # 改造前的 clean_channel_name，保持原样作为对照
+    cleaned_name = re.sub(r'[$「」-]', '', channel_name)
+    cleaned_name = re.sub(r'\s+', '', cleaned_name)
+    cleaned_name = re.sub(r'(\D*)(\d+)', lambda m: m.group(1) + str(int(m.group(2))), cleaned_name)
+    return cleaned_name.upper()
+
+
+def baseline_parse_m3u_lines(lines):
+    # 改造前的 parse_m3u_lines，保持原样作为对照
+    channels = OrderedDict()
+    current_category = None
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith("#EXTINF"):
+            match = re.search(r'group-title="(.*?)",(.*)', line)
+            if match:
+                current_category = match.group(1).strip()
+                channel_name = match.group(2).strip()
+                if channel_name and channel_name.startswith("CCTV"):
+                    channel_name = baseline_clean_channel_name(channel_name)
+
+                if current_category not in channels:
+                    channels[current_category] = []
+        elif line and not line.startswith("#"):
+            channel_url = line.strip()
+            if current_category and channel_name:
+                channels[current_category].append((channel_name, channel_url))
+
+    return channels
+
+
+def baseline_parse(body):
+    """改造前：整体解码后 split，用正则解析"""
+    return baseline_parse_m3u_lines(body.decode("utf-8", errors="replace").split("\n"))
+
+
+def split_parse(body):
+    """当前解析器，整体解码后 split"""
+    return main.parse_m3u_lines(body.decode("utf-8", errors="replace").split("\n"))
+
+
+def stream_parse(body, chunk_size):
+    """当前：按块读取，边切行边解析"""
+    chunks = (body[offset:offset + chunk_size] for offset in range(0, len(body), chunk_size))
+    return main.parse_m3u_lines(main.iter_chunk_lines(chunks))
+
+
+def as_tuples(channels):
+    """统一为 分类 -> [(名称, URL)]，便于比较两种解析结果"""
+    return {category: [(item[0], item[1]) if isinstance(item, tuple) else (item.name, item.url)
+                       for item in channel_list]
+            for category, channel_list in channels.items()}
+
+
+def measure(label, repeat, func, *args):
+    # 耗时与内存分开测量，避免 tracemalloc 的开销影响计时；耗时取多次运行的最小值，减少其他进程的干扰
+    elapsed = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        channels = func(*args)
+        elapsed = min(elapsed, time.perf_counter() - start)
+        del channels
+    tracemalloc.start()
+    channels = func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    records = sum(len(channel_list) for channel_list in channels.values())
+    print(f"{label:<8} {elapsed:8.3f}s  峰值内存 {peak / 1024 / 1024:8.1f} MB  记录数 {records}")
+    return channels
+
+
+def run():
+    parser = argparse.ArgumentParser(description="M3U 解析微基准")
+    parser.add_argument("--lines", type=int, default=500_000, help="合成播放列表的行数")
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024, help="流式读取的块大小")
+    parser.add_argument("--repeat", type=int, default=3, help="计时重复次数，取最小值")
+    args = parser.parse_args()
+
+    body = build_m3u(args.lines)
+    print(f"合成播放列表: {args.lines} 行, {len(body) / 1024 / 1024:.1f} MB")
+    baseline_result = measure("baseline", args.repeat, baseline_parse, body)
+    split_result = measure("split", args.repeat, split_parse, body)
+    stream_result = measure("stream", args.repeat, stream_parse, body, args.chunk_size)
+    assert as_tuples(split_result) == as_tuples(stream_result), "两种解析方式结果不一致"
+    assert as_tuples(baseline_result) == as_tuples(stream_result), "两种解析方式结果不一致"
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,244 @@
+"""
+流水线基准
+生成合成直播源并由本地替身服务提供，依次运行 模板解析 -> 抓取 -> 合并 -> 匹配 -> 测速 -> 写出，
+记录每个阶段的耗时、CPU 时间和内存峰值，结果写成 JSON，可与保存的基线对比。
+全程只访问回环地址，可离线运行。耗时与内存分两遍测量，避免 tracemalloc 的开销影响计时。
+
+用法:
+  python benchmarks/bench_pipeline.py                              # 运行并写出 benchmarks/results/latest.json
+  python benchmarks/bench_pipeline.py --save-baseline benchmarks/results/baseline.json
+  python benchmarks/bench_pipeline.py --baseline benchmarks/results/baseline.json   # 有退化时退出码为 1
+  python benchmarks/bench_pipeline.py --probe-processes 4 --standin-processes 4      # 多进程测速的扩展性
+多进程测速时 CPU 列只统计主进程，测速子进程的 CPU 时间不计入。
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+from contextlib import contextmanager
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from standin import StandInServer, free_port  # noqa: E402
+from synthetic import build_sources, host_profiles  # noqa: E402
+
+RESULT_VERSION = 1
+# 小于该秒数的阶段耗时差异视为噪声，不判定为退化
+NOISE_FLOOR = 0.05
+
+
+class StageRecorder:
+    """记录各阶段的墙钟时间、CPU 时间，以及（开启时）tracemalloc 内存峰值"""
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.stages = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        if self.memory:
+            tracemalloc.reset_peak()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        yield
+        record = self.stages.setdefault(name, {})
+        if self.memory:
+            record["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        else:
+            record["wall"] = round(time.perf_counter() - wall_start, 4)
+            record["cpu"] = round(time.process_time() - cpu_start, 4)
+
+
+def run_pipeline(main, recorder, template_file, source_urls, args):
+    """按阶段运行一遍流水线，返回计数信息"""
+    counts = OrderedDict()
+    with recorder.stage("parse_template"):
+        template_channels = main.parse_template(template_file)
+
+    with recorder.stage("fetch"):
+        fetched = main.fetch_all_sources(source_urls)
+
+    with recorder.stage("merge"):
+        all_channels = OrderedDict()
+        for fetched_channels in fetched:
+            main.merge_channels(all_channels, fetched_channels)
+    counts["source_records"] = sum(len(channel_list) for channel_list in all_channels.values())
+
+    with recorder.stage("match"):
+        channels = main.match_channels(template_channels, all_channels)
+    counts["matched_channels"] = sum(len(channel_map) for channel_map in channels.values())
+
+    if args.difflib:
+        # 参考实现：逐个模板频道对全部名称做 difflib 匹配，并核对与索引匹配结果是否一致
+        from utils.matcher import ChannelMatcher
+        matcher = ChannelMatcher(all_channels)
+        names = list(matcher.urls_by_name)
+        mismatches = 0
+        with recorder.stage("match_difflib"):
+            for channel_names in template_channels.values():
+                for channel_name in channel_names:
+                    if main.find_similar_name(channel_name, names) != matcher.find(channel_name):
+                        mismatches += 1
+        counts["difflib_mismatches"] = mismatches
+
+    classifier = main.UrlClassifier(main.config.url_blacklist)
+    if not args.no_probe:
+        with recorder.stage("probe"):
+            channels = main.probe_channels(channels, classifier)
+        counts["alive_channels"] = sum(len(channel_map) for channel_map in channels.values())
+
+    with recorder.stage("write"):
+        main.updateChannelUrlsM3U(channels, template_channels, classifier)
+    counts["output_bytes"] = sum(os.path.getsize(f"output/live_{version}.m3u") for version in ("ipv4", "ipv6"))
+    return counts
+
+
+def configure(main, args):
+    """关闭跨运行的缓存，保证每次测量从相同状态开始"""
+    config = main.config
+    config.SOURCE_CACHE_ENABLED = False
+    config.CHECKPOINT_ENABLED = False
+    config.SOURCE_YIELD_ENABLED = False
+    config.REDIRECT_CACHE_ENABLED = False
+    config.HEALTH_DB_ENABLED = False
+    config.FETCH_TOTAL_BUDGET = 600
+    config.TEST_TIMEOUT = args.timeout
+    config.SPEED_TEST_RETRY_TIMES = 1
+    config.PROBE_PROCESSES = args.probe_processes
+
+
+def compare(results, baseline, tolerance):
+    """与基线逐阶段对比，返回退化项列表"""
+    regressions = []
+    for name, current in results["stages"].items():
+        previous = baseline.get("stages", {}).get(name)
+        if not previous:
+            continue
+        for metric in ("wall", "cpu", "peak_bytes"):
+            if metric not in current or not previous.get(metric):
+                continue
+            ratio = current[metric] / previous[metric]
+            delta = current[metric] - previous[metric]
+            noise = NOISE_FLOOR if metric != "peak_bytes" else 1024 * 1024
+            flag = ""
+            if ratio > 1 + tolerance and delta > noise:
+                flag = "  <-- 退化"
+                regressions.append(f"{name}.{metric}")
+            print(f"{name:<16}{metric:<11}{previous[metric]:>14.4f} -> {current[metric]:>14.4f}  x{ratio:.2f}{flag}")
+    if results["params"] != baseline.get("params"):
+        print("注意: 基线的运行参数与本次不同，对比结果仅供参考")
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run():
+    parser = argparse.ArgumentParser(description="直播源流水线基准")
+    parser.add_argument("--sources", type=int, default=6, help="合成直播源数量")
+    parser.add_argument("--channels", type=int, default=1500, help="每个直播源的频道条目数")
+    parser.add_argument("--hosts", type=int, default=24, help="模拟的直播流主机数")
+    parser.add_argument("--dead-hosts", type=int, default=2, help="无法连接的主机数")
+    parser.add_argument("--latency-ms", type=float, default=20, help="主机平均响应延迟（毫秒）")
+    parser.add_argument("--failure-rate", type=float, default=0.1, help="主机平均失败率")
+    parser.add_argument("--hang-rate", type=float, default=0.005, help="请求挂起直至超时的比例")
+    parser.add_argument("--bandwidth-kbps", type=float, default=8000, help="主机平均带宽（kbps）")
+    parser.add_argument("--segment-kb", type=int, default=64, help="媒体分片大小（KB）")
+    parser.add_argument("--timeout", type=float, default=3, help="测速超时（秒）")
+    parser.add_argument("--probe-processes", type=int, default=1, help="测速进程数（PROBE_PROCESSES）")
+    parser.add_argument("--standin-processes", type=int, default=1, help="替身服务的进程数")
+    parser.add_argument("--seed", type=int, default=1, help="随机种子")
+    parser.add_argument("--no-probe", action="store_true", help="跳过测速阶段")
+    parser.add_argument("--no-memory", action="store_true", help="跳过内存峰值测量")
+    parser.add_argument("--difflib", action="store_true", help="同时运行 difflib 参考匹配并核对结果")
+    parser.add_argument("--output", default=os.path.join(REPO_DIR, "benchmarks", "results", "latest.json"),
+                        help="结果 JSON 路径")
+    parser.add_argument("--baseline", help="与该基线 JSON 对比")
+    parser.add_argument("--save-baseline", help="将本次结果另存为基线")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="判定为退化的相对增幅")
+    parser.add_argument("--verbose", action="store_true", help="保留流水线的 INFO 日志")
+    args = parser.parse_args()
+    # 流水线在临时目录中运行，先把用户给出的路径转为绝对路径
+    for key in ("output", "baseline", "save_baseline"):
+        if getattr(args, key):
+            setattr(args, key, os.path.abspath(getattr(args, key)))
+
+    workdir = tempfile.mkdtemp(prefix="iptv_bench_")
+    os.symlink(os.path.join(REPO_DIR, "pic"), os.path.join(workdir, "pic"))
+    template_file = os.path.join(REPO_DIR, "demo.txt")
+    os.chdir(workdir)
+    import main  # noqa: E402
+    main.setup_output()  # 在临时目录中创建 output/
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.ERROR)
+    configure(main, args)
+
+    port = free_port()
+    dead_port = free_port()
+    rng = random.Random(args.seed)
+    profiles = host_profiles(args.hosts, port, args.latency_ms, args.failure_rate, args.bandwidth_kbps,
+                             args.hang_rate, args.dead_hosts, rng)
+    sources = build_sources(main.parse_template(template_file), args.sources, args.channels,
+                            profiles, dead_port, seed=args.seed)
+
+    with StandInServer(port, sources, profiles, segment_bytes=args.segment_kb * 1024,
+                       processes=args.standin_processes) as server:
+        source_urls = [server.source_url(name) for name, _ in sources]
+        recorder = StageRecorder()
+        counts = run_pipeline(main, recorder, template_file, source_urls, args)
+        if not args.no_memory:
+            recorder.memory = True
+            tracemalloc.start()
+            run_pipeline(main, recorder, template_file, source_urls, args)
+            tracemalloc.stop()
+
+    results = OrderedDict([
+        ("version", RESULT_VERSION),
+        ("revision", git_revision()),
+        ("python", platform.python_version()),
+        ("platform", platform.platform()),
+        ("params", {key: value for key, value in vars(args).items()
+                    if key not in ("output", "baseline", "save_baseline", "tolerance", "verbose")}),
+        ("source_bytes", sum(len(body) for _, body in sources)),
+        ("counts", counts),
+        ("stages", recorder.stages),
+    ])
+
+    print(f"{'阶段':<14}{'耗时(s)':>10}{'CPU(s)':>10}{'峰值(MB)':>12}")
+    for name, record in recorder.stages.items():
+        peak = record.get("peak_bytes")
+        print(f"{name:<16}{record['wall']:>10.3f}{record['cpu']:>10.3f}"
+              f"{peak / 1024 / 1024 if peak is not None else float('nan'):>12.1f}")
+    print(json.dumps(counts, ensure_ascii=False))
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"发现退化: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,355 @@
+"""
+样例码流生成
+按给定的编码、分辨率和帧率生成最小但结构完整的 MPEG-TS 分片和 FLV 流：PAT / PMT、带 PTS 的 PES、
+H.264 / H.265 参数集（SPS 含裁剪和 VUI 时间信息）、FLV 的 onMetaData 和 AVC/HEVC 解码配置记录，
+图像数据为填充字节。替身服务用它提供带真实头部的媒体分片，也可直接运行核对码流嗅探的结果：
+  python benchmarks/samples.py
+"""
+import os
+import struct
+import sys
+from fractions import Fraction
+
+VIDEO_PID = 0x100
+AUDIO_PID = 0x101
+PMT_PID = 0x1000
+# 每帧的填充数据中不含 00 00，不会被误认为起始码
+FRAME_FILL = b"\xa5"
+
+
+class BitWriter:
+    def __init__(self):
+        self.value = 0
+        self.size = 0
+
+    def bits(self, value, count):
+        self.value = (self.value << count) | (value & ((1 << count) - 1))
+        self.size += count
+
+    def ue(self, value):
+        value += 1
+        length = value.bit_length()
+        self.bits(0, length - 1)
+        self.bits(value, length)
+
+    def rbsp(self):
+        """加上 rbsp_trailing_bits 并按字节对齐"""
+        self.bits(1, 1)
+        if self.size % 8:
+            self.bits(0, 8 - self.size % 8)
+        return self.value.to_bytes(self.size // 8, "big")
+
+
+def escape_rbsp(data):
+    """插入防竞争字节：00 00 后跟 00~03 时插入 03"""
+    out = bytearray()
+    zeros = 0
+    for byte in data:
+        if zeros >= 2 and byte <= 3:
+            out.append(3)
+            zeros = 0
+        out.append(byte)
+        zeros = zeros + 1 if byte == 0 else 0
+    return bytes(out)
+
+
+def timing(fps):
+    """帧率 -> (num_units_in_tick, time_scale)，29.97 等按 1001 分母表示"""
+    rate = Fraction(fps).limit_denominator(1001)
+    return rate.denominator, rate.numerator
+
+
+def h264_sps(width, height, fps, interlaced=False):
+    """High profile 4:2:0 的 SPS，尺寸不是宏块整数倍时用裁剪表示"""
+    writer = BitWriter()
+    writer.bits(100, 8)  # profile_idc
+    writer.bits(0, 8)
+    writer.bits(40, 8)  # level_idc
+    writer.ue(0)  # seq_parameter_set_id
+    writer.ue(1)  # chroma_format_idc
+    writer.ue(0)
+    writer.ue(0)
+    writer.bits(0, 2)  # qpprime_y_zero_transform_bypass_flag、seq_scaling_matrix_present_flag
+    writer.ue(0)  # log2_max_frame_num_minus4
+    writer.ue(0)  # pic_order_cnt_type
+    writer.ue(2)
+    writer.ue(1)  # max_num_ref_frames
+    writer.bits(0, 1)
+    map_unit = 32 if interlaced else 16
+    width_mbs = -(-width // 16)
+    height_units = -(-height // map_unit)
+    writer.ue(width_mbs - 1)
+    writer.ue(height_units - 1)
+    writer.bits(0 if interlaced else 1, 1)  # frame_mbs_only_flag
+    if interlaced:
+        writer.bits(0, 1)
+    writer.bits(1, 1)  # direct_8x8_inference_flag
+    crop_right = (width_mbs * 16 - width) // 2
+    crop_bottom = (height_units * map_unit - height) // (4 if interlaced else 2)
+    writer.bits(1 if crop_right or crop_bottom else 0, 1)
+    if crop_right or crop_bottom:
+        for value in (0, crop_right, 0, crop_bottom):
+            writer.ue(value)
+    writer.bits(1, 1)  # vui_parameters_present_flag
+    writer.bits(1, 1)  # aspect_ratio_info_present_flag
+    writer.bits(255, 8)  # Extended_SAR
+    writer.bits(1, 16)
+    writer.bits(1, 16)
+    writer.bits(0, 1)  # overscan_info_present_flag
+    writer.bits(1, 1)  # video_signal_type_present_flag
+    writer.bits(5, 3)
+    writer.bits(0, 1)
+    writer.bits(1, 1)  # colour_description_present_flag
+    writer.bits(0x010101, 24)
+    writer.bits(0, 1)  # chroma_loc_info_present_flag
+    writer.bits(1, 1)  # timing_info_present_flag
+    num_units_in_tick, time_scale = timing(fps)
+    writer.bits(num_units_in_tick, 32)
+    writer.bits(time_scale * 2, 32)
+    writer.bits(1, 1)  # fixed_frame_rate_flag
+    writer.bits(0, 5)  # hrd、pic_struct、bitstream_restriction
+    return b"\x67" + escape_rbsp(writer.rbsp())
+
+
+def h264_pps():
+    writer = BitWriter()
+    writer.ue(0)
+    writer.ue(0)
+    writer.bits(1, 1)  # entropy_coding_mode_flag
+    writer.bits(0, 1)
+    writer.ue(0)
+    writer.ue(0)
+    writer.ue(0)
+    writer.bits(0, 3)
+    writer.ue(0)
+    writer.ue(0)
+    writer.ue(0)
+    writer.bits(0, 3)
+    return b"\x68" + escape_rbsp(writer.rbsp())
+
+
+def _profile_tier_level(writer):
+    writer.bits(0, 2)  # general_profile_space
+    writer.bits(0, 1)
+    writer.bits(1, 5)  # Main
+    writer.bits(0x60000000, 32)
+    writer.bits(0b1001, 4)
+    writer.bits(0, 43)
+    writer.bits(0, 1)
+    writer.bits(120, 8)  # level 4
+
+
+def h265_vps(fps):
+    writer = BitWriter()
+    writer.bits(0, 4)
+    writer.bits(0b11, 2)
+    writer.bits(0, 6)
+    writer.bits(0, 3)  # vps_max_sub_layers_minus1
+    writer.bits(1, 1)
+    writer.bits(0xFFFF, 16)
+    _profile_tier_level(writer)
+    writer.bits(1, 1)  # vps_sub_layer_ordering_info_present_flag
+    writer.ue(4)
+    writer.ue(0)
+    writer.ue(0)
+    writer.bits(0, 6)  # vps_max_layer_id
+    writer.ue(0)
+    writer.bits(1, 1)  # vps_timing_info_present_flag
+    num_units_in_tick, time_scale = timing(fps)
+    writer.bits(num_units_in_tick, 32)
+    writer.bits(time_scale, 32)
+    writer.bits(0, 1)
+    writer.ue(0)
+    writer.bits(0, 1)
+    return b"\x40\x01" + escape_rbsp(writer.rbsp())
+
+
+def h265_sps(width, height):
+    """4:2:0 的 SPS，只写到 conformance window 之后的几个字段"""
+    coded_width = -(-width // 8) * 8
+    coded_height = -(-height // 8) * 8
+    writer = BitWriter()
+    writer.bits(0, 4)
+    writer.bits(0, 3)
+    writer.bits(1, 1)
+    _profile_tier_level(writer)
+    writer.ue(0)  # sps_seq_parameter_set_id
+    writer.ue(1)  # chroma_format_idc
+    writer.ue(coded_width)
+    writer.ue(coded_height)
+    crop_right = (coded_width - width) // 2
+    crop_bottom = (coded_height - height) // 2
+    writer.bits(1 if crop_right or crop_bottom else 0, 1)
+    if crop_right or crop_bottom:
+        for value in (0, crop_right, 0, crop_bottom):
+            writer.ue(value)
+    writer.ue(0)  # bit_depth_luma_minus8
+    writer.ue(0)
+    writer.ue(4)
+    return b"\x42\x01" + escape_rbsp(writer.rbsp())
+
+
+def parameter_sets(codec, width, height, fps, interlaced=False):
+    if codec == "h265":
+        return [h265_vps(fps), h265_sps(width, height), b"\x44\x01\xc1\x72\xb4\x62\x40"]
+    return [h264_sps(width, height, fps, interlaced), h264_pps()]
+
+
+def frame_nals(codec, index, frame_bytes):
+    """一帧的图像 NAL：每个 GOP 的首帧为关键帧"""
+    keyframe = index % 25 == 0
+    if codec == "h265":
+        header = b"\x26\x01" if keyframe else b"\x02\x01"
+    else:
+        header = b"\x65" if keyframe else b"\x41"
+    return keyframe, header + FRAME_FILL * max(frame_bytes, 1)
+
+
+def crc32_mpeg(data):
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7 if crc & 0x80000000 else crc << 1) & 0xFFFFFFFF
+    return crc
+
+
+def _psi_packet(pid, table_id, table_id_extension, body):
+    section = bytes([table_id]) + struct.pack(">H", 0xB000 | (len(body) + 9)) \
+        + struct.pack(">H", table_id_extension) + b"\xc1\x00\x00" + body
+    section += struct.pack(">I", crc32_mpeg(section))
+    payload = b"\x00" + section
+    header = bytes([0x47, 0x40 | (pid >> 8), pid & 0xFF, 0x10])
+    return header + payload + b"\xff" * (184 - len(payload))
+
+
+def _ts_packets(pid, payload, counter):
+    """把一个 PES 切成 TS 包，最后一个包用自适应字段填充"""
+    packets = []
+    offset = 0
+    while offset < len(payload):
+        chunk = payload[offset:offset + 184]
+        header = bytes([0x47, (0x40 if offset == 0 else 0) | (pid >> 8), pid & 0xFF])
+        if len(chunk) < 184:
+            stuffing = 184 - len(chunk)
+            adaptation = bytes([stuffing - 1]) + (b"\x00" + b"\xff" * (stuffing - 2) if stuffing > 1 else b"")
+            packets.append(header + bytes([0x30 | counter]) + adaptation + chunk)
+        else:
+            packets.append(header + bytes([0x10 | counter]) + chunk)
+        counter = (counter + 1) & 0x0F
+        offset += len(chunk)
+    return packets, counter
+
+
+def _pts_bytes(pts):
+    return bytes([0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, 0x01 | ((pts >> 14) & 0xFE),
+                  (pts >> 7) & 0xFF, 0x01 | ((pts << 1) & 0xFE)])
+
+
+def ts_segment(width, height, fps, size, codec="h264", interlaced=False):
+    """生成约 size 字节的 TS 分片，PMT 中音频流排在视频流之前"""
+    stream_type = 0x24 if codec == "h265" else 0x1B
+    packets = [
+        _psi_packet(0, 0x00, 1, struct.pack(">HH", 1, 0xE000 | PMT_PID)),
+        _psi_packet(PMT_PID, 0x02, 1, struct.pack(">HH", 0xE000 | VIDEO_PID, 0xF000)
+                    + bytes([0x0F]) + struct.pack(">HH", 0xE000 | AUDIO_PID, 0xF000)
+                    + bytes([stream_type]) + struct.pack(">HH", 0xE000 | VIDEO_PID, 0xF000)),
+    ]
+    frame_count = max(int(size // 188 // 8), 1)
+    frame_bytes = max(size // frame_count - 40, 16)
+    counter = 0
+    for index in range(frame_count):
+        keyframe, nal = frame_nals(codec, index, frame_bytes)
+        nals = (parameter_sets(codec, width, height, fps, interlaced) if keyframe else []) + [nal]
+        es = b"".join(b"\x00\x00\x00\x01" + item for item in nals)
+        pts = 90000 + round(index * 90000 / fps)
+        pes = b"\x00\x00\x01\xe0\x00\x00\x80\x80\x05" + _pts_bytes(pts) + es
+        frame_packets, counter = _ts_packets(VIDEO_PID, pes, counter)
+        packets.extend(frame_packets)
+    return b"".join(packets)
+
+
+def _amf_string(text):
+    data = text.encode("utf-8")
+    return struct.pack(">H", len(data)) + data
+
+
+def _flv_tag(tag_type, timestamp, data):
+    header = bytes([tag_type]) + len(data).to_bytes(3, "big") + (timestamp & 0xFFFFFF).to_bytes(3, "big") \
+        + bytes([timestamp >> 24 & 0xFF]) + b"\x00\x00\x00"
+    return header + data + struct.pack(">I", 11 + len(data))
+
+
+def flv_stream(width, height, fps, size, codec="h264"):
+    """生成约 size 字节的 FLV 流：onMetaData、视频序列头和若干视频帧"""
+    metadata = {"width": width, "height": height, "framerate": fps, "videocodecid": 12 if codec == "h265" else 7}
+    script = b"\x02" + _amf_string("onMetaData") + b"\x08" + struct.pack(">I", len(metadata))
+    for key, value in metadata.items():
+        script += _amf_string(key) + b"\x00" + struct.pack(">d", value)
+    script += b"\x00\x00\x09"
+
+    nals = parameter_sets(codec, width, height, fps)
+    codec_id = 12 if codec == "h265" else 7
+    if codec == "h265":
+        record = b"\x01" + b"\x00" * 21 + b"\x0f" + bytes([len(nals)])
+        for nal in nals:
+            record += bytes([(nal[0] >> 1) & 0x3F]) + struct.pack(">HH", 1, len(nal)) + nal
+    else:
+        sps, pps = nals
+        record = bytes([1, sps[1], sps[2], sps[3], 0xFF, 0xE1]) + struct.pack(">H", len(sps)) + sps \
+            + b"\x01" + struct.pack(">H", len(pps)) + pps
+
+    body = b"FLV\x01\x01\x00\x00\x00\x09\x00\x00\x00\x00"
+    body += _flv_tag(18, 0, script)
+    body += _flv_tag(9, 0, bytes([0x10 | codec_id, 0]) + b"\x00\x00\x00" + record)
+    frame_count = max(int(size // 188 // 8), 1)
+    frame_bytes = max(size // frame_count - 40, 16)
+    for index in range(frame_count):
+        keyframe, nal = frame_nals(codec, index, frame_bytes)
+        flags = (0x10 if keyframe else 0x20) | codec_id
+        body += _flv_tag(9, round(index * 1000 / fps),
+                         bytes([flags, 1]) + b"\x00\x00\x00" + struct.pack(">I", len(nal)) + nal)
+    return body
+
+
+# 核对用的样例：(封装, 编码, 宽, 高, 帧率, 隔行)
+SAMPLES = [
+    ("ts", "h264", 1920, 1080, 25, False),
+    ("ts", "h264", 1920, 1080, 25, True),
+    ("ts", "h264", 1280, 720, 50, False),
+    ("ts", "h264", 720, 576, 25, False),
+    ("ts", "h265", 3840, 2160, 50, False),
+    ("ts", "h265", 1920, 1080, 30000 / 1001, False),
+    ("flv", "h264", 1280, 720, 30, False),
+    ("flv", "h264", 854, 480, 30000 / 1001, False),
+    ("flv", "h265", 1920, 1080, 25, False),
+]
+
+
+def check(chunk_size=16 * 1024):
+    """生成每个样例并分块喂给嗅探器，打印结果，全部一致时返回 0"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from utils.bitstream import StreamSniffer
+
+    failures = 0
+    for container, codec, width, height, fps, interlaced in SAMPLES:
+        if container == "ts":
+            body = ts_segment(width, height, fps, 256 * 1024, codec, interlaced)
+        else:
+            body = flv_stream(width, height, fps, 256 * 1024, codec)
+        sniffer = StreamSniffer()
+        for offset in range(0, len(body), chunk_size):
+            if sniffer.feed(body[offset:offset + chunk_size]):
+                break
+        info = sniffer.finish()
+        ok = ((info.container, info.codec, info.width, info.height) == (container, codec, width, height)
+              and info.fps is not None and abs(info.fps - fps) < 0.01)
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {container:<4}{codec:<6}{width}x{height}@{fps:.3f}"
+              f"{'i' if interlaced else ''} -> {info.codec} {info.resolution} {info.fps} "
+              f"读取 {sniffer.consumed // 1024}KB，耗时 {sniffer.elapsed * 1000:.2f}ms")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(check())
@@ -0,0 +1,164 @@
+"""
+本地替身服务
+在子进程中用 aiohttp 同时模拟直播源站点和直播流主机，所有请求都走回环地址，可完全离线运行。
+按请求的 Host 区分主机，每个主机有自己的响应延迟、失败率、挂起率和带宽限制：
+  /sources/<文件名>        合成直播源
+  /live/<id>.m3u8          HLS 播放列表（部分为多码率主播放列表）
+  /live/<id>/<n>.ts        媒体分片，按主机带宽限速发送
+  /live/<id>.ts            直连流，按主机带宽限速发送
+媒体分片由 samples.ts_segment 生成，带有真实的 PAT / PMT 和 SPS，分辨率和帧率按 id 轮换，主播放列表的子列表与声明的分辨率一致。
+"""
+import asyncio
+import hashlib
+import multiprocessing
+import socket
+import time
+
+from aiohttp import web
+
+from samples import ts_segment
+
+SEGMENT_COUNT = 3
+SEND_CHUNK = 16 * 1024
+# 媒体分片的 (编码, 宽, 高, 帧率)，按 id 轮换
+STREAM_FORMATS = [("h264", 1920, 1080, 25), ("h264", 1280, 720, 50), ("h264", 720, 576, 25),
+                  ("h265", 3840, 2160, 50), ("h264", 1920, 1080, 30000 / 1001)]
+VARIANT_FORMATS = {"low": ("h264", 640, 360, 25), "high": ("h264", 1920, 1080, 25)}
+
+
+def free_port():
+    """取一个当前空闲的本地端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def stable_fraction(*parts):
+    """根据请求内容得到 [0, 1) 内的确定值，同一请求每次运行的失败与否保持一致"""
+    digest = hashlib.sha1("|".join(parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def create_app(sources, profiles, segment_bytes, source_latency):
+    default_profile = {"latency": 0, "failure_rate": 0, "bandwidth": 0, "hang_rate": 0}
+    segment_bodies = {}
+
+    def segment_body(stream_id, variant):
+        stream_format = VARIANT_FORMATS.get(variant) or STREAM_FORMATS[int(stream_id) % len(STREAM_FORMATS)]
+        if stream_format not in segment_bodies:
+            codec, width, height, fps = stream_format
+            segment_bodies[stream_format] = ts_segment(width, height, fps, segment_bytes, codec)[:segment_bytes]
+        return segment_bodies[stream_format]
+
+    async def send_throttled(request, body, profile, content_type):
+        response = web.StreamResponse(headers={"Content-Type": content_type})
+        response.content_length = len(body)
+        await response.prepare(request)
+        bandwidth = profile["bandwidth"]
+        for offset in range(0, len(body), SEND_CHUNK):
+            chunk = body[offset:offset + SEND_CHUNK]
+            await response.write(chunk)
+            if bandwidth:
+                await asyncio.sleep(len(chunk) / bandwidth)
+        await response.write_eof()
+        return response
+
+    def host_profile(request):
+        return profiles.get(request.host, default_profile)
+
+    @web.middleware
+    async def host_behaviour(request, handler):
+        profile = host_profile(request)
+        if profile["latency"]:
+            await asyncio.sleep(profile["latency"])
+        fraction = stable_fraction(request.host, request.path)
+        if fraction < profile["hang_rate"]:
+            # 模拟连接挂起，由测速超时结束
+            await asyncio.sleep(3600)
+        if fraction < profile["hang_rate"] + profile["failure_rate"]:
+            raise web.HTTPServiceUnavailable()
+        return await handler(request)
+
+    async def source(request):
+        body = sources.get(request.match_info["name"])
+        if body is None:
+            raise web.HTTPNotFound()
+        await asyncio.sleep(source_latency)
+        return web.Response(body=body, content_type="text/plain", charset="utf-8")
+
+    async def playlist(request):
+        stream_id = request.match_info["stream_id"]
+        if int(stream_id) % 7 == 0 and not request.match_info.get("variant"):
+            body = ("#EXTM3U\n"
+                    "#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\n"
+                    f"{stream_id}/low.m3u8\n"
+                    "#EXT-X-STREAM-INF:BANDWIDTH=4000000,RESOLUTION=1920x1080\n"
+                    f"{stream_id}/high.m3u8\n")
+        else:
+            variant = request.match_info.get("variant")
+            prefix = f"{variant}/" if variant else f"{stream_id}/"
+            segments = "".join(f"#EXTINF:6.0,\n{prefix}{index}.ts\n" for index in range(SEGMENT_COUNT))
+            body = f"#EXTM3U\n#EXT-X-TARGETDURATION:6\n#EXT-X-MEDIA-SEQUENCE:1\n{segments}"
+        return web.Response(text=body, content_type="application/vnd.apple.mpegurl")
+
+    async def segment(request):
+        body = segment_body(request.match_info["stream_id"], request.match_info.get("variant"))
+        return await send_throttled(request, body, host_profile(request), "video/mp2t")
+
+    app = web.Application(middlewares=[host_behaviour])
+    app.router.add_get("/sources/{name}", source)
+    app.router.add_get("/live/{stream_id:\\d+}.m3u8", playlist)
+    app.router.add_get("/live/{stream_id:\\d+}/{variant:low|high}.m3u8", playlist)
+    app.router.add_get("/live/{stream_id:\\d+}/{index:\\d+}.ts", segment)
+    app.router.add_get("/live/{stream_id:\\d+}/{variant:low|high}/{index:\\d+}.ts", segment)
+    app.router.add_get("/live/{stream_id:\\d+}.ts", segment)
+    return app
+
+
+def _serve(port, sources, profiles, segment_bytes, source_latency, ready, reuse_port):
+    async def main():
+        runner = web.AppRunner(create_app(sources, profiles, segment_bytes, source_latency),
+                               access_log=None, handle_signals=False)
+        await runner.setup()
+        await web.TCPSite(runner, "0.0.0.0", port, backlog=1024, reuse_port=reuse_port).start()
+        try:
+            await web.TCPSite(runner, "::1", port, backlog=1024, reuse_port=reuse_port).start()
+        except OSError:
+            pass  # 没有 IPv6 回环时，IPv6 地址的URL按失败处理
+        ready.release()
+        await asyncio.Event().wait()
+
+    asyncio.run(main())
+
+
+class StandInServer:
+    """
+    在子进程中运行替身服务，避免其 CPU 开销计入被测流水线
+    processes 大于 1 时多个进程以 SO_REUSEPORT 监听同一端口，测多进程测速的扩展性时替身服务不成为瓶颈
+    """
+
+    def __init__(self, port, sources, profiles, segment_bytes=128 * 1024, source_latency=0.05, processes=1):
+        self.port = port
+        self.ready = multiprocessing.Semaphore(0)
+        self.processes = [multiprocessing.Process(
+            target=_serve, args=(port, dict(sources), profiles, segment_bytes, source_latency, self.ready,
+                                 processes > 1), daemon=True) for _ in range(processes)]
+
+    def source_url(self, name):
+        return f"http://127.0.0.1:{self.port}/sources/{name}"
+
+    def __enter__(self):
+        for process in self.processes:
+            process.start()
+        deadline = time.monotonic() + 30
+        for _ in self.processes:
+            if not self.ready.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                self.__exit__()
+                raise RuntimeError("替身服务启动超时")
+        return self
+
+    def __exit__(self, *exc_info):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.join(5)
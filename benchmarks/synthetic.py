@@ -0,0 +1,124 @@
+"""
+合成直播源生成
+以 demo.txt 中的频道为基础，生成带名称噪声（分隔符、前导零、清晰度后缀、大小写、「」括号）、
+重复URL（含大小写、显示后缀、查询参数顺序不同的写法）、IPv6 方括号地址和无关频道的 M3U / TXT 直播源，以及每个主机的延迟、失败率、带宽配置。
+相同参数和随机种子总是生成完全相同的数据，便于与基线结果对比。
+"""
+import random
+import re
+from collections import OrderedDict
+
+DIGIT_PATTERN = re.compile(r'(\D+)(\d+)')
+FULLWIDTH_DIGITS = str.maketrans("0123456789", "０１２３４５６７８９")
+QUALITY_SUFFIXES = ["", " HD", "高清", "[1080P]", " 4K", "超清"]
+
+
+def noisy_name(name, rng):
+    """生成频道名称的一个常见变体"""
+    choice = rng.random()
+    if choice < 0.3:
+        variant = name
+    elif choice < 0.45:
+        variant = DIGIT_PATTERN.sub(lambda m: f"{m.group(1)}-{m.group(2)}", name, count=1)
+    elif choice < 0.55:
+        variant = DIGIT_PATTERN.sub(lambda m: f"{m.group(1)}0{m.group(2)}", name, count=1)
+    elif choice < 0.65:
+        variant = name.lower()
+    elif choice < 0.72:
+        variant = f"「{name}」"
+    elif choice < 0.78:
+        variant = name.translate(FULLWIDTH_DIGITS)
+    else:
+        variant = name.replace("CCTV", "CCTV ")
+    return variant + rng.choice(QUALITY_SUFFIXES)
+
+
+def spelling_variant(url, rng):
+    """同一地址的不同写法：大写协议、显示后缀、查询参数换序"""
+    choice = rng.random()
+    if choice < 0.5:
+        return url
+    base = url.split("$", 1)[0]
+    if choice < 0.65:
+        return base.replace("http://", "HTTP://", 1)
+    if choice < 0.8 and "?" in base:
+        path, query = base.split("?", 1)
+        return f"{path}?{'&'.join(reversed(query.split('&')))}"
+    return f"{base}$线路{rng.randint(1, 3)}"
+
+
+def host_profiles(host_count, port, latency_ms, failure_rate, bandwidth_kbps, hang_rate, dead_hosts, rng):
+    """
+    生成主机配置：主机地址 -> {latency, failure_rate, bandwidth, hang_rate, dead}
+    主机使用 127.0.0.2 起的回环地址，全部指向本地替身服务；dead 主机使用无人监听的端口
+    """
+    profiles = OrderedDict()
+    for index in range(host_count):
+        profiles[f"127.0.0.{index + 2}:{port}"] = {
+            "latency": latency_ms * rng.uniform(0.5, 3.0) / 1000,
+            "failure_rate": min(failure_rate * rng.uniform(0.0, 2.0), 1.0),
+            "bandwidth": bandwidth_kbps * rng.uniform(0.3, 2.0) * 1024 / 8,
+            "hang_rate": hang_rate,
+            "dead": index < dead_hosts,
+        }
+    profiles[f"[::1]:{port}"] = {
+        "latency": latency_ms / 1000, "failure_rate": failure_rate,
+        "bandwidth": bandwidth_kbps * 1024 / 8, "hang_rate": hang_rate, "dead": False,
+    }
+    return profiles
+
+
+def build_sources(template_channels, source_count, channels_per_source, profiles, dead_port,
+                  duplicate_rate=0.15, ipv6_rate=0.1, distractor_rate=0.3, seed=1):
+    """
+    生成 source_count 个直播源，返回 [(文件名, 内容字节串)]
+    偶数序号为 M3U，奇数序号为 TXT（#genre# 分组）
+    """
+    rng = random.Random(seed)
+    template = [(category, name) for category, names in template_channels.items() for name in names]
+    hosts = [host for host, profile in profiles.items() if not host.startswith("[")]
+    ipv6_host = next(host for host in profiles if host.startswith("["))
+    issued_urls = []
+    stream_id = 0
+    sources = []
+
+    for source_index in range(source_count):
+        channels = OrderedDict()
+        for _ in range(channels_per_source):
+            if rng.random() < distractor_rate:
+                category, name = f"其他{rng.randint(1, 8)}", f"地方台{rng.randint(1, 5000)}"
+            else:
+                category, name = rng.choice(template)
+                name = noisy_name(name, rng)
+
+            if issued_urls and rng.random() < duplicate_rate:
+                url = spelling_variant(rng.choice(issued_urls), rng)
+            else:
+                stream_id += 1
+                host = ipv6_host if rng.random() < ipv6_rate else rng.choice(hosts)
+                if profiles[host]["dead"]:
+                    host = f"{host.rsplit(':', 1)[0]}:{dead_port}"
+                extension = "ts" if stream_id % 5 == 0 else "m3u8"
+                url = f"http://{host}/live/{stream_id}.{extension}"
+                if stream_id % 3 == 0:
+                    url += f"?ch={stream_id}&token=t{stream_id % 97}"
+                if rng.random() < 0.1:
+                    url += f"$线路{rng.randint(1, 3)}"
+                issued_urls.append(url)
+            channels.setdefault(category, []).append((name, url))
+
+        if source_index % 2 == 0:
+            lines = ["#EXTM3U"]
+            for category, entries in channels.items():
+                for name, url in entries:
+                    lines.append(f'#EXTINF:-1 tvg-name="{name}" group-title="{category}",{name}')
+                    lines.append(url)
+            filename = f"source{source_index}.m3u"
+        else:
+            lines = []
+            for category, entries in channels.items():
+                lines.append(f"{category},#genre#")
+                lines.extend(f"{name},{url}" for name, url in entries)
+            filename = f"source{source_index}.txt"
+        sources.append((filename, ("\n".join(lines) + "\n").encode("utf-8")))
+    return sources
@@ -95,8 +95,178 @@ epg_urls = [
     "https://epg.pw/xmltv/epg_HK.xml",
     "https://epg.pw/xmltv/epg_TW.xml"
 ]
+
+# 频道别名数据（epgid 与别名列表），用于名称归一和 tvg-id
+ALIAS_DATA_PATH = "pic/logos/epg_data.json"
+
+# 别名索引缓存文件
+ALIAS_INDEX_CACHE = "output/cache/alias_index.pickle"
+
+# 台标目录，靠前目录中的同名台标优先
+LOGO_DIRS = ["pic/logos", "pic/logo"]
+
+# 台标索引缓存文件
+LOGO_INDEX_CACHE = "output/cache/logo_index.json"
+
+# 仓库文件的访问地址前缀，用于拼接台标URL
+LOGO_BASE_URL = "https://raw.githubusercontent.com/vickdong1/iptv_api/refs/heads/main"
+
+# 是否生成统一尺寸的压缩台标（需要安装 Pillow）
+LOGO_OPTIMIZE_ENABLED = False
+
+# 压缩台标输出目录及最长边像素
+LOGO_OPTIMIZED_DIR = "output/logos"
+LOGO_MAX_SIZE = 256
+
+# 是否合并 epg_urls 为一个只包含播放列表频道的节目单，启用且已生成合并文件后M3U头部只引用合并后的文件
+EPG_MERGE_ENABLED = True
+
+# 合并后节目单的输出路径
+EPG_OUTPUT_PATH = "output/epg.xml.gz"
+
+# 合并后节目单的访问地址，写入M3U的 x-tvg-url
+EPG_OUTPUT_URL = "https://raw.githubusercontent.com/vickdong1/iptv_api/refs/heads/main/output/epg.xml.gz"
+
+# 节目单保留的时间窗口：当前时间之前/之后的小时数
+EPG_PAST_HOURS = 6
+EPG_FUTURE_HOURS = 48
+
+# 下载单个节目单源的超时时间（秒）
+EPG_FETCH_TIMEOUT = 60
+
 # 测速超时时间（秒）
 TEST_TIMEOUT = 10
 
-# 测速线程池最大工作线程数
-MAX_WORKERS = 20
+# 测速全局最大并发数（同时受每主机并发数限制）
+MAX_WORKERS = 200
+
+# 测速时同一主机的最大并发数
+SPEED_TEST_PER_HOST_LIMIT = 4
+
+# 是否在写入播放列表前测速，按延迟排序并剔除失效线路
+# 默认关闭：GitHub Actions 运行器在境外，测速会把仅限境内访问的线路误判为失效并剔除；在境内机器上运行时可开启
+SPEED_TEST_ENABLED = False
+
+# 测速模式：hls 解析m3u8并下载分片测吞吐量和分辨率，latency 仅测响应头延迟
+PROBE_MODE = "hls"
+
+# 测速进程数：1 为单进程，大于 1 时按主机把URL分给多个进程测速，0 表示使用 CPU 核数
+PROBE_PROCESSES = 1
+
+# 测速进程超过该时间（秒）没有返回任何结果时视为挂起，强制结束后剩余URL重新测速
+PROBE_STALL_TIMEOUT = 120
+
+# 单个URL测速的最大尝试次数
+SPEED_TEST_RETRY_TIMES = 2
+
+# 每个频道保留的最大线路数，0 表示不限制
+MAX_URLS_PER_CHANNEL = 10
+
+# 是否缓存跳转接口（如 .php?id=）的重定向链，测速时直接请求最终地址，最终地址相同的线路只测一次
+REDIRECT_CACHE_ENABLED = True
+REDIRECT_CACHE_PATH = "output/redirect_cache.json"
+
+# 重定向缓存的有效期（秒），需长于定时任务的间隔（每2天一次）才能在下次运行时命中；
+# 最终地址的鉴权参数过期时测速失败，会自动改测原地址并更新缓存
+REDIRECT_CACHE_TTL = 3 * 24 * 3600
+
+# 是否记录URL健康度历史，用于跳过近期健康的URL并对失败URL退避
+HEALTH_DB_ENABLED = True
+
+# URL健康度数据库路径
+HEALTH_DB_PATH = "output/url_health.db"
+
+# 健康URL的复测间隔（秒）
+HEALTH_RECHECK_INTERVAL = 24 * 3600
+
+# 失败URL的初始退避时间（秒），连续失败时按2的幂次增长
+HEALTH_BACKOFF_BASE = 6 * 3600
+
+# 失败URL的最长退避时间（秒）
+HEALTH_BACKOFF_MAX = 14 * 24 * 3600
+
+# 抓取直播源的线程数
+FETCH_MAX_WORKERS = 16
+
+# 同一主机同时抓取的最大连接数
+FETCH_MAX_PER_HOST = 2
+
+# 单个直播源的连接/读取超时时间（秒）
+FETCH_TIMEOUT = 15
+
+# 流式下载直播源时每次读取的字节数
+FETCH_CHUNK_SIZE = 64 * 1024
+
+# 抓取全部直播源的总时间预算（秒），超时未完成的源将被跳过（有快照时使用快照）
+# 预算只决定流程何时继续：已在下载的线程无法中断，会在后台运行到 FETCH_TIMEOUT 等自身超时为止，
+# 进程退出时仍会等待这些线程结束，因此进程的总运行时间可能超过该预算
+FETCH_TOTAL_BUDGET = 120
+
+# 是否启用直播源缓存（条件请求 + 本地快照）
+# 缓存保存在 output/source_cache/（不提交到仓库），GitHub Actions 中由工作流的缓存步骤在两次运行之间保留
+SOURCE_CACHE_ENABLED = True
+
+# 直播源缓存目录
+SOURCE_CACHE_DIR = "output/source_cache"
+
+# 源不可用时允许回退到快照的最长时间（秒）
+SOURCE_CACHE_MAX_AGE = 3 * 24 * 3600
+
+# 内置服务（python main.py serve）监听地址和端口
+SERVE_HOST = "0.0.0.0"
+SERVE_PORT = 8080
+
+# 内置服务检查输出文件更新的间隔（秒）
+SERVE_RELOAD_INTERVAL = 5
+
+# 运行报告（各阶段耗时、各直播源统计、测速延迟分布）输出路径
+METRICS_REPORT_PATH = "output/run_report.json"
+
+# 是否同时写出 Prometheus 文本格式的指标文件
+METRICS_PROMETHEUS_ENABLED = False
+METRICS_PROMETHEUS_PATH = "output/metrics.prom"
+
+# 常驻模式（python main.py daemon）下每个直播源的默认刷新间隔（秒）
+DAEMON_SOURCE_INTERVAL = 30 * 60
+
+# 单个直播源的刷新间隔（秒），覆盖默认值，如 {"https://example.com/live.m3u": 10 * 60}
+DAEMON_SOURCE_INTERVALS = {}
+
+# 刷新间隔的随机抖动比例，避免各直播源总在同一时刻抓取
+DAEMON_JITTER = 0.1
+
+# 常驻模式检查到期直播源和 demo.txt / config.py 修改的间隔（秒）
+DAEMON_TICK = 5
+
+# 常驻模式对全部频道重新测速的间隔（秒），直播源未变化时失效线路也能及时剔除
+DAEMON_PROBE_INTERVAL = 6 * 3600
+
+# 常驻模式重新合并节目单的间隔（秒）
+DAEMON_EPG_INTERVAL = 6 * 3600
+
+# 各阶段结果（fetch / match / probe）的检查点目录，可用 python main.py write 等子命令单独重跑某个阶段
+CHECKPOINT_DIR = "output/checkpoints"
+
+# 完整运行时是否同时保存各阶段检查点
+CHECKPOINT_ENABLED = True
+
+# 是否在每次写出播放列表时生成相对上一代的变更记录（output/changes）
+CHANGE_FEED_ENABLED = True
+CHANGE_FEED_DIR = "output/changes"
+
+# 保留的历史增量代数，落后更多代的客户端需重新下载完整播放列表
+CHANGE_FEED_HISTORY = 50
+
+# 是否跨运行统计每个直播源的产出（匹配线路、独有线路、测速成功率等），并自动降级低产出的直播源
+SOURCE_YIELD_ENABLED = True
+SOURCE_YIELD_PATH = "output/source_yield.json"
+
+# 参与判断的最近运行次数，以及开始判断所需的最少次数
+SOURCE_YIELD_WINDOW = 5
+SOURCE_YIELD_MIN_RUNS = 3
+
+# 平均独有可用线路数（其他直播源没有、且测速可用的线路）低于该值的直播源被降级
+SOURCE_YIELD_MIN_UNIQUE = 1
+
+# 降级的直播源每隔多久（秒）重新抓取一次，产出恢复后重新启用
+SOURCE_YIELD_RETRY_INTERVAL = 7 * 24 * 3600
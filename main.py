@@ -1,21 +1,34 @@
-import re
-import requests
+import sys
 import logging
+import threading
+import time
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from itertools import chain, islice
+from urllib.parse import urlsplit
 import config
 import os
-import difflib
-
-# 确保 output 文件夹存在
+from utils.alias_index import AliasIndex
+from utils.change_feed import ChangeFeed
+from utils.checkpoint import CheckpointError, checkpoint_time, load_checkpoint, save_checkpoint
+from utils.logo_index import LogoIndex, logo_url
+from utils.metrics import metrics
+from utils.output_writer import PlaylistBuffer, commit_outputs
+from utils.records import group_records, iter_chunk_lines, iter_m3u_records, iter_txt_records
+from utils.source_cache import SourceCache
+from utils.source_yield import SourceYield, attribute_sources
+from utils.urls import UrlClassifier
+
+# requests、aiohttp、difflib 等较重的模块只在用到它们的阶段内导入，导入本模块不创建任何文件
 output_folder = "output"
-if not os.path.exists(output_folder):
-    os.makedirs(output_folder)
-
-# 日志记录，将日志文件保存到 output 文件夹下
 log_file_path = os.path.join(output_folder, "function.log")
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
-                    handlers=[logging.FileHandler(log_file_path, "w", encoding="utf-8"), logging.StreamHandler()])
+
+def setup_output():
+    # 确保 output 文件夹存在，日志同时写入 output/function.log 和控制台。
+    os.makedirs(output_folder, exist_ok=True)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s',
+                        handlers=[logging.FileHandler(log_file_path, "w", encoding="utf-8"), logging.StreamHandler()])
 
 def parse_template(template_file):
     # 解析模板文件，提取频道分类和频道名称。
@@ -37,134 +50,272 @@ def parse_template(template_file):
 
     return template_channels
 
-# 数据清洗函数
-def clean_channel_name(channel_name):
-    cleaned_name = re.sub(r'[$「」-]', '', channel_name)  # 去掉中括号、«», 和'-'字符
-    cleaned_name = re.sub(r'\s+', '', cleaned_name)  # 去掉所有空白字符
-    cleaned_name = re.sub(r'(\D*)(\d+)', lambda m: m.group(1) + str(int(m.group(2))), cleaned_name)  # 将数字前面的部分保留，数字转换为整数
-    return cleaned_name.upper()  # 转换为大写
+def create_session():
+    # 创建共享连接池的会话，所有直播源复用同一组连接。
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=config.FETCH_MAX_WORKERS, pool_maxsize=config.FETCH_MAX_PER_HOST)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def fetch_channels(url, session=None, cache=None):
+    # 从指定URL流式抓取频道列表，边下载边解析，内存占用不随源大小增长。
+    # 传入缓存时发送条件请求，源未变化或不可用时复用上次的解析结果。
+    import requests
 
-def fetch_channels(url):
-    # 从指定URL抓取频道列表。
     channels = OrderedDict()
+    headers = cache.conditional_headers(url) if cache else {}
 
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        response.encoding = 'utf-8'
-        lines = response.text.split("\n")
-        current_category = None
-        is_m3u = any(line.startswith("#EXTINF") for line in lines[:15])
-        source_type = "m3u" if is_m3u else "txt"
-        logging.info(f"url: {url} 成功，判断为{source_type}格式")
-
-        if is_m3u:
-            channels.update(parse_m3u_lines(lines))
-        else:
-            channels.update(parse_txt_lines(lines))
-
-        if channels:
-            categories = ", ".join(channels.keys())
-            logging.info(f"url: {url} 成功，包含频道分类: {categories}")
+        with (session or requests).get(url, headers=headers, timeout=config.FETCH_TIMEOUT, stream=True) as response:
+            if cache and response.status_code == 304:
+                cached_channels = cache.load_channels(url)
+                if cached_channels is not None:
+                    cache.touch(url, response.headers)
+                    metrics.source(url, status="not_modified")
+                    logging.info(f"url: {url} 未变化(304)，使用缓存")
+                    return cached_channels
+                if headers:
+                    # 304 没有正文，缓存的解析结果又读取失败：删除缓存记录，不带条件请求头重新抓取
+                    logging.warning(f"url: {url} 未变化(304)，但缓存的解析结果无法读取，重新完整抓取")
+                    cache.invalidate(url)
+                    return fetch_channels(url, session, cache)
+            response.raise_for_status()
+            chunks = metrics.count_bytes(url, response.iter_content(chunk_size=config.FETCH_CHUNK_SIZE))
+            metrics.source(url, status="ok")
+            if not cache:
+                return parse_source_lines(url, iter_chunk_lines(chunks))
+
+            # 正文写入临时快照并计算哈希，内容未变化时跳过解析
+            temp_path, sha256, _ = cache.download(url, chunks)
+        if cache.is_unchanged(url, sha256):
+            cached_channels = cache.load_channels(url)
+            if cached_channels is not None:
+                cache.discard(temp_path)
+                cache.touch(url, response.headers)
+                metrics.source(url, status="unchanged")
+                logging.info(f"url: {url} 内容未变化，使用缓存")
+                return cached_channels
+        channels = parse_source_lines(url, iter_chunk_lines(cache.snapshot_chunks(temp_path)))
+        cache.store(url, response.headers, sha256, temp_path, channels)
     except requests.RequestException as e:
         logging.error(f"url: {url} 失败❌, Error: {e}")
+        metrics.source(url, status="failed", error=str(e))
+        if cache:
+            cached_channels = cache.fallback(url)
+            if cached_channels is not None:
+                metrics.source(url, status="fallback")
+                logging.warning(f"url: {url} 使用最近一次成功的快照")
+                return cached_channels
 
     return channels
 
-def parse_m3u_lines(lines):
-    # 解析M3U格式的频道列表行。
-    channels = OrderedDict()
-    current_category = None
+def parse_source_lines(url, lines):
+    # 根据开头若干行判断格式，已读取的行随后交给对应解析器继续使用。
+    lines = metrics.count_lines(url, lines)
+    head_lines = list(islice(lines, 15))
+    is_m3u = any(line.startswith("#EXTINF") for line in head_lines)
+    source_type = "m3u" if is_m3u else "txt"
+    logging.info(f"url: {url} 成功，判断为{source_type}格式")
 
-    for line in lines:
-        line = line.strip()
-        if line.startswith("#EXTINF"):
-            match = re.search(r'group-title="(.*?)",(.*)', line)
-            if match:
-                current_category = match.group(1).strip()
-                channel_name = match.group(2).strip()
-                if channel_name and channel_name.startswith("CCTV"):  # 判断频道名称是否存在且以CCTV开头
-                    channel_name = clean_channel_name(channel_name)  # 频道名称数据清洗
-
-                if current_category not in channels:
-                    channels[current_category] = []
-        elif line and not line.startswith("#"):
-            channel_url = line.strip()
-            if current_category and channel_name:
-                # 添加频道信息到当前类别中
-                channels[current_category].append((channel_name, channel_url))
+    iter_records = iter_m3u_records if is_m3u else iter_txt_records
+    channels = group_records(iter_records(chain(head_lines, lines)))
 
+    if channels:
+        categories = ", ".join(channels.keys())
+        logging.info(f"url: {url} 成功，包含频道分类: {categories}")
     return channels
 
+def parse_m3u_lines(lines):
+    # 解析M3U格式的频道列表行。
+    return group_records(iter_m3u_records(lines))
+
 def parse_txt_lines(lines):
     # 解析TXT格式的频道列表行。
-    channels = OrderedDict()
-    current_category = None
-
-    for line in lines:
-        line = line.strip()
-        if "#genre#" in line:
-            # 提取当前类别
-            current_category = line.split(",")[0].strip()
-            channels[current_category] = []
-        elif current_category:
-            match = re.match(r"^(.*?),(.*?)$", line)
-            if match:
-                channel_name = match.group(1).strip()
-                if channel_name and channel_name.startswith("CCTV"):  # 判断频道名称是否存在且以CCTV开头
-                    channel_name = clean_channel_name(channel_name)  # 频道名称数据清洗
-                # 提取频道URL，并分割成多个部分
-                channel_urls = match.group(2).strip().split('#')
-
-                # 存储每个分割出的URL
-                for channel_url in channel_urls:
-                    channel_url = channel_url.strip()  # 去掉前后空白
-                    channels[current_category].append((channel_name, channel_url))
-            elif line:
-                channels[current_category].append((line, ''))
-
-    return channels
+    return group_records(iter_txt_records(lines))
 
 def find_similar_name(target_name, name_list):
     # 查找最相似的名称
+    import difflib
+
     matches = difflib.get_close_matches(target_name, name_list, n=1, cutoff=0.6)
     return matches[0] if matches else None
 
+_alias_index = None
+_alias_index_mtime = None
+
+def get_alias_index():
+    # 加载频道别名索引，源文件未修改时复用已加载的索引。
+    global _alias_index, _alias_index_mtime
+    mtime = os.path.getmtime(config.ALIAS_DATA_PATH)
+    if _alias_index is None or mtime != _alias_index_mtime:
+        _alias_index = AliasIndex.load(config.ALIAS_DATA_PATH, config.ALIAS_INDEX_CACHE)
+        _alias_index_mtime = mtime
+    return _alias_index
+
+_source_yield = None
+
+def get_source_yield():
+    # 加载直播源产出记录，一次运行内共用同一份。
+    global _source_yield
+    if _source_yield is None:
+        _source_yield = SourceYield(config.SOURCE_YIELD_PATH, window=config.SOURCE_YIELD_WINDOW,
+                                    min_runs=config.SOURCE_YIELD_MIN_RUNS, min_yield=config.SOURCE_YIELD_MIN_UNIQUE,
+                                    retry_interval=config.SOURCE_YIELD_RETRY_INTERVAL)
+    return _source_yield
+
+def update_source_yield(matched_channels, classifier):
+    # 按去重键统计每个直播源对匹配结果的贡献，与抓取指标一起记入产出记录。
+    # 共有线路按配置顺序归属于第一个提供者，抓取完成的先后顺序不影响结果
+    url_sets = metrics.source_url_sets()
+    ordered_sets = OrderedDict((url, url_sets[url]) for url in config.source_urls if url in url_sets)
+    stats = attribute_sources(ordered_sets, matched_channels, classifier.classify, metrics.probe_outcomes)
+    source_yield = get_source_yield()
+    source_yield.record(config.source_urls, metrics.sources, stats)
+    source_yield.save()
+
+_logo_index = None
+
+def get_logo_index():
+    # 加载台标索引，一次运行内只扫描一次台标目录。
+    global _logo_index
+    if _logo_index is None:
+        _logo_index = LogoIndex.load(config.LOGO_DIRS, config.LOGO_INDEX_CACHE)
+    return _logo_index
+
 def match_channels(template_channels, all_channels):
-    # 匹配模板中的频道与抓取到的频道。
-    matched_channels = OrderedDict()
+    # 匹配模板中的频道与抓取到的频道，能通过别名解析的名称直接按规范ID匹配。
+    from utils.matcher import ChannelMatcher
 
-    all_online_channel_names = []
-    for online_category, online_channel_list in all_channels.items():
-        for online_channel_name, _ in online_channel_list:
-            all_online_channel_names.append(online_channel_name)
+    matched_channels = OrderedDict()
+    matcher = ChannelMatcher(all_channels, cutoff=0.6, alias_index=get_alias_index())
 
     for category, channel_list in template_channels.items():
         matched_channels[category] = OrderedDict()
         for channel_name in channel_list:
-            similar_name = find_similar_name(channel_name, all_online_channel_names)
-            if similar_name:
-                for online_category, online_channel_list in all_channels.items():
-                    for online_channel_name, online_channel_url in online_channel_list:
-                        if online_channel_name == similar_name:
-                            # 匹配成功的频道信息加入结果中
-                            matched_channels[category].setdefault(channel_name, []).append(online_channel_url)
+            urls = matcher.match_urls(channel_name)
+            if urls:
+                # 匹配成功的频道信息加入结果中
+                matched_channels[category].setdefault(channel_name, []).extend(urls)
+                metrics.count("channels_matched")
+                metrics.count("urls_matched", len(urls))
+            else:
+                metrics.count("channels_unmatched")
 
     return matched_channels
 
-def filter_source_urls(template_file):
+def fetch_all_sources(source_urls):
+    # 并发抓取所有直播源，同一主机限制并发连接数，整体受总耗时预算约束。
+    # 返回结果与 source_urls 一一对应，保证合并顺序与配置顺序一致。
+    results = [OrderedDict() for _ in source_urls]
+    host_semaphores = {}
+    lock = threading.Lock()
+
+    cache = SourceCache(config.SOURCE_CACHE_DIR, config.SOURCE_CACHE_MAX_AGE) if config.SOURCE_CACHE_ENABLED else None
+
+    def worker(url):
+        host = urlsplit(url).netloc.lower()
+        with lock:
+            semaphore = host_semaphores.setdefault(host, threading.BoundedSemaphore(config.FETCH_MAX_PER_HOST))
+        with semaphore:
+            start_time = time.perf_counter()
+            channels = fetch_channels(url, session, cache)
+            metrics.source(url, elapsed_seconds=round(time.perf_counter() - start_time, 3))
+            return channels
+
+    def fallback(url):
+        cached_channels = cache.fallback(url) if cache else None
+        if cached_channels is None:
+            return OrderedDict()
+        metrics.source(url, status="fallback")
+        logging.warning(f"url: {url} 使用最近一次成功的快照")
+        return cached_channels
+
+    for url in source_urls:
+        metrics.source(url)  # 报告中的直播源按配置顺序排列
+    session = create_session()
+    executor = ThreadPoolExecutor(max_workers=config.FETCH_MAX_WORKERS)
+    try:
+        futures = {executor.submit(worker, url): index for index, url in enumerate(source_urls)}
+        done, not_done = wait(futures, timeout=config.FETCH_TOTAL_BUDGET)
+        for future in done:
+            index = futures[future]
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                # 解析出错、缓存读写失败等只影响这一个源，不中断整个流程
+                url = source_urls[index]
+                logging.exception(f"url: {url} 失败❌, Error: {e!r}")
+                metrics.source(url, status="failed", error=str(e) or type(e).__name__)
+                results[index] = fallback(url)
+        for future in not_done:
+            future.cancel()
+            url = source_urls[futures[future]]
+            logging.error(f"url: {url} 失败❌, Error: 超出总抓取时间预算 {config.FETCH_TOTAL_BUDGET}s")
+            metrics.source(url, status="timeout")
+            results[futures[future]] = fallback(url)
+    finally:
+        # 超出预算的抓取不再等待，直接放弃其结果；已在运行的线程无法中断，会继续到自身的请求超时为止
+        executor.shutdown(wait=False, cancel_futures=True)
+        session.close()
+        if cache:
+            cache.save()
+
+    for url, channels in zip(source_urls, results):
+        metrics.source_channels(url, channels)
+    return results
+
+def filter_source_urls(template_file, checkpoint=False):
     # 过滤源URL，获取匹配后的频道信息。
+    fetched = fetch_stage(checkpoint)
+    return match_stage(template_file, fetched, checkpoint)
+
+def fetch_stage(checkpoint=True):
+    # 抓取阶段：按配置顺序抓取直播源（跳过低产出的直播源），结果保存为 fetch 检查点。
+    source_urls, skipped = config.source_urls, []
+    if config.SOURCE_YIELD_ENABLED:
+        source_urls, skipped = get_source_yield().plan(source_urls)
+    with metrics.stage("fetch"):
+        fetched = fetch_all_sources(source_urls)
+    for url in skipped:
+        metrics.source(url, status="skipped_low_yield")
+    if checkpoint:
+        save_checkpoint(config.CHECKPOINT_DIR, "fetch", fetched)
+    return fetched
+
+def match_stage(template_file, fetched, checkpoint=True):
+    # 匹配阶段：按配置顺序合并各直播源后与模板匹配，结果连同模板保存为 match 检查点。
     template_channels = parse_template(template_file)
-    source_urls = config.source_urls
-
     all_channels = OrderedDict()
-    for url in source_urls:
-        fetched_channels = fetch_channels(url)
-        merge_channels(all_channels, fetched_channels)
+    with metrics.stage("match"):
+        for fetched_channels in fetched:
+            merge_channels(all_channels, fetched_channels)
+        matched_channels = match_channels(template_channels, all_channels)
+    if checkpoint:
+        save_checkpoint(config.CHECKPOINT_DIR, "match",
+                        {"template_channels": template_channels, "channels": matched_channels})
+    return matched_channels, template_channels
 
-    matched_channels = match_channels(template_channels, all_channels)
+def probe_stage(channels, template_channels, classifier, checkpoint=True):
+    # 测速阶段：剔除失效线路并排序，结果连同模板保存为 probe 检查点。
+    with metrics.stage("probe"):
+        channels = probe_channels(channels, classifier)
+    if checkpoint:
+        save_checkpoint(config.CHECKPOINT_DIR, "probe", {"template_channels": template_channels, "channels": channels})
+    return channels
 
-    return matched_channels, template_channels
+def load_channels_checkpoint(stage=None):
+    # 读取 match 或 probe 阶段的检查点，未指定时取较新的一个。
+    if stage is None:
+        times = {name: checkpoint_time(config.CHECKPOINT_DIR, name) for name in ("probe", "match")}
+        existing = [name for name, mtime in times.items() if mtime is not None]
+        stage = max(existing, key=times.get) if existing else "match"
+    data, created_at = load_checkpoint(config.CHECKPOINT_DIR, stage)
+    logging.info(f"使用 {stage} 阶段的检查点，生成于 {datetime.fromtimestamp(created_at):%Y-%m-%d %H:%M:%S}")
+    return data["channels"], data["template_channels"]
 
 def merge_channels(target, source):
     # 合并两个频道字典。
@@ -174,92 +325,224 @@ def merge_channels(target, source):
         else:
             target[category] = channel_list
 
-def is_ipv6(url):
-    # 判断URL是否为IPv6地址。
-    return re.match(r'^http:\/\/\[[0-9a-fA-F:]+\]', url) is not None
+def probe_channels(channels, classifier):
+    # 对匹配结果中的每个URL测速一次，按综合评分排序并剔除失效线路，限制每个频道的线路数。
+    import asyncio
+    from utils.speed_test import SpeedTester, rank_key  # 延迟导入，只有测速阶段需要 aiohttp
+
+    # 测速按规范化去重键进行，空URL和黑名单中的URL不测
+    unique_urls = OrderedDict()
+    for channel_map in channels.values():
+        for urls in channel_map.values():
+            for url in urls:
+                url_info = classifier.classify(url)
+                if url_info:
+                    unique_urls.setdefault(url_info[0], None)
+
+    urls_to_probe = list(unique_urls)
+    health_db = None
+    if config.HEALTH_DB_ENABLED:
+        from utils.health_db import HealthDB
+        health_db = HealthDB(config.HEALTH_DB_PATH, config.HEALTH_RECHECK_INTERVAL,
+                             config.HEALTH_BACKOFF_BASE, config.HEALTH_BACKOFF_MAX)
+        urls_to_probe, skipped_urls = health_db.plan(urls_to_probe)
+        logging.info(f"健康度记录: 跳过近期已测的 {len(skipped_urls)} 个URL")
+
+    # 每组规范化相同的URL只请求其代表写法，结果再按去重键归档
+    probe_targets = {classifier.representative(key): key for key in urls_to_probe}
+
+    redirect_cache = None
+    if config.REDIRECT_CACHE_ENABLED:
+        from utils.redirects import RedirectCache
+        redirect_cache = RedirectCache(config.REDIRECT_CACHE_PATH, config.REDIRECT_CACHE_TTL)
+
+    tester_options = dict(timeout=config.TEST_TIMEOUT, concurrent_limit=config.MAX_WORKERS,
+                          retry_times=config.SPEED_TEST_RETRY_TIMES, probe_mode=config.PROBE_MODE,
+                          per_host_limit=config.SPEED_TEST_PER_HOST_LIMIT)
+    processes = config.PROBE_PROCESSES or os.cpu_count() or 1
+
+    async def run_speed_test():
+        if processes > 1:
+            # 按主机分片，由多个进程各自的事件循环测速
+            from utils.probe_pool import ShardedSpeedTester
+            tester = ShardedSpeedTester(processes, config.PROBE_STALL_TIMEOUT, **tester_options)
+        else:
+            tester = SpeedTester(**tester_options)
+        async with tester:
+            if redirect_cache:
+                # 缓存命中的跳转接口直接测最终地址，最终地址相同的只测一次
+                return await redirect_cache.probe(tester, probe_targets)
+            return await tester.batch_speed_test(list(probe_targets))
+
+    logging.info(f"开始测速，共 {len(urls_to_probe)} 个URL")
+    results = {}
+    for result in asyncio.run(run_speed_test()):
+        result.url = probe_targets[result.url]
+        results[result.url] = result
+    if redirect_cache:
+        redirect_cache.save()
+    metrics.count("urls_probed", len(results))
+    metrics.count("urls_probe_skipped", len(unique_urls) - len(results))
+    for result in results.values():
+        if result.success:
+            metrics.count("urls_probe_success")
+            if result.latency is not None:
+                metrics.observe("probe_latency_ms", result.latency)
+            if result.codec:
+                metrics.count("urls_sniffed")
+        else:
+            metrics.count("urls_probe_failed")
+    if health_db:
+        # 结合历史记录排序：本次测过的URL已写入数据库，跳过的URL沿用历史结果
+        health_db.record(results.values())
+        results = health_db.results(unique_urls)
+        health_db.close()
+
+    probed_channels = OrderedDict()
+    for category, channel_map in channels.items():
+        probed_channels[category] = OrderedDict()
+        for channel_name, urls in channel_map.items():
+            alive_urls = OrderedDict()
+            for url in urls:
+                url_info = classifier.classify(url)
+                if url_info and url_info[0] not in alive_urls and results[url_info[0]].success:
+                    alive_urls[url_info[0]] = url
+            alive_urls = sorted(alive_urls.values(), key=lambda url: rank_key(results[classifier.classify(url)[0]]))
+            if config.MAX_URLS_PER_CHANNEL:
+                alive_urls = alive_urls[:config.MAX_URLS_PER_CHANNEL]
+            if alive_urls:
+                probed_channels[category][channel_name] = alive_urls
+
+    metrics.record_probes((key, result.success) for key, result in results.items())
+    success_count = sum(1 for result in results.values() if result.success)
+    logging.info(f"测速完成: 可用 {success_count}/{len(results)}")
+    return probed_channels
+
+def bucket_channel_urls(channels, template_channels, classifier, written_keys):
+    # 按模板顺序单次遍历匹配结果：过滤黑名单、按IPv4/IPv6分桶，并以去重键全局去重。
+    bucketed = OrderedDict()
+    for category, channel_list in template_channels.items():
+        bucketed[category] = OrderedDict()
+        category_channels = channels.get(category)
+        if not category_channels:
+            continue
+        for channel_name in channel_list:
+            if channel_name not in category_channels:
+                continue
+            urls_by_version = {"IPV4": [], "IPV6": []}
+            for url in category_channels[channel_name]:
+                url_info = classifier.classify(url)
+                if url_info and url_info[0] not in written_keys:
+                    written_keys.add(url_info[0])
+                    urls_by_version[url_info[1]].append(url)
+                else:
+                    # 黑名单、无法识别或重复的线路
+                    metrics.count("urls_dropped")
+            bucketed[category][channel_name] = urls_by_version
+    return bucketed
 
-def updateChannelUrlsM3U(channels, template_channels):
+def updateChannelUrlsM3U(channels, template_channels, classifier=None):
     # 更新频道URL到M3U和TXT文件中。
-    written_urls_ipv4 = set()
-    written_urls_ipv6 = set()
+    classifier = classifier or UrlClassifier(config.url_blacklist)
+    alias_index = get_alias_index()
+    logo_index = get_logo_index()
+    optimized_logos = logo_index.optimize(config.LOGO_OPTIMIZED_DIR, config.LOGO_MAX_SIZE) if config.LOGO_OPTIMIZE_ENABLED else {}
+    written_keys = set()
+    written_urls = set()
 
     current_date = datetime.now().strftime("%Y-%m-%d")
+
+    # 在内存中构建四个输出文件，最后只写入内容有变化的文件
+    f_m3u_ipv4 = PlaylistBuffer(os.path.join(output_folder, "live_ipv4.m3u"))
+    f_txt_ipv4 = PlaylistBuffer(os.path.join(output_folder, "live_ipv4.txt"))
+    f_m3u_ipv6 = PlaylistBuffer(os.path.join(output_folder, "live_ipv6.m3u"))
+    f_txt_ipv6 = PlaylistBuffer(os.path.join(output_folder, "live_ipv6.txt"))
+    outputs = {"IPV4": (f_m3u_ipv4, f_txt_ipv4), "IPV6": (f_m3u_ipv6, f_txt_ipv6)}
+
+    header_urls = epg_header_urls()
+    f_m3u_ipv4.write(f"""#EXTM3U x-tvg-url={",".join(f'"{epg_url}"' for epg_url in header_urls)}\n""")
+    f_m3u_ipv6.write(f"""#EXTM3U x-tvg-url={",".join(f'"{epg_url}"' for epg_url in header_urls)}\n""")
+
     for group in config.announcements:
+        f_txt_ipv4.write(f"{group['channel']},#genre#\n")
+        f_txt_ipv6.write(f"{group['channel']},#genre#\n")
         for announcement in group['entries']:
-            if announcement['name'] is None:
-                announcement['name'] = current_date
-
-    ipv4_m3u_path = os.path.join(output_folder, "live_ipv4.m3u")
-    ipv4_txt_path = os.path.join(output_folder, "live_ipv4.txt")
-    ipv6_m3u_path = os.path.join(output_folder, "live_ipv6.m3u")
-    ipv6_txt_path = os.path.join(output_folder, "live_ipv6.txt")
-
-    with open(ipv4_m3u_path, "w", encoding="utf-8") as f_m3u_ipv4, \
-            open(ipv4_txt_path, "w", encoding="utf-8") as f_txt_ipv4, \
-            open(ipv6_m3u_path, "w", encoding="utf-8") as f_m3u_ipv6, \
-            open(ipv6_txt_path, "w", encoding="utf-8") as f_txt_ipv6:
-
-        f_m3u_ipv4.write(f"""#EXTM3U x-tvg-url={",".join(f'"{epg_url}"' for epg_url in config.epg_urls)}\n""")
-        f_m3u_ipv6.write(f"""#EXTM3U x-tvg-url={",".join(f'"{epg_url}"' for epg_url in config.epg_urls)}\n""")
-
-        for group in config.announcements:
-            f_txt_ipv4.write(f"{group['channel']},#genre#\n")
-            f_txt_ipv6.write(f"{group['channel']},#genre#\n")
-            for announcement in group['entries']:
-                url = announcement['url']
-                if is_ipv6(url):
-                    if url not in written_urls_ipv6:
-                        written_urls_ipv6.add(url)
-                        f_m3u_ipv6.write(f"""#EXTINF:-1 tvg-id="1" tvg-name="{announcement['name']}" tvg-logo="{announcement['logo']}" group-title="{group['channel']}",{announcement['name']}\n""")
-                        f_m3u_ipv6.write(f"{url}\n")
-                        f_txt_ipv6.write(f"{announcement['name']},{url}\n")
-                else:
-                    if url not in written_urls_ipv4:
-                        written_urls_ipv4.add(url)
-                        f_m3u_ipv4.write(f"""#EXTINF:-1 tvg-id="1" tvg-name="{announcement['name']}" tvg-logo="{announcement['logo']}" group-title="{group['channel']}",{announcement['name']}\n""")
-                        f_m3u_ipv4.write(f"{url}\n")
-                        f_txt_ipv4.write(f"{announcement['name']},{url}\n")
-
-        for category, channel_list in template_channels.items():
-            f_txt_ipv4.write(f"{category},#genre#\n")
-            f_txt_ipv6.write(f"{category},#genre#\n")
-            if category in channels:
-                for channel_name in channel_list:
-                    if channel_name in channels[category]:
-                        sorted_urls_ipv4 = []
-                        sorted_urls_ipv6 = []
-                        for url in channels[category][channel_name]:
-                            if is_ipv6(url):
-                                if url not in written_urls_ipv6:
-                                    sorted_urls_ipv6.append(url)
-                                    written_urls_ipv6.add(url)
-                            else:
-                                if url not in written_urls_ipv4:
-                                    sorted_urls_ipv4.append(url)
-                                    written_urls_ipv4.add(url)
-
-                        total_urls_ipv4 = len(sorted_urls_ipv4)
-                        total_urls_ipv6 = len(sorted_urls_ipv6)
-
-                        for index, url in enumerate(sorted_urls_ipv4, start=1):
-                            new_url = add_url_suffix(url, index, total_urls_ipv4, "IPV4")
-                            write_to_files(f_m3u_ipv4, f_txt_ipv4, category, channel_name, index, new_url)
-
-                        for index, url in enumerate(sorted_urls_ipv6, start=1):
-                            new_url = add_url_suffix(url, index, total_urls_ipv6, "IPV6")
-                            write_to_files(f_m3u_ipv6, f_txt_ipv6, category, channel_name, index, new_url)
-
-        f_txt_ipv4.write("\n")
-        f_txt_ipv6.write("\n")
-
-def sort_and_filter_urls(urls, written_urls):
-    # 排序和过滤URL。
-    filtered_urls = [
-        url for url in sorted(urls, key=lambda u: not is_ipv6(u) if config.ip_version_priority == "ipv6" else is_ipv6(u))
-        if url and url not in written_urls and not any(blacklist in url for blacklist in config.url_blacklist)
-    ]
-    written_urls.update(filtered_urls)
-    return filtered_urls
+            url = announcement['url']
+            # 未设置名称的公告使用当天日期，这一行不参与变化判断
+            name = announcement['name'] or current_date
+            volatile = announcement['name'] is None
+            url_info = classifier.classify(url)
+            if url_info and url_info[0] not in written_keys:
+                written_keys.add(url_info[0])
+                f_m3u, f_txt = outputs[url_info[1]]
+                f_m3u.write(f"""#EXTINF:-1 tvg-id="1" tvg-name="{name}" tvg-logo="{announcement['logo']}" group-title="{group['channel']}",{name}\n""", volatile)
+                f_m3u.write(f"{url}\n")
+                f_txt.write(f"{name},{url}\n", volatile)
+
+    # 变更记录使用的线路快照：播放列表 -> 分类 -> 频道 -> [不带显示后缀的URL]
+    playlists = {"IPV4": OrderedDict(), "IPV6": OrderedDict()}
+
+    bucketed = bucket_channel_urls(channels, template_channels, classifier, written_keys)
+    for category, channel_buckets in bucketed.items():
+        f_txt_ipv4.write(f"{category},#genre#\n")
+        f_txt_ipv6.write(f"{category},#genre#\n")
+        for channel_name, urls_by_version in channel_buckets.items():
+            # tvg-id 使用节目单中的规范ID，未收录的频道使用频道名称
+            tvg_id = alias_index.resolve(channel_name) or channel_name
+            # 只引用实际存在的台标，找不到时留空，避免客户端请求不存在的文件
+            logo_path = logo_index.find(channel_name, alias_index)
+            channel_logo = logo_url(config.LOGO_BASE_URL, optimized_logos.get(logo_path, logo_path)) if logo_path else ""
+            for ip_version, urls in urls_by_version.items():
+                f_m3u, f_txt = outputs[ip_version]
+                written_urls.update(urls)
+                if urls:
+                    playlists[ip_version].setdefault(category, OrderedDict())[channel_name] = [
+                        url.split('$', 1)[0] for url in urls]
+                for index, url in enumerate(urls, start=1):
+                    new_url = add_url_suffix(url, index, len(urls), ip_version)
+                    write_to_files(f_m3u, f_txt, category, channel_name, tvg_id, channel_logo, new_url)
+
+    f_txt_ipv4.write("\n")
+    f_txt_ipv6.write("\n")
+    metrics.count("urls_written", len(written_urls))
+    metrics.attribute_urls(written_urls)
+
+    changes = commit_outputs([f_m3u_ipv4, f_txt_ipv4, f_m3u_ipv6, f_txt_ipv6],
+                             os.path.join(output_folder, "manifest.json"))
+    for path, changed in changes.items():
+        logging.info(f"{path} {'已更新' if changed else '内容未变化，跳过写入'}")
+    if config.CHANGE_FEED_ENABLED:
+        ChangeFeed(config.CHANGE_FEED_DIR, config.CHANGE_FEED_HISTORY).publish(
+            {"live_ipv4": playlists["IPV4"], "live_ipv6": playlists["IPV6"]})
+    return changes
+
+def epg_header_urls():
+    # M3U 头部 x-tvg-url：合并后的节目单已生成时只引用它，未启用合并或尚未生成时引用原始节目单地址。
+    if config.EPG_MERGE_ENABLED and os.path.exists(config.EPG_OUTPUT_PATH):
+        return [config.EPG_OUTPUT_URL]
+    return config.epg_urls
+
+def playlist_channel_names(channels, template_channels):
+    # 返回实际写入播放列表的频道名称（按模板顺序去重）。
+    names = OrderedDict()
+    for category, channel_list in template_channels.items():
+        category_channels = channels.get(category, {})
+        for channel_name in channel_list:
+            if category_channels.get(channel_name):
+                names[channel_name] = None
+    return list(names)
+
+def update_epg(channels, template_channels):
+    # 合并 config.epg_urls 中的节目单，只保留播放列表中的频道。
+    from utils.epg import build_epg
+
+    alias_index = get_alias_index()
+    channel_names = playlist_channel_names(channels, template_channels)
+    # 节目单频道ID与播放列表的 tvg-id 保持一致
+    channel_ids = {name: alias_index.resolve(name) or name for name in channel_names}
+    build_epg(channel_names, config.epg_urls, config.EPG_OUTPUT_PATH,
+              past_hours=config.EPG_PAST_HOURS, future_hours=config.EPG_FUTURE_HOURS, timeout=config.EPG_FETCH_TIMEOUT,
+              channel_ids=channel_ids, alias_index=alias_index)
 
 def add_url_suffix(url, index, total_urls, ip_version):
     # 添加URL后缀。
@@ -267,14 +550,90 @@ def add_url_suffix(url, index, total_urls, ip_version):
     base_url = url.split('$', 1)[0] if '$' in url else url
     return f"{base_url}{suffix}"
 
-def write_to_files(f_m3u, f_txt, category, channel_name, index, new_url):
+def write_to_files(f_m3u, f_txt, category, channel_name, tvg_id, channel_logo, new_url):
     # 写入M3U和TXT文件。
-    logo_url = f"./pic/logos{channel_name}.png"
-    f_m3u.write(f"#EXTINF:-1 tvg-id=\"{index}\" tvg-name=\"{channel_name}\" tvg-logo=\"{logo_url}\" group-title=\"{category}\",{channel_name}\n")
+    f_m3u.write(f"#EXTINF:-1 tvg-id=\"{tvg_id}\" tvg-name=\"{channel_name}\" tvg-logo=\"{channel_logo}\" group-title=\"{category}\",{channel_name}\n")
     f_m3u.write(new_url + "\n")
     f_txt.write(f"{channel_name},{new_url}\n")
 
+def run(template_file="demo.txt"):
+    # 运行完整流程：抓取 -> 匹配 -> 测速 -> 节目单 -> 写出，各阶段结果同时保存为检查点。
+    checkpoint = config.CHECKPOINT_ENABLED
+    matched_channels, template_channels = filter_source_urls(template_file, checkpoint)
+    classifier = UrlClassifier(config.url_blacklist)
+    channels = matched_channels
+    if config.SPEED_TEST_ENABLED:
+        channels = probe_stage(channels, template_channels, classifier, checkpoint)
+    if config.EPG_MERGE_ENABLED:
+        # 节目单先于播放列表生成，写出播放列表时据此决定 x-tvg-url 引用合并后的文件还是原始地址
+        with metrics.stage("epg"):
+            update_epg(channels, template_channels)
+    with metrics.stage("write"):
+        updateChannelUrlsM3U(channels, template_channels, classifier)
+    if config.SOURCE_YIELD_ENABLED:
+        update_source_yield(matched_channels, classifier)
+    write_run_report()
+
+def write_run_report():
+    # 写出本次运行的指标报告，用于定位拖慢更新的源或阶段，以及跨运行对比趋势。
+    metrics.write_json(config.METRICS_REPORT_PATH)
+    if config.METRICS_PROMETHEUS_ENABLED:
+        metrics.write_prometheus(config.METRICS_PROMETHEUS_PATH)
+    stage_summary = ", ".join(f"{name} {stage['wall_seconds']}s" for name, stage in metrics.stages.items())
+    logging.info(f"运行报告已生成: {config.METRICS_REPORT_PATH}，各阶段耗时: {stage_summary}")
+
+def parse_args(argv=None):
+    # 解析命令行参数，不带子命令时运行完整流程。
+    import argparse
+
+    parser = argparse.ArgumentParser(description="抓取直播源、按模板匹配、测速并生成播放列表")
+    parser.add_argument("--template", default="demo.txt", help="频道模板文件")
+    # 各子命令共用的参数，写在子命令后面同样生效；子命令中不设默认值，避免覆盖写在子命令前面的值
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--template", default=argparse.SUPPRESS, help="频道模板文件（默认 demo.txt）")
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    subparsers.add_parser("fetch", parents=[common], help="抓取全部直播源，保存 fetch 检查点")
+    subparsers.add_parser("match", parents=[common], help="读取 fetch 检查点并按模板匹配，保存 match 检查点")
+    subparsers.add_parser("probe", parents=[common], help="读取 match 检查点并测速，保存 probe 检查点")
+    for command, help_text in (("write", "读取检查点写出播放列表"), ("epg", "读取检查点合并节目单")):
+        subparser = subparsers.add_parser(command, parents=[common], help=help_text)
+        subparser.add_argument("--from", dest="stage", choices=("match", "probe"),
+                               help="读取的检查点，默认取 match / probe 中较新的一个")
+    subparsers.add_parser("serve", parents=[common], help="以内置 HTTP 服务提供输出文件")
+    subparsers.add_parser("daemon", parents=[common], help="常驻运行，按各直播源的间隔刷新")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    # 命令行入口。
+    args = parse_args(argv)
+    setup_output()
+    try:
+        if args.command is None:
+            run(args.template)
+        elif args.command == "fetch":
+            fetch_stage()
+        elif args.command == "match":
+            fetched, _ = load_checkpoint(config.CHECKPOINT_DIR, "fetch")
+            match_stage(args.template, fetched)
+        elif args.command == "probe":
+            channels, template_channels = load_channels_checkpoint("match")
+            probe_stage(channels, template_channels, UrlClassifier(config.url_blacklist))
+        elif args.command == "write":
+            channels, template_channels = load_channels_checkpoint(args.stage)
+            updateChannelUrlsM3U(channels, template_channels)
+        elif args.command == "epg":
+            channels, template_channels = load_channels_checkpoint(args.stage)
+            update_epg(channels, template_channels)
+        elif args.command == "serve":
+            from utils.server import serve
+            serve(output_folder, config.SERVE_HOST, config.SERVE_PORT, config.SERVE_RELOAD_INTERVAL,
+                  config.CHANGE_FEED_DIR)
+        elif args.command == "daemon":
+            from utils.daemon import RefreshDaemon
+            RefreshDaemon(sys.modules[__name__], args.template).run()
+    except CheckpointError as e:
+        logging.error(str(e))
+        sys.exit(1)
+
 if __name__ == "__main__":
-    template_file = "demo.txt"
-    channels, template_channels = filter_source_urls(template_file)
-    updateChannelUrlsM3U(channels, template_channels)
+    main()
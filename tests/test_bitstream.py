@@ -0,0 +1,186 @@
+"""
+utils/bitstream.py 码流嗅探测试
+tests/data 下的样本由 FFmpeg 的 mpegts/flv 封装器配合 libx264、libx265、mpeg2video 编码生成，
+只截取开头若干字节；另有一段取自 pic/Updatetime.mp4 的 x264 SPS。
+"""
+import os
+import random
+import unittest
+
+from utils.bitstream import (
+    BitstreamError,
+    StreamSniffer,
+    parse_h264_sps,
+    parse_h265_sps,
+    parse_mpeg2_sequence_header,
+    parse_pts,
+)
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# pic/Updatetime.mp4 的 avcC 中的 SPS（x264 core 155，3840x2160，VUI 中带 25 fps 时间信息）
+UPDATETIME_SPS = bytes.fromhex("67640033acd9403c0043ec0440000003004000000c83c60c6580")
+
+# 样本文件 -> (封装, 编码, 宽, 高, 帧率)
+FIXTURES = {
+    # 1920x1080 编码高度为 1088，依赖 SPS 的裁剪参数
+    "h264_1080p25.ts": ("ts", "h264", 1920, 1080, 25.0),
+    "mpeg2_576p25.ts": ("ts", "mpeg2", 720, 576, 25.0),
+    # 854x480 需要 conformance window；关闭了 VUI 时间信息，帧率只能从 PES 时间戳估算
+    "h265_480p50.ts": ("ts", "h265", 854, 480, 50.0),
+    "h264_360p2997.flv": ("flv", "h264", 640, 360, 29.97),
+}
+
+TS_PACKET_SIZE = 188
+VIDEO_PID = 0x100
+
+
+def load(name):
+    with open(os.path.join(DATA_DIR, name), "rb") as f:
+        return f.read()
+
+
+def sniff(data, chunk_size=None):
+    sniffer = StreamSniffer(max_bytes=1024 * 1024, time_budget=10)
+    chunk_size = chunk_size or len(data) or 1
+    for offset in range(0, len(data), chunk_size):
+        sniffer.feed(data[offset:offset + chunk_size])
+        if sniffer.done:
+            break
+    return sniffer.finish()
+
+
+def find_nal(data, prefix):
+    """返回以给定字节开头的 NAL（不含起始码），到下一个起始码为止"""
+    start = data.index(b"\x00\x00\x01" + prefix) + 3
+    end = data.find(b"\x00\x00\x01", start)
+    return data[start:end if end != -1 else len(data)].rstrip(b"\x00")
+
+
+def pes_timestamps(data, pid):
+    """独立遍历 TS 包，取出指定 PID 每个 PES 头中的 (PTS, DTS)"""
+    result = []
+    for offset in range(0, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        packet = data[offset:offset + TS_PACKET_SIZE]
+        if packet[0] != 0x47 or not packet[1] & 0x40:
+            continue
+        if ((packet[1] & 0x1F) << 8 | packet[2]) != pid:
+            continue
+        start = 4
+        if packet[3] & 0x20:
+            start += 1 + packet[4]
+        pes = packet[start:]
+        flags = pes[7] >> 6
+        pts = parse_pts(pes[9:14]) if flags & 0x02 else None
+        dts = parse_pts(pes[14:19]) if flags == 0x03 else pts
+        result.append((pts, dts))
+    return result
+
+
+class SnifferFixtureTest(unittest.TestCase):
+    def test_fixtures(self):
+        for name, expected in FIXTURES.items():
+            with self.subTest(name=name):
+                info = sniff(load(name))
+                self.assertEqual((info.container, info.codec, info.width, info.height, info.fps), expected)
+
+    def test_small_chunks(self):
+        for name, expected in FIXTURES.items():
+            for chunk_size in (1, 7, 188, 1000):
+                with self.subTest(name=name, chunk_size=chunk_size):
+                    info = sniff(load(name), chunk_size)
+                    self.assertEqual((info.container, info.codec, info.width, info.height, info.fps), expected)
+
+
+class TransportStreamTest(unittest.TestCase):
+    def test_pat_pmt_locate_video_pid(self):
+        # 前三个包只有 SDT、PAT、PMT：已能从 PMT 得知编码，但还没有分辨率
+        for name in ("h264_1080p25.ts", "mpeg2_576p25.ts", "h265_480p50.ts"):
+            with self.subTest(name=name):
+                sniffer = StreamSniffer(max_bytes=1024 * 1024, time_budget=10)
+                sniffer.feed(load(name)[:3 * TS_PACKET_SIZE])
+                self.assertEqual(sniffer._pmt_pids, {0x1000})
+                self.assertEqual(sniffer._video_pid, VIDEO_PID)
+                info = sniffer.finish()
+                self.assertEqual(info.container, "ts")
+                self.assertEqual(info.codec, FIXTURES[name][1])
+                self.assertIsNone(info.width)
+
+    def test_pes_timestamps_with_b_frames(self):
+        timestamps = pes_timestamps(load("h265_480p50.ts"), VIDEO_PID)
+        self.assertGreater(len(timestamps), 5)
+        pts = [value[0] for value in timestamps]
+        dts = [value[1] for value in timestamps]
+        # 有 B 帧时 PTS 按解码顺序排列并不单调，DTS 每帧递增 90000 / 50
+        self.assertNotEqual(pts, sorted(pts))
+        self.assertEqual({b - a for a, b in zip(dts, dts[1:])}, {1800})
+        self.assertEqual(sniff(load("h265_480p50.ts")).fps, 50.0)
+
+
+class ParameterSetTest(unittest.TestCase):
+    def test_real_x264_sps(self):
+        self.assertEqual(parse_h264_sps(UPDATETIME_SPS), (3840, 2160, 25.0))
+
+    def test_h264_sps_from_fixture(self):
+        sps = find_nal(load("h264_1080p25.ts"), b"\x67")
+        self.assertEqual(parse_h264_sps(sps), (1920, 1080, 25.0))
+
+    def test_h265_sps_from_fixture(self):
+        sps = find_nal(load("h265_480p50.ts"), b"\x42")
+        self.assertEqual(parse_h265_sps(sps), (854, 480))
+
+    def test_mpeg2_sequence_header_from_fixture(self):
+        header = find_nal(load("mpeg2_576p25.ts"), b"\xb3")
+        self.assertEqual(parse_mpeg2_sequence_header(header), (720, 576, 25.0))
+
+    def test_truncated_sps(self):
+        # 截断的 SPS 要么报错，要么在读到所需字段之后才截断，不能得出错误的结果
+        for length in range(len(UPDATETIME_SPS)):
+            with self.subTest(length=length):
+                try:
+                    result = parse_h264_sps(UPDATETIME_SPS[:length])
+                except BitstreamError:
+                    continue
+                self.assertEqual(result, (3840, 2160, 25.0))
+        with self.assertRaises(BitstreamError):
+            parse_h264_sps(UPDATETIME_SPS[:12])
+        with self.assertRaises(BitstreamError):
+            parse_mpeg2_sequence_header(b"\x2d\x02")
+
+
+class MalformedInputTest(unittest.TestCase):
+    def test_truncated_fixtures(self):
+        # 任意位置截断（包括 TS 包中间）都不应抛出异常，已得出的字段必须与完整结果一致
+        for name, expected in FIXTURES.items():
+            data = load(name)
+            for length in range(0, len(data), 47):
+                with self.subTest(name=name, length=length):
+                    info = sniff(data[:length], 61)
+                    actual = (info.container, info.codec, info.width, info.height, info.fps)
+                    for value, full in zip(actual, expected):
+                        self.assertIn(value, (None, full))
+
+    def test_garbage(self):
+        rng = random.Random(20240601)
+        samples = [
+            bytes(rng.getrandbits(8) for _ in range(4096)),
+            b"".join(b"\x47" + bytes(rng.getrandbits(8) for _ in range(187)) for _ in range(20)),
+            b"FLV" + bytes(rng.getrandbits(8) for _ in range(2048)),
+            b"<html><body>404</body></html>",
+        ]
+        for index, data in enumerate(samples):
+            with self.subTest(index=index):
+                info = sniff(data, 100)
+                self.assertIsNone(info.width)
+                self.assertIsNone(info.height)
+
+    def test_corrupted_fixture(self):
+        rng = random.Random(7)
+        data = bytearray(load("h264_1080p25.ts"))
+        for _ in range(200):
+            data[rng.randrange(len(data))] = rng.getrandbits(8)
+        sniff(bytes(data), 188)
+
+
+if __name__ == "__main__":
+    unittest.main()
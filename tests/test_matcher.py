@@ -0,0 +1,86 @@
+"""
+ChannelMatcher 与 difflib 的一致性回归测试
+在固定语料上逐个比较 ChannelMatcher.find() 与 difflib.get_close_matches(name, names, n=1, cutoff=0.6)，
+包括分数相同（取字符串较大者）、分数恰好等于阈值和略低于阈值的情况。
+"""
+import random
+import unittest
+from difflib import get_close_matches
+
+from utils.matcher import ChannelMatcher
+from utils.records import ChannelRecord
+
+CUTOFF = 0.6
+
+# 在线频道名称
+ONLINE_NAMES = [
+    "CCTV1", "CCTV-1综合", "CCTV1高清", "CCTV2", "CCTV5+", "CCTV5", "CCTV12", "CCTV13", "CCTV-13新闻",
+    "湖南卫视", "湖南卫视HD", "湖北卫视", "浙江卫视", "东方卫视", "北京卫视4K", "广东珠江", "广东体育",
+    "凤凰中文", "凤凰资讯", "翡翠台", "明珠台", "CGTN", "CGTN纪录", "CETV1", "CETV4",
+    "abcxy", "abc", "abcdefghijk", "ab",
+]
+
+# 模板频道名称：精确命中、近似、分数相同、恰好在阈值上和阈值下、无匹配
+TEMPLATE_NAMES = [
+    "CCTV1",  # 精确命中
+    "CCTV-1",
+    "CCTV5+体育",
+    "CCTV",  # 与 CCTV1、CCTV2、CCTV5 等分数相同
+    "CCTV14",  # 与 CCTV12、CCTV13 分数相同
+    "湖南卫视高清", "湖北", "浙江", "东方卫视HD", "北京卫视",
+    "广东", "凤凰", "凤凰卫视中文台", "翡翠", "CGTN英语", "CETV",
+    "abcde",  # 与 abcxy 的相似度恰好为 0.6，与 abc 为 0.75
+    "abcdz",  # 与 abcxy 的相似度 0.6
+    "abcdef",  # 与 abcxy 的相似度 6/11，低于阈值
+    "zzzzzz",  # 没有匹配
+    "",
+]
+
+
+def build_matcher(names):
+    records = [ChannelRecord("分类", name, f"http://example.com/{index}.m3u8") for index, name in enumerate(names)]
+    return ChannelMatcher({"分类": records}, cutoff=CUTOFF)
+
+
+def difflib_find(name, names):
+    matches = get_close_matches(name, names, n=1, cutoff=CUTOFF)
+    return matches[0] if matches else None
+
+
+class MatcherDifflibTest(unittest.TestCase):
+    def assert_same_as_difflib(self, names, targets):
+        matcher = build_matcher(names)
+        for target in targets:
+            with self.subTest(target=target):
+                self.assertEqual(matcher.find(target), difflib_find(target, names))
+
+    def test_fixed_corpus(self):
+        self.assert_same_as_difflib(ONLINE_NAMES, TEMPLATE_NAMES)
+
+    def test_ties_pick_larger_string(self):
+        matcher = build_matcher(["CCTV12", "CCTV13"])
+        self.assertEqual(matcher.find("CCTV14"), "CCTV13")
+        self.assertEqual(difflib_find("CCTV14", ["CCTV12", "CCTV13"]), "CCTV13")
+
+    def test_score_exactly_at_cutoff(self):
+        # 2 * 3 / (5 + 5) == 0.6：恰好等于阈值时匹配
+        self.assertEqual(build_matcher(["abcxy"]).find("abcde"), "abcxy")
+        # 2 * 3 / (6 + 5) < 0.6：略低于阈值时不匹配
+        self.assertIsNone(build_matcher(["abcxy"]).find("abcdef"))
+        self.assertEqual(difflib_find("abcde", ["abcxy"]), "abcxy")
+        self.assertIsNone(difflib_find("abcdef", ["abcxy"]))
+        # 7 * 0.6 / 1.4 按浮点计算略大于 3，长度剪枝不能因此排除分数恰好为 0.6 的 3 字名称
+        self.assert_same_as_difflib(["abc", "xyz"], ["abcdefg"])
+        self.assertEqual(difflib_find("abcdefg", ["abc"]), "abc")
+
+    def test_random_corpus(self):
+        # 小字母表上的随机名称，产生大量分数相同和接近阈值的情况
+        rng = random.Random(20240717)
+        alphabet = "abcd卫视台1"
+        names = list(dict.fromkeys("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 8))) for _ in range(300)))
+        targets = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 8))) for _ in range(300)]
+        self.assert_same_as_difflib(names, targets)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+SpeedTester.probe_stream 测速判定测试
+使用 benchmarks/standin.py 的替身应用，另外挂上返回空正文和 HTML 错误页的地址，
+确认这些 200 响应不会被当作可用的直连流；HLS 测速取播放列表中最新的分片。
+"""
+import os
+import sys
+import unittest
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from standin import SEGMENT_COUNT, create_app  # noqa: E402
+from utils.speed_test import SpeedTester, config  # noqa: E402
+
+
+async def empty_stream(request):
+    return web.Response(body=b"", content_type="video/mp2t")
+
+
+async def html_page(request):
+    return web.Response(text="<html><body>404 频道不存在</body></html>", content_type="text/html")
+
+
+async def text_page(request):
+    return web.Response(text="token expired", content_type="text/plain")
+
+
+class ProbeStreamTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        app = create_app({}, {}, segment_bytes=32 * 1024, source_latency=0)
+        app.router.add_get("/error/empty.ts", empty_stream)
+        app.router.add_get("/error/page.php", html_page)
+        app.router.add_get("/error/token", text_page)
+        self.requested = []
+
+        async def record_path(request, response):
+            self.requested.append(request.path)
+
+        app.on_response_prepare.append(record_path)
+        self.server = TestServer(app, host="127.0.0.1")
+        await self.server.start_server()
+        self.tester = SpeedTester(timeout=5, retry_times=1)
+        await self.tester.__aenter__()
+
+    async def asyncTearDown(self):
+        await self.tester.__aexit__(None, None, None)
+        await self.server.close()
+
+    async def probe(self, path):
+        return await self.tester.probe_stream(str(self.server.make_url(path)), retry_times=1)
+
+    async def test_direct_stream(self):
+        result = await self.probe("/live/1.ts")
+        self.assertTrue(result.success, result.error)
+        self.assertGreater(result.throughput, 0)
+
+    async def test_empty_body_is_not_a_stream(self):
+        result = await self.probe("/error/empty.ts")
+        self.assertFalse(result.success)
+        self.assertEqual(result.error, "媒体流为空")
+
+    async def test_html_page_is_not_a_stream(self):
+        result = await self.probe("/error/page.php")
+        self.assertFalse(result.success)
+        self.assertIn("text/html", result.error)
+
+    async def test_text_page_is_not_a_stream(self):
+        result = await self.probe("/error/token")
+        self.assertFalse(result.success)
+        self.assertIn("text/plain", result.error)
+
+    async def test_hls_probes_latest_segments(self):
+        result = await self.probe("/live/1.m3u8")
+        self.assertTrue(result.success, result.error)
+        segments = [path for path in self.requested if path.endswith(".ts")]
+        expected = [f"/live/1/{index}.ts" for index in range(SEGMENT_COUNT)][-config.PROBE_SEGMENTS:]
+        self.assertEqual(segments, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
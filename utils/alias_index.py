@@ -0,0 +1,90 @@
+"""
+频道别名索引
+从 pic/logos/epg_data.json 构建 归一化别名 -> epgid 的字典，
+频道名称通过一次字典查找即可得到规范ID（写入 tvg-id，用于节目单绑定）。
+索引以源文件的哈希为键序列化缓存，源文件不变时直接加载。
+"""
+import hashlib
+import json
+import logging
+import os
+import pickle
+import re
+
+CACHE_VERSION = 1
+ALIAS_NOISE_PATTERN = re.compile(r'[\s$「」\-_]')
+NUMBER_PATTERN = re.compile(r'\d+')
+FULLWIDTH_TABLE = str.maketrans({"＋": "+", "⁺": "+", "（": "(", "）": ")"})
+
+
+def normalize_alias(name):
+    """别名归一化：统一全角符号，去掉空白和分隔符，数字去前导零，转为大写"""
+    name = (name or "").translate(FULLWIDTH_TABLE)
+    name = ALIAS_NOISE_PATTERN.sub("", name)
+    name = NUMBER_PATTERN.sub(lambda m: str(int(m.group(0))), name)
+    return name.upper()
+
+
+class AliasIndex:
+    """别名 -> epgid 以及 epgid -> 台标名称 的映射"""
+
+    def __init__(self, aliases, logos):
+        self.aliases = aliases
+        self.logos = logos
+
+    @classmethod
+    def build(cls, data):
+        aliases = {}
+        logos = {}
+        entries = data.get("epgs", [])
+        # 先登记所有 epgid 本身，避免被其它频道的同名别名抢占
+        for entry in entries:
+            epgid = entry.get("epgid")
+            if epgid:
+                aliases.setdefault(normalize_alias(epgid), epgid)
+                if entry.get("logo"):
+                    logos[epgid] = entry["logo"]
+        for entry in entries:
+            epgid = entry.get("epgid")
+            if not epgid:
+                continue
+            for alias in (entry.get("name") or "").split(","):
+                key = normalize_alias(alias)
+                if key:
+                    aliases.setdefault(key, epgid)
+        return cls(aliases, logos)
+
+    @classmethod
+    def load(cls, data_path, cache_path):
+        """加载别名索引，缓存与源文件哈希一致时直接使用缓存"""
+        with open(data_path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+
+        try:
+            with open(cache_path, "rb") as f:
+                cached = pickle.load(f)
+            if cached.get("version") == CACHE_VERSION and cached.get("sha256") == digest:
+                return cls(cached["aliases"], cached["logos"])
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, KeyError, TypeError):
+            pass
+
+        index = cls.build(json.loads(raw.decode("utf-8")))
+        try:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            temp_path = f"{cache_path}.tmp"
+            with open(temp_path, "wb") as f:
+                pickle.dump({"version": CACHE_VERSION, "sha256": digest,
+                             "aliases": index.aliases, "logos": index.logos},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            logging.warning(f"别名索引缓存写入失败: {e}")
+        return index
+
+    def resolve(self, name):
+        """返回频道名称对应的 epgid，未收录时返回 None"""
+        return self.aliases.get(normalize_alias(name))
+
+    def __len__(self):
+        return len(self.aliases)
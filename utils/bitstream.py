@@ -0,0 +1,627 @@
+"""
+码流嗅探模块
+不依赖 ffmpeg，从直播流开头的几百 KB 中识别视频编码、分辨率和帧率：
+MPEG-TS 依次解析 PAT、PMT 找到视频 PID，再从 PES 中取出 H.264 / H.265 的 SPS（以及 H.265 的 VPS）
+或 MPEG-2 序列头；FLV 从视频序列头（AVC/HEVC 解码配置记录）中取 SPS，onMetaData 作为补充。
+SPS 中没有时间信息时，按 PES 的 DTS（没有 DTS 时为 PTS；FLV 为标签时间戳）间隔估算帧率。
+嗅探以增量方式喂入数据，测速读取正文时顺带完成，并受字节数和 CPU 时间预算约束，可对大量URL并发使用。
+"""
+import struct
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+START_CODE = b"\x00\x00\x01"
+PTS_CLOCK = 90000
+# 估算帧率所需的时间戳个数
+TIMESTAMP_SAMPLES = 12
+# 超过该字节数仍无法识别封装格式时放弃
+DETECT_LIMIT = 8 * 1024
+
+# PMT 中的 stream_type -> 视频编码
+TS_VIDEO_STREAM_TYPES = {
+    0x01: "mpeg1", 0x02: "mpeg2", 0x10: "mpeg4", 0x1B: "h264", 0x24: "h265", 0x42: "avs", 0xD2: "avs2",
+}
+# FLV 视频标签的 CodecID 和增强型 FLV 的 FourCC
+FLV_VIDEO_CODECS = {2: "h263", 4: "vp6", 5: "vp6a", 7: "h264", 12: "h265"}
+FLV_FOURCC_CODECS = {b"avc1": "h264", b"hvc1": "h265", b"av01": "av1", b"vp09": "vp9"}
+# MPEG-2 序列头中的 frame_rate_code
+MPEG2_FRAME_RATES = {1: 24000 / 1001, 2: 24.0, 3: 25.0, 4: 30000 / 1001, 5: 30.0, 6: 50.0, 7: 60000 / 1001, 8: 60.0}
+# 带有色度格式等扩展字段的 H.264 profile_idc
+H264_HIGH_PROFILES = {100, 110, 122, 244, 44, 83, 86, 118, 128, 138, 139, 134, 135}
+
+
+class BitstreamError(Exception):
+    """码流数据不完整或不符合规范"""
+
+
+@dataclass
+class StreamInfo:
+    container: Optional[str] = None  # 封装格式：ts / flv
+    codec: Optional[str] = None  # 视频编码：h264 / h265 / mpeg2 ...
+    width: Optional[int] = None
+    height: Optional[int] = None
+    fps: Optional[float] = None
+
+    @property
+    def resolution(self) -> Optional[str]:
+        return f"{self.width}x{self.height}" if self.width and self.height else None
+
+
+class BitReader:
+    """按位读取 RBSP，整段数据转成一个整数后移位取值"""
+
+    __slots__ = ("value", "size", "pos")
+
+    def __init__(self, data: bytes):
+        self.value = int.from_bytes(data, "big")
+        self.size = len(data) * 8
+        self.pos = 0
+
+    def bits(self, count: int) -> int:
+        if count == 0:
+            return 0
+        shift = self.size - self.pos - count
+        if shift < 0:
+            raise BitstreamError("读取超出数据末尾")
+        self.pos += count
+        return (self.value >> shift) & ((1 << count) - 1)
+
+    def skip(self, count: int) -> None:
+        if self.pos + count > self.size:
+            raise BitstreamError("读取超出数据末尾")
+        self.pos += count
+
+    def ue(self) -> int:
+        """无符号指数哥伦布码"""
+        leading_zeros = 0
+        while not self.bits(1):
+            leading_zeros += 1
+            if leading_zeros > 31:
+                raise BitstreamError("指数哥伦布码过长")
+        return (1 << leading_zeros) - 1 + self.bits(leading_zeros)
+
+    def se(self) -> int:
+        """有符号指数哥伦布码"""
+        value = self.ue()
+        return (value + 1) // 2 if value % 2 else -(value // 2)
+
+
+def unescape_rbsp(data: bytes) -> bytes:
+    """去掉防竞争字节：00 00 03 -> 00 00"""
+    return data.replace(b"\x00\x00\x03", b"\x00\x00") if b"\x00\x00\x03" in data else data
+
+
+def parse_h264_sps(nal: bytes) -> Tuple[int, int, Optional[float]]:
+    """解析 H.264 SPS（含 NAL 头），返回 (宽, 高, 帧率)，VUI 中没有时间信息时帧率为 None"""
+    reader = BitReader(unescape_rbsp(nal[1:]))
+    profile_idc = reader.bits(8)
+    reader.skip(16)  # constraint_set 标志、level_idc
+    reader.ue()  # seq_parameter_set_id
+    chroma_format_idc = 1
+    if profile_idc in H264_HIGH_PROFILES:
+        chroma_format_idc = reader.ue()
+        if chroma_format_idc == 3:
+            reader.skip(1)  # separate_colour_plane_flag
+        reader.ue()  # bit_depth_luma_minus8
+        reader.ue()  # bit_depth_chroma_minus8
+        reader.skip(1)  # qpprime_y_zero_transform_bypass_flag
+        if reader.bits(1):  # seq_scaling_matrix_present_flag
+            for index in range(8 if chroma_format_idc != 3 else 12):
+                if reader.bits(1):
+                    _skip_scaling_list(reader, 16 if index < 6 else 64)
+    reader.ue()  # log2_max_frame_num_minus4
+    pic_order_cnt_type = reader.ue()
+    if pic_order_cnt_type == 0:
+        reader.ue()  # log2_max_pic_order_cnt_lsb_minus4
+    elif pic_order_cnt_type == 1:
+        reader.skip(1)  # delta_pic_order_always_zero_flag
+        reader.se()  # offset_for_non_ref_pic
+        reader.se()  # offset_for_top_to_bottom_field
+        for _ in range(reader.ue()):
+            reader.se()  # offset_for_ref_frame
+    reader.ue()  # max_num_ref_frames
+    reader.skip(1)  # gaps_in_frame_num_value_allowed_flag
+    width_in_mbs = reader.ue() + 1
+    height_in_map_units = reader.ue() + 1
+    frame_mbs_only = reader.bits(1)
+    if not frame_mbs_only:
+        reader.skip(1)  # mb_adaptive_frame_field_flag
+    reader.skip(1)  # direct_8x8_inference_flag
+
+    width = width_in_mbs * 16
+    height = (2 - frame_mbs_only) * height_in_map_units * 16
+    if reader.bits(1):  # frame_cropping_flag
+        crop_left, crop_right, crop_top, crop_bottom = (reader.ue() for _ in range(4))
+        # 裁剪单位取决于色度采样格式
+        sub_width, sub_height = {0: (1, 1), 1: (2, 2), 2: (2, 1)}.get(chroma_format_idc, (1, 1))
+        crop_unit_x = sub_width if chroma_format_idc else 1
+        crop_unit_y = (sub_height if chroma_format_idc else 1) * (2 - frame_mbs_only)
+        width -= crop_unit_x * (crop_left + crop_right)
+        height -= crop_unit_y * (crop_top + crop_bottom)
+
+    fps = None
+    if reader.bits(1):  # vui_parameters_present_flag
+        fps = _h264_vui_fps(reader)
+    return width, height, fps
+
+
+def _skip_scaling_list(reader: BitReader, size: int) -> None:
+    last_scale = next_scale = 8
+    for _ in range(size):
+        if next_scale:
+            next_scale = (last_scale + reader.se() + 256) % 256
+        last_scale = next_scale or last_scale
+
+
+def _h264_vui_fps(reader: BitReader) -> Optional[float]:
+    if reader.bits(1):  # aspect_ratio_info_present_flag
+        if reader.bits(8) == 255:  # aspect_ratio_idc == Extended_SAR
+            reader.skip(32)
+    if reader.bits(1):  # overscan_info_present_flag
+        reader.skip(1)
+    if reader.bits(1):  # video_signal_type_present_flag
+        reader.skip(4)
+        if reader.bits(1):  # colour_description_present_flag
+            reader.skip(24)
+    if reader.bits(1):  # chroma_loc_info_present_flag
+        reader.ue()
+        reader.ue()
+    if not reader.bits(1):  # timing_info_present_flag
+        return None
+    num_units_in_tick = reader.bits(32)
+    time_scale = reader.bits(32)
+    if not num_units_in_tick or not time_scale:
+        return None
+    # H.264 一帧包含两个场时钟周期
+    return _sane_fps(time_scale / (2 * num_units_in_tick))
+
+
+def _skip_profile_tier_level(reader: BitReader, max_sub_layers_minus1: int) -> None:
+    """跳过 H.265 的 profile_tier_level 结构"""
+    reader.skip(96)  # general_profile_space ... general_level_idc
+    sub_layer_flags = [(reader.bits(1), reader.bits(1)) for _ in range(max_sub_layers_minus1)]
+    if max_sub_layers_minus1 > 0:
+        reader.skip(2 * (8 - max_sub_layers_minus1))
+    for profile_present, level_present in sub_layer_flags:
+        if profile_present:
+            reader.skip(88)
+        if level_present:
+            reader.skip(8)
+
+
+def parse_h265_sps(nal: bytes) -> Tuple[int, int]:
+    """解析 H.265 SPS（含两字节 NAL 头），返回裁剪后的 (宽, 高)"""
+    reader = BitReader(unescape_rbsp(nal[2:]))
+    reader.skip(4)  # sps_video_parameter_set_id
+    max_sub_layers_minus1 = reader.bits(3)
+    reader.skip(1)  # sps_temporal_id_nesting_flag
+    _skip_profile_tier_level(reader, max_sub_layers_minus1)
+    reader.ue()  # sps_seq_parameter_set_id
+    chroma_format_idc = reader.ue()
+    if chroma_format_idc == 3:
+        reader.skip(1)  # separate_colour_plane_flag
+    width = reader.ue()
+    height = reader.ue()
+    if reader.bits(1):  # conformance_window_flag
+        left, right, top, bottom = (reader.ue() for _ in range(4))
+        sub_width, sub_height = {1: (2, 2), 2: (2, 1)}.get(chroma_format_idc, (1, 1))
+        width -= sub_width * (left + right)
+        height -= sub_height * (top + bottom)
+    return width, height
+
+
+def parse_h265_vps_fps(nal: bytes) -> Optional[float]:
+    """从 H.265 VPS 的时间信息中取帧率，没有时返回 None"""
+    reader = BitReader(unescape_rbsp(nal[2:]))
+    reader.skip(12)  # vps_video_parameter_set_id、base_layer 标志、vps_max_layers_minus1
+    max_sub_layers_minus1 = reader.bits(3)
+    reader.skip(17)  # vps_temporal_id_nesting_flag、vps_reserved_0xffff_16bits
+    _skip_profile_tier_level(reader, max_sub_layers_minus1)
+    ordering_info_present = reader.bits(1)
+    for _ in range(0 if ordering_info_present else max_sub_layers_minus1, max_sub_layers_minus1 + 1):
+        reader.ue()
+        reader.ue()
+        reader.ue()
+    max_layer_id = reader.bits(6)
+    num_layer_sets_minus1 = reader.ue()
+    reader.skip(num_layer_sets_minus1 * (max_layer_id + 1))
+    if not reader.bits(1):  # vps_timing_info_present_flag
+        return None
+    num_units_in_tick = reader.bits(32)
+    time_scale = reader.bits(32)
+    if not num_units_in_tick or not time_scale:
+        return None
+    return _sane_fps(time_scale / num_units_in_tick)
+
+
+def parse_mpeg2_sequence_header(data: bytes) -> Tuple[int, int, Optional[float]]:
+    """解析 MPEG-1/2 序列头（从 00 00 01 之后的 B3 开始的字节），返回 (宽, 高, 帧率)"""
+    if len(data) < 5:
+        raise BitstreamError("序列头不完整")
+    width = (data[1] << 4) | (data[2] >> 4)
+    height = ((data[2] & 0x0F) << 8) | data[3]
+    return width, height, MPEG2_FRAME_RATES.get(data[4] & 0x0F)
+
+
+def parse_pts(data: bytes) -> int:
+    """PES 头中 5 字节的 33 位时间戳（PTS 或 DTS）"""
+    return (((data[0] >> 1) & 0x07) << 30 | data[1] << 22 | (data[2] >> 1) << 15
+            | data[3] << 7 | data[4] >> 1)
+
+
+def fps_from_timestamps(timestamps: List[int], clock: int) -> Optional[float]:
+    """按排序后的时间戳跨度估算帧率，时间戳需覆盖连续的若干帧"""
+    values = sorted(set(timestamps))
+    if len(values) < 3:
+        return None
+    span = values[-1] - values[0]
+    if span <= 0:
+        return None
+    return _sane_fps((len(values) - 1) * clock / span)
+
+
+def _sane_fps(fps: float) -> Optional[float]:
+    return round(fps, 3) if 1 <= fps <= 240 else None
+
+
+def iter_parameter_sets(data: bytes, codec: str):
+    """从带起始码的 H.264/H.265 码流中取出参数集 NAL：(类型, NAL)"""
+    start = data.find(START_CODE)
+    while start != -1:
+        start += 3
+        end = data.find(START_CODE, start)
+        nal = data[start:end if end != -1 else len(data)]
+        if nal:
+            nal_type = nal[0] & 0x1F if codec == "h264" else (nal[0] >> 1) & 0x3F
+            yield nal_type, nal.rstrip(b"\x00")
+        start = end
+
+
+class StreamSniffer:
+    """
+    增量嗅探：反复调用 feed() 喂入正文，done 为 True 后不再需要数据，finish() 返回结果
+    读取的字节数超过 max_bytes 或解析耗时超过 time_budget 秒后放弃，已识别的字段仍然有效
+    """
+
+    def __init__(self, max_bytes: int = 384 * 1024, time_budget: float = 0.05):
+        self.max_bytes = max_bytes
+        self.time_budget = time_budget
+        self.info = StreamInfo()
+        self.done = False
+        self.consumed = 0
+        self.elapsed = 0.0
+        self._buffer = b""
+        self._timestamps: List[int] = []
+        # MPEG-TS 状态
+        self._pmt_pids: set = set()
+        self._video_pid: Optional[int] = None
+        self._es = bytearray()
+        # FLV 状态：下一段需要的字节数，以及需要跳过的字节数
+        self._flv_header_done = False
+        self._skip = 0
+        self._metadata: Dict[str, object] = {}
+
+    def feed(self, data: bytes) -> bool:
+        """喂入一段数据，返回是否已完成"""
+        if self.done or not data:
+            return self.done
+        start = time.perf_counter()
+        data = bytes(data[:self.max_bytes - self.consumed])
+        self.consumed += len(data)
+        try:
+            self._buffer += data
+            if self.info.container is None:
+                self._detect()
+            if self.info.container == "ts":
+                self._feed_ts()
+            elif self.info.container == "flv":
+                self._feed_flv()
+        except (BitstreamError, IndexError, ValueError, struct.error):
+            # 码流损坏时保留已识别的结果
+            self.done = True
+        self.elapsed += time.perf_counter() - start
+        if self.consumed >= self.max_bytes or self.elapsed >= self.time_budget:
+            self.done = True
+        return self.done
+
+    def finish(self) -> StreamInfo:
+        """结束嗅探，必要时用时间戳估算帧率，并用 FLV 元数据补全缺失字段"""
+        self.done = True
+        info = self.info
+        if info.fps is None:
+            info.fps = fps_from_timestamps(self._timestamps, PTS_CLOCK if info.container == "ts" else 1000)
+        metadata = self._metadata
+        if not info.width and metadata.get("width") and metadata.get("height"):
+            info.width, info.height = int(metadata["width"]), int(metadata["height"])
+        if info.fps is None and metadata.get("framerate"):
+            info.fps = _sane_fps(float(metadata["framerate"]))
+        self._buffer = b""
+        self._es = bytearray()
+        return info
+
+    def _check_done(self) -> None:
+        info = self.info
+        if info.width and (info.fps or len(self._timestamps) >= TIMESTAMP_SAMPLES):
+            self.done = True
+
+    def _detect(self) -> None:
+        buffer = self._buffer
+        if buffer[:3] == b"FLV":
+            self.info.container = "flv"
+            return
+        for offset in range(min(len(buffer), TS_PACKET_SIZE)):
+            if all(offset + index * TS_PACKET_SIZE < len(buffer)
+                   and buffer[offset + index * TS_PACKET_SIZE] == TS_SYNC_BYTE for index in range(3)):
+                self.info.container = "ts"
+                self._buffer = buffer[offset:]
+                return
+        if len(buffer) >= DETECT_LIMIT:
+            self.done = True  # 不是 TS / FLV（如 fMP4），不再嗅探
+
+    # MPEG-TS
+
+    def _feed_ts(self) -> None:
+        buffer = self._buffer
+        position = 0
+        while position + TS_PACKET_SIZE <= len(buffer) and not self.done:
+            if buffer[position] != TS_SYNC_BYTE:
+                # 失去同步时寻找下一个同步字节
+                position = buffer.find(bytes([TS_SYNC_BYTE]), position + 1)
+                if position == -1:
+                    position = len(buffer)
+                continue
+            self._ts_packet(buffer, position)
+            position += TS_PACKET_SIZE
+        self._buffer = buffer[position:]
+
+    def _ts_packet(self, buffer: bytes, position: int) -> None:
+        header = buffer[position + 1]
+        pid = ((header & 0x1F) << 8) | buffer[position + 2]
+        if pid != 0 and pid != self._video_pid and pid not in self._pmt_pids:
+            return
+        adaptation = (buffer[position + 3] >> 4) & 0x03
+        if not adaptation & 0x01:
+            return  # 没有负载
+        start = position + 4
+        if adaptation & 0x02:
+            start += 1 + buffer[start]
+        end = position + TS_PACKET_SIZE
+        if start >= end:
+            return
+        payload = buffer[start:end]
+        unit_start = header & 0x40
+
+        if pid == self._video_pid:
+            self._pes_payload(payload, unit_start)
+        elif unit_start and pid == 0:
+            self._parse_pat(payload)
+        elif unit_start and pid in self._pmt_pids:
+            self._parse_pmt(payload)
+
+    @staticmethod
+    def _section(payload: bytes, table_id: int) -> Optional[bytes]:
+        """取出单个 TS 包内的 PSI 段（去掉 CRC），表 ID 不符时返回 None"""
+        section = payload[1 + payload[0]:]
+        if len(section) < 3 or section[0] != table_id:
+            return None
+        length = ((section[1] & 0x0F) << 8) | section[2]
+        return section[:3 + length - 4]
+
+    def _parse_pat(self, payload: bytes) -> None:
+        section = self._section(payload, 0x00)
+        if section is None:
+            return
+        for offset in range(8, len(section) - 3, 4):
+            program_number = (section[offset] << 8) | section[offset + 1]
+            if program_number:
+                self._pmt_pids.add(((section[offset + 2] & 0x1F) << 8) | section[offset + 3])
+
+    def _parse_pmt(self, payload: bytes) -> None:
+        section = self._section(payload, 0x02)
+        if section is None or self._video_pid is not None:
+            return
+        offset = 12 + (((section[10] & 0x0F) << 8) | section[11])
+        while offset + 5 <= len(section):
+            stream_type = section[offset]
+            pid = ((section[offset + 1] & 0x1F) << 8) | section[offset + 2]
+            if stream_type in TS_VIDEO_STREAM_TYPES:
+                self._video_pid = pid
+                self.info.codec = TS_VIDEO_STREAM_TYPES[stream_type]
+                return
+            offset += 5 + (((section[offset + 3] & 0x0F) << 8) | section[offset + 4])
+        self.done = True  # 只有音频
+
+    def _pes_payload(self, payload: bytes, unit_start: int) -> None:
+        if unit_start:
+            if payload[:3] != START_CODE or len(payload) < 9:
+                return
+            # 有 B 帧时 PES 按解码顺序排列，开头一段的 PTS 并不连续，优先使用单调连续的 DTS
+            if payload[7] & 0xC0 == 0xC0 and len(payload) >= 19:
+                self._timestamps.append(parse_pts(payload[14:19]))
+            elif payload[7] & 0x80 and len(payload) >= 14:
+                self._timestamps.append(parse_pts(payload[9:14]))
+            payload = payload[9 + payload[8]:]
+        if self.info.width:
+            # 分辨率已知，只需继续收集时间戳
+            self._check_done()
+            return
+        self._es += payload
+        self._scan_elementary_stream()
+        self._check_done()
+
+    def _scan_elementary_stream(self) -> None:
+        """在视频基本流中寻找完整的参数集：只处理后面已出现下一个起始码的 NAL"""
+        es = self._es
+        codec = self.info.codec
+        last_start = es.rfind(START_CODE)
+        if last_start <= 0:
+            return
+        complete = bytes(es[:last_start])
+        del es[:last_start]
+        if codec in ("mpeg1", "mpeg2"):
+            position = complete.find(START_CODE + b"\xb3")
+            if position != -1:
+                self._set_video(*parse_mpeg2_sequence_header(complete[position + 3:]))
+            return
+        if codec not in ("h264", "h265"):
+            self.done = True  # 其他编码只报告编码类型
+            return
+        self._parameter_sets(iter_parameter_sets(complete, codec))
+
+    def _parameter_sets(self, nals) -> None:
+        codec = self.info.codec
+        for nal_type, nal in nals:
+            try:
+                if codec == "h264" and nal_type == 7:
+                    self._set_video(*parse_h264_sps(nal))
+                elif codec == "h265" and nal_type == 33:
+                    self._set_video(*parse_h265_sps(nal), self.info.fps)
+                elif codec == "h265" and nal_type == 32 and self.info.fps is None:
+                    self.info.fps = parse_h265_vps_fps(nal)
+            except BitstreamError:
+                continue
+
+    def _set_video(self, width: int, height: int, fps: Optional[float]) -> None:
+        if width > 0 and height > 0:
+            self.info.width, self.info.height = width, height
+        if fps:
+            self.info.fps = fps
+
+    # FLV
+
+    def _feed_flv(self) -> None:
+        buffer = self._buffer
+        position = 0
+        if not self._flv_header_done:
+            if len(buffer) < 9:
+                return
+            self._skip = struct.unpack(">I", buffer[5:9])[0] + 4  # 文件头和 PreviousTagSize0
+            self._flv_header_done = True
+        while not self.done:
+            if self._skip:
+                step = min(self._skip, len(buffer) - position)
+                position += step
+                self._skip -= step
+                if self._skip:
+                    break
+            if position + 11 > len(buffer):
+                break
+            tag_type = buffer[position] & 0x1F
+            size = int.from_bytes(buffer[position + 1:position + 4], "big")
+            timestamp = int.from_bytes(buffer[position + 4:position + 7], "big") | buffer[position + 7] << 24
+            # 脚本标签和视频序列头需要完整内容，其余视频标签只看开头几个字节
+            needed = size if tag_type == 18 or (tag_type == 9 and self._flv_sequence_header(
+                buffer[position + 11:position + 16])) else min(size, 5)
+            if position + 11 + needed > len(buffer):
+                break
+            data = buffer[position + 11:position + 11 + size]
+            if tag_type == 9:
+                self._flv_video(data, timestamp)
+            elif tag_type == 18:
+                self._flv_script(data)
+            position += 11
+            self._skip = size + 4  # 标签内容和 PreviousTagSize
+        self._buffer = buffer[position:]
+
+    @staticmethod
+    def _flv_sequence_header(head: bytes) -> bool:
+        if len(head) < 2:
+            return True  # 信息不足，先等待更多数据
+        if head[0] & 0x80:
+            return head[0] & 0x0F == 0  # 增强型 FLV：PacketType 0 为 SequenceStart
+        return head[0] & 0x0F in (7, 12) and head[1] == 0
+
+    def _flv_video(self, data: bytes, timestamp: int) -> None:
+        if not data:
+            return
+        if data[0] & 0x80:
+            codec = FLV_FOURCC_CODECS.get(bytes(data[1:5]))
+            sequence_header = data[0] & 0x0F == 0
+        else:
+            codec = FLV_VIDEO_CODECS.get(data[0] & 0x0F)
+            sequence_header = len(data) > 1 and data[1] == 0 and codec in ("h264", "h265")
+        self.info.codec = self.info.codec or codec
+        if not sequence_header:
+            self._timestamps.append(timestamp)
+        elif not self.info.width and len(data) > 5:
+            if codec == "h264":
+                self._parameter_sets(_avc_config_nals(data[5:]))
+            elif codec == "h265":
+                self._parameter_sets(_hevc_config_nals(data[5:]))
+        if self.info.codec not in ("h264", "h265") and len(self._timestamps) >= TIMESTAMP_SAMPLES:
+            self.done = True
+        self._check_done()
+
+    def _flv_script(self, data: bytes) -> None:
+        try:
+            name, offset = _amf_value(data, 0)
+            if name == "onMetaData":
+                value, _ = _amf_value(data, offset)
+                if isinstance(value, dict):
+                    self._metadata = value
+        except (IndexError, ValueError, struct.error, RecursionError):
+            pass
+
+
+def _avc_config_nals(record: bytes):
+    """AVCDecoderConfigurationRecord 中的 SPS"""
+    offset = 6
+    for _ in range(record[5] & 0x1F):
+        length = struct.unpack(">H", record[offset:offset + 2])[0]
+        nal = record[offset + 2:offset + 2 + length]
+        offset += 2 + length
+        yield nal[0] & 0x1F, nal
+
+
+def _hevc_config_nals(record: bytes):
+    """HEVCDecoderConfigurationRecord 中的 VPS / SPS / PPS 等"""
+    offset = 23
+    for _ in range(record[22]):
+        nal_type = record[offset] & 0x3F
+        count = struct.unpack(">H", record[offset + 1:offset + 3])[0]
+        offset += 3
+        for _ in range(count):
+            length = struct.unpack(">H", record[offset:offset + 2])[0]
+            yield nal_type, record[offset + 2:offset + 2 + length]
+            offset += 2 + length
+
+
+def _amf_value(data: bytes, offset: int, depth: int = 0):
+    """读取一个 AMF0 值，返回 (值, 新偏移)；只支持 onMetaData 中常见的类型"""
+    if depth > 8:
+        raise ValueError("AMF 嵌套过深")
+    marker = data[offset]
+    offset += 1
+    if marker == 0x00:
+        return struct.unpack(">d", data[offset:offset + 8])[0], offset + 8
+    if marker == 0x01:
+        return bool(data[offset]), offset + 1
+    if marker == 0x02:
+        length = struct.unpack(">H", data[offset:offset + 2])[0]
+        return data[offset + 2:offset + 2 + length].decode("utf-8", errors="replace"), offset + 2 + length
+    if marker in (0x03, 0x08):
+        if marker == 0x08:
+            offset += 4  # ECMA 数组的元素个数，以结束标记为准
+        result = {}
+        while True:
+            length = struct.unpack(">H", data[offset:offset + 2])[0]
+            if length == 0 and data[offset + 2] == 0x09:
+                return result, offset + 3
+            key = data[offset + 2:offset + 2 + length].decode("utf-8", errors="replace")
+            result[key], offset = _amf_value(data, offset + 2 + length, depth + 1)
+    if marker in (0x05, 0x06):
+        return None, offset
+    if marker == 0x0A:
+        count = struct.unpack(">I", data[offset:offset + 4])[0]
+        offset += 4
+        values = []
+        for _ in range(count):
+            value, offset = _amf_value(data, offset, depth + 1)
+            values.append(value)
+        return values, offset
+    if marker == 0x0B:
+        return None, offset + 10
+    raise ValueError(f"不支持的 AMF 类型 {marker}")
@@ -0,0 +1,137 @@
+"""
+播放列表变更记录
+每次写出播放列表时，把各播放列表的 分类 -> 频道 -> 线路 与上一代比较，内容有变化时生成新的一代：
+  changes/index.json          当前代号、内容哈希和保留的历史增量列表
+  changes/<代号>.json         相对上一代的增量：每个频道新增、删除的线路，顺序变化时附带完整的新顺序
+  changes/snapshot.json       当前代的完整线路，用于下次比较
+客户端应用增量的方法：先删除 removed，再在末尾追加 added，有 order 时直接使用 order；
+线路为空的频道和没有频道的分类即被删除。应用后可用 hash 校验（按键排序的紧凑 JSON 的 sha256），
+落后超过保留的代数或校验不一致时重新下载完整播放列表。
+线路记录为去掉 $ 显示后缀的地址，公告频道不计入。
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from utils.output_writer import write_atomic
+
+FEED_VERSION = 1
+
+
+def snapshot_hash(playlists):
+    """线路快照的 sha256，键排序后序列化，只有频道内的线路顺序影响哈希，客户端应用增量后可以复算"""
+    body = json.dumps(playlists, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+def diff_urls(old_urls, new_urls):
+    """比较一个频道的线路，无变化时返回 None"""
+    if old_urls == new_urls:
+        return None
+    old_set = set(old_urls)
+    new_set = set(new_urls)
+    entry = OrderedDict()
+    added = [url for url in new_urls if url not in old_set]
+    removed = [url for url in old_urls if url not in new_set]
+    if added:
+        entry["added"] = added
+    if removed:
+        entry["removed"] = removed
+    # 按“删除后追加”的规则得不到新顺序时，附带完整顺序
+    if [url for url in old_urls if url in new_set] + added != new_urls:
+        entry["order"] = new_urls
+    return entry
+
+
+def diff_channels(previous, current):
+    """比较一个播放列表的 分类 -> 频道 -> 线路，返回有变化的频道列表"""
+    changes = []
+    for category, channel_map in current.items():
+        previous_map = previous.get(category, {})
+        for channel_name, urls in channel_map.items():
+            entry = diff_urls(previous_map.get(channel_name, []), urls)
+            if entry:
+                changes.append(OrderedDict([("category", category), ("channel", channel_name), *entry.items()]))
+    for category, previous_map in previous.items():
+        channel_map = current.get(category, {})
+        for channel_name, urls in previous_map.items():
+            if channel_name not in channel_map and urls:
+                changes.append(OrderedDict([("category", category), ("channel", channel_name), ("removed", urls)]))
+    return changes
+
+
+class ChangeFeed:
+    """变更记录目录，只保留最近 history 代的增量"""
+
+    def __init__(self, directory, history=50):
+        self.directory = directory
+        self.history = history
+        self.index_path = os.path.join(directory, "index.json")
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+
+    def _load(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data if data.get("version") == FEED_VERSION else None
+
+    def publish(self, playlists):
+        """
+        记录新一代的线路快照，playlists 为 播放列表名 -> 分类 -> 频道 -> [线路]
+        内容与上一代相同时不生成新的一代，返回当前代号
+        """
+        digest = snapshot_hash(playlists)
+        snapshot = self._load(self.snapshot_path)
+        index = self._load(self.index_path) or {"version": FEED_VERSION, "generation": 0, "hash": None, "history": []}
+        if snapshot and snapshot["hash"] == digest and index["hash"] == digest:
+            return index["generation"]
+
+        os.makedirs(self.directory, exist_ok=True)
+        generation = index["generation"] + 1
+        generated_at = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        history = index["history"]
+        if snapshot and snapshot["generation"] == index["generation"]:
+            previous = snapshot["playlists"]
+            delta = OrderedDict([
+                ("version", FEED_VERSION),
+                ("generation", generation),
+                ("previous_generation", index["generation"]),
+                ("hash", digest),
+                ("previous_hash", snapshot["hash"]),
+                ("generated_at", generated_at),
+                ("playlists", OrderedDict(
+                    (name, diff_channels(previous.get(name, {}), channels)) for name, channels in playlists.items())),
+            ])
+            delta_name = f"{generation}.json"
+            body = json.dumps(delta, ensure_ascii=False, separators=(",", ":"))
+            write_atomic(os.path.join(self.directory, delta_name), body)
+            history.append({"generation": generation, "previous_generation": index["generation"],
+                            "hash": digest, "generated_at": generated_at,
+                            "path": delta_name, "bytes": len(body.encode("utf-8"))})
+            kept = history[-self.history:] if self.history else []
+        else:
+            # 没有可比较的上一代（首次运行或快照损坏），从这一代重新开始，已有的增量不再可用
+            kept = []
+
+        # 超出保留数量的增量从最旧的开始删除
+        for entry in history[:len(history) - len(kept)]:
+            try:
+                os.remove(os.path.join(self.directory, entry["path"]))
+            except OSError:
+                pass
+        history = kept
+
+        write_atomic(self.snapshot_path, json.dumps(
+            {"version": FEED_VERSION, "generation": generation, "hash": digest, "playlists": playlists},
+            ensure_ascii=False, separators=(",", ":")))
+        write_atomic(self.index_path, json.dumps(
+            {"version": FEED_VERSION, "generation": generation, "hash": digest,
+             "generated_at": generated_at, "history": history},
+            ensure_ascii=False, indent=2))
+        logging.info(f"播放列表变更记录: 第 {generation} 代，保留增量 {len(history)} 个")
+        return generation
@@ -0,0 +1,63 @@
+"""
+阶段检查点
+fetch / match / probe 各阶段的结果以 pickle 保存在 output/checkpoints 下，附带格式版本和生成时间，
+单独重跑某个阶段时直接读取上一阶段的检查点，不必重新抓取全部直播源。
+频道记录通过 ChannelRecord.__reduce__ 序列化，驻留的分类和名称字符串在文件中只保存一份。
+"""
+import os
+import pickle
+import time
+
+# 检查点格式版本，阶段数据结构变化时递增，旧检查点需重新生成
+CHECKPOINT_SCHEMA = 1
+
+# 各阶段检查点由哪个命令生成，用于提示
+STAGE_COMMANDS = {
+    "fetch": "python main.py fetch",
+    "match": "python main.py match",
+    "probe": "python main.py probe",
+}
+
+
+class CheckpointError(Exception):
+    """检查点不存在、已损坏或格式版本不符"""
+
+
+def checkpoint_path(directory, stage):
+    return os.path.join(directory, f"{stage}.pickle")
+
+
+def save_checkpoint(directory, stage, data):
+    """保存阶段结果，先写临时文件再原子替换"""
+    os.makedirs(directory, exist_ok=True)
+    path = checkpoint_path(directory, stage)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        pickle.dump({"schema": CHECKPOINT_SCHEMA, "stage": stage, "created_at": time.time(), "data": data},
+                    f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+    return path
+
+
+def load_checkpoint(directory, stage):
+    """读取阶段结果，返回 (数据, 生成时间)"""
+    path = checkpoint_path(directory, stage)
+    command = STAGE_COMMANDS.get(stage, stage)
+    try:
+        with open(path, "rb") as f:
+            payload = pickle.load(f)
+    except FileNotFoundError:
+        raise CheckpointError(f"未找到 {stage} 阶段的检查点 {path}，请先运行 {command}") from None
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError, TypeError) as e:
+        raise CheckpointError(f"{stage} 阶段的检查点 {path} 无法读取（{e}），请重新运行 {command}") from None
+    if not isinstance(payload, dict) or payload.get("schema") != CHECKPOINT_SCHEMA or payload.get("stage") != stage:
+        raise CheckpointError(f"{stage} 阶段的检查点 {path} 格式版本不符，请重新运行 {command}")
+    return payload["data"], payload["created_at"]
+
+
+def checkpoint_time(directory, stage):
+    """检查点的生成时间（按文件修改时间），不存在时返回 None"""
+    try:
+        return os.path.getmtime(checkpoint_path(directory, stage))
+    except OSError:
+        return None
@@ -0,0 +1,243 @@
+"""
+常驻刷新模式（python main.py daemon）
+解析后的模板、频道匹配器索引和每个直播源的频道字典常驻内存，每个直播源按自己的间隔（带随机抖动）刷新。
+只有内容变化的直播源才触发重新匹配：名称集合不变时沿用匹配器索引，只更新涉及的频道；
+受影响的模板频道才重新测速，播放列表在内存中重建后只写入内容有变化的文件。
+demo.txt 和 config.py 修改后自动重新加载，并对全部频道重新匹配。
+"""
+import importlib
+import logging
+import os
+import random
+import signal
+import threading
+import time
+from collections import OrderedDict
+
+from utils.matcher import ChannelMatcher
+from utils.metrics import metrics
+from utils.urls import UrlClassifier
+
+# 抓取失败且没有快照可回退时的状态，此时保留该直播源上一次的频道
+FAILED_STATUSES = ("failed", "timeout")
+
+
+def record_names(channels):
+    """直播源中出现的全部频道名称"""
+    if not channels:
+        return set()
+    return {record.name for channel_list in channels.values() for record in channel_list}
+
+
+class RefreshDaemon:
+    """常驻刷新循环，pipeline 为 main 模块，抓取、测速和写出复用其中的函数"""
+
+    def __init__(self, pipeline, template_file, rng=None):
+        self.pipeline = pipeline
+        self.config = pipeline.config
+        self.template_file = template_file
+        self.rng = rng or random.Random()
+        self.template_channels = OrderedDict()
+        self.template_mtime = None
+        self.config_mtime = _mtime(self.config.__file__)
+        # 直播源URL -> 分类 -> [ChannelRecord]，以及每个直播源下次刷新的时间
+        self.source_channels = {}
+        self.next_due = {}
+        self.matcher = None
+        # (分类, 频道) -> 匹配到的在线频道名称
+        self.matched_names = {}
+        # 分类 -> 频道 -> URL 列表，分别为测速前和写入播放列表的结果
+        self.matched_channels = OrderedDict()
+        self.channels = OrderedDict()
+        self.classifier = UrlClassifier(self.config.url_blacklist)
+        self.next_probe = 0
+        self.next_epg = 0
+        self.playlist_names = None
+        self._stop = threading.Event()
+
+    def reload_template(self):
+        """demo.txt 修改后重新解析，返回是否重新加载"""
+        mtime = _mtime(self.template_file)
+        if mtime == self.template_mtime:
+            return False
+        self.template_channels = self.pipeline.parse_template(self.template_file)
+        self.template_mtime = mtime
+        logging.info(f"已加载模板 {self.template_file}，共 {sum(map(len, self.template_channels.values()))} 个频道")
+        return True
+
+    def reload_config(self):
+        """config.py 修改后重新加载，移除不再配置的直播源，新增的直播源立即抓取；返回是否重新加载"""
+        mtime = _mtime(self.config.__file__)
+        if mtime == self.config_mtime:
+            return False
+        self.config_mtime = mtime
+        try:
+            importlib.reload(self.config)
+        except Exception as e:
+            # 文件可能正在编辑中，等下次修改后再重试
+            logging.error(f"重新加载配置失败，继续使用当前配置: {e}")
+            return False
+        self.classifier = UrlClassifier(self.config.url_blacklist)
+        source_urls = set(self.config.source_urls)
+        for url in [url for url in self.source_channels if url not in source_urls]:
+            del self.source_channels[url]
+            self.next_due.pop(url, None)
+            logging.info(f"url: {url} 已从配置中移除")
+        logging.info("配置已重新加载")
+        return True
+
+    def schedule(self, url, now):
+        """按直播源自己的间隔安排下次刷新，加入随机抖动"""
+        interval = self.config.DAEMON_SOURCE_INTERVALS.get(url, self.config.DAEMON_SOURCE_INTERVAL)
+        jitter = self.config.DAEMON_JITTER
+        self.next_due[url] = now + interval * (1 + self.rng.uniform(-jitter, jitter))
+
+    def due_sources(self, now):
+        return [url for url in self.config.source_urls if self.next_due.get(url, 0) <= now]
+
+    def refresh_sources(self, source_urls):
+        """抓取到期的直播源，返回内容有变化的直播源中涉及的频道名称"""
+        changed_names = set()
+        for url, channels in zip(source_urls, self.pipeline.fetch_all_sources(source_urls)):
+            previous = self.source_channels.get(url)
+            if not channels and previous and metrics.sources.get(url, {}).get("status") in FAILED_STATUSES:
+                logging.warning(f"url: {url} 本次抓取失败，保留上一次的频道")
+                continue
+            self.source_channels[url] = channels
+            if channels != (previous or {}):
+                changed_names |= record_names(previous) | record_names(channels)
+                logging.info(f"url: {url} 内容有变化")
+        return changed_names
+
+    def merged_channels(self):
+        """按配置顺序合并各直播源的频道，不修改常驻的直播源字典"""
+        all_channels = OrderedDict()
+        for url in self.config.source_urls:
+            for category, channel_list in self.source_channels.get(url, {}).items():
+                all_channels.setdefault(category, []).extend(channel_list)
+        return all_channels
+
+    def rematch(self, changed_names, full):
+        """
+        更新匹配结果，返回受影响的 (分类, 频道) 集合
+        名称集合不变时沿用匹配器索引，只有匹配到变化名称的模板频道受影响；名称有增删时重建索引，
+        模糊匹配结果可能改变，全部模板频道重新匹配，结果有变化的才算受影响
+        """
+        all_channels = self.merged_channels()
+        alias_index = self.pipeline.get_alias_index()
+        reuse = (not full and self.matcher is not None and self.matcher.alias_index is alias_index
+                 and self.matcher.update(all_channels))
+        if not reuse:
+            self.matcher = ChannelMatcher(all_channels, cutoff=0.6, alias_index=alias_index)
+
+        affected = set()
+        matched_names = {}
+        matched_channels = OrderedDict()
+        for category, channel_list in self.template_channels.items():
+            matched_channels[category] = OrderedDict()
+            for channel_name in channel_list:
+                key = (category, channel_name)
+                previous = self.matched_names.get(key)
+                if reuse:
+                    names = previous or ()
+                else:
+                    names = tuple(self.matcher.match_names(channel_name))
+                if full or names != previous or changed_names.intersection(names):
+                    affected.add(key)
+                matched_names[key] = names
+                urls = [url for name in names for url in self.matcher.urls(name)]
+                if urls:
+                    matched_channels[category].setdefault(channel_name, []).extend(urls)
+                    metrics.count("channels_matched")
+                    metrics.count("urls_matched", len(urls))
+                else:
+                    metrics.count("channels_unmatched")
+
+        # 模板中已删除的频道也要从播放列表中移除
+        affected.update(key for key in self.matched_names if key not in matched_names)
+        self.matched_names = matched_names
+        self.matched_channels = matched_channels
+        return affected
+
+    def probe(self, affected):
+        """只对受影响的频道测速，结果并入常驻的播放列表频道"""
+        subset = OrderedDict()
+        for category, channel_name in affected:
+            urls = self.matched_channels.get(category, {}).get(channel_name)
+            if urls:
+                subset.setdefault(category, OrderedDict())[channel_name] = urls
+        probed = self.pipeline.probe_channels(subset, self.classifier) if subset else {}
+        for category, channel_name in affected:
+            urls = probed.get(category, {}).get(channel_name)
+            category_channels = self.channels.setdefault(category, OrderedDict())
+            if urls:
+                category_channels[channel_name] = urls
+            else:
+                category_channels.pop(channel_name, None)
+
+    def cycle(self, now):
+        """执行一轮检查，有内容变化或到期任务时更新输出，返回是否执行了更新"""
+        metrics.reset()
+        full = self.reload_config()
+        full = self.reload_template() or full
+
+        changed_names = set()
+        due = self.due_sources(now)
+        if due:
+            with metrics.stage("fetch"):
+                changed_names = self.refresh_sources(due)
+            for url in due:
+                self.schedule(url, now)
+
+        probe_all = self.config.SPEED_TEST_ENABLED and now >= self.next_probe
+        epg_due = self.config.EPG_MERGE_ENABLED and now >= self.next_epg
+        if not (full or changed_names or probe_all or epg_due):
+            return False
+
+        with metrics.stage("match"):
+            affected = self.rematch(changed_names, full)
+        if probe_all:
+            affected = set(self.matched_names) | affected
+            self.next_probe = now + self.config.DAEMON_PROBE_INTERVAL
+        if affected:
+            if self.config.SPEED_TEST_ENABLED:
+                with metrics.stage("probe"):
+                    self.probe(affected)
+            else:
+                self.channels = self.matched_channels
+            logging.info(f"本轮更新 {len(affected)} 个频道")
+            with metrics.stage("write"):
+                self.pipeline.updateChannelUrlsM3U(self.channels, self.template_channels, self.classifier)
+
+        if self.config.EPG_MERGE_ENABLED:
+            playlist_names = self.pipeline.playlist_channel_names(self.channels, self.template_channels)
+            if epg_due or playlist_names != self.playlist_names:
+                with metrics.stage("epg"):
+                    self.pipeline.update_epg(self.channels, self.template_channels)
+                self.playlist_names = playlist_names
+                self.next_epg = now + self.config.DAEMON_EPG_INTERVAL
+        self.pipeline.write_run_report()
+        return True
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        """主循环，收到 SIGINT / SIGTERM 后在当前一轮结束时退出"""
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self.stop())
+        logging.info(f"常驻模式已启动，共 {len(self.config.source_urls)} 个直播源")
+        while not self._stop.is_set():
+            try:
+                self.cycle(time.time())
+            except Exception:
+                logging.exception("本轮刷新失败，等待下一轮")
+            self._stop.wait(self.config.DAEMON_TICK)
+        logging.info("常驻模式已退出")
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
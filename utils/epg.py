@@ -0,0 +1,183 @@
+"""
+节目单(EPG)聚合模块
+流式解析多个 XMLTV 源（增量解析并及时清理已处理元素，内存占用恒定），
+只保留播放列表中实际写入的频道及其节目，按时间窗口裁剪，
+合并去重后写出一个 gzip 压缩的节目单。
+"""
+import gzip
+import io
+import logging
+import os
+import re
+import tempfile
+import zlib
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+# XMLTV 时间缺少时区时按北京时间处理
+DEFAULT_TIMEZONE = timezone(timedelta(hours=8))
+NAME_NOISE_PATTERN = re.compile(r'[\s\-_]')
+
+
+def normalize_epg_name(name):
+    """节目单频道名称归一化：去掉空白、'-'、'_'并转为大写"""
+    return NAME_NOISE_PATTERN.sub('', name or '').upper()
+
+
+def parse_xmltv_time(value):
+    """解析 XMLTV 时间（如 20250520120000 +0800），无法解析时返回 None"""
+    value = (value or '').strip()
+    try:
+        if len(value) > 14:
+            return datetime.strptime(value, "%Y%m%d%H%M%S %z")
+        return datetime.strptime(value[:14], "%Y%m%d%H%M%S").replace(tzinfo=DEFAULT_TIMEZONE)
+    except ValueError:
+        return None
+
+
+def iter_epg_chunks(response, chunk_size=64 * 1024):
+    """按块读取节目单正文，自动解压 gzip 压缩的 .xml.gz 文件"""
+    decompressor = None
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if not chunk:
+            continue
+        if decompressor is None:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) if chunk[:2] == b'\x1f\x8b' else False
+        yield decompressor.decompress(chunk) if decompressor else chunk
+
+
+class EpgAggregator:
+    """合并多个 XMLTV 源：每个输出频道只采用最先提供它的源，节目按 (频道, 开始时间) 去重"""
+
+    def __init__(self, channel_ids, past_hours, future_hours, now=None, alias_index=None, canonical_ids=None):
+        # channel_ids: 归一化名称 -> 输出频道ID；canonical_ids: 别名索引规范ID -> 输出频道ID
+        self.channel_ids = channel_ids
+        self.alias_index = alias_index
+        self.canonical_ids = canonical_ids or {}
+        now = now or datetime.now(DEFAULT_TIMEZONE)
+        self.window_start = now - timedelta(hours=past_hours)
+        self.window_end = now + timedelta(hours=future_hours)
+        self.claimed = set()
+        self.channel_elements = []
+        self.programme_keys = set()
+        self.programme_count = 0
+
+    def resolve(self, channel):
+        """根据频道ID和显示名称查找对应的输出频道ID"""
+        candidates = [channel.get("id")] + [item.text for item in channel.findall("display-name")]
+        for candidate in candidates:
+            channel_id = self.channel_ids.get(normalize_epg_name(candidate))
+            if channel_id:
+                return channel_id
+        if self.alias_index is not None:
+            for candidate in candidates:
+                channel_id = self.canonical_ids.get(self.alias_index.resolve(candidate))
+                if channel_id:
+                    return channel_id
+        return None
+
+    def consume(self, chunks, programme_file):
+        """增量解析一个 XMLTV 源，频道暂存于内存，节目直接写入 programme_file"""
+        parser = ET.XMLPullParser(events=("start", "end"))
+        self._root = None
+        self._id_map = {}
+        for chunk in chunks:
+            parser.feed(chunk)
+            self._handle_events(parser.read_events(), programme_file)
+        parser.close()
+        self._handle_events(parser.read_events(), programme_file)
+
+    def _handle_events(self, events, programme_file):
+        id_map = self._id_map
+        for event, elem in events:
+            if event == "start":
+                if self._root is None:
+                    self._root = elem
+                continue
+            if elem.tag == "channel":
+                channel_id = self.resolve(elem)
+                if channel_id and channel_id not in self.claimed:
+                    self.claimed.add(channel_id)
+                    id_map[elem.get("id")] = channel_id
+                    elem.set("id", channel_id)
+                    elem.tail = "\n"
+                    self.channel_elements.append(ET.tostring(elem, encoding="unicode"))
+                self._root.clear()
+            elif elem.tag == "programme":
+                channel_id = id_map.get(elem.get("channel"))
+                if channel_id and self._in_window(elem):
+                    key = (channel_id, elem.get("start"))
+                    if key not in self.programme_keys:
+                        self.programme_keys.add(key)
+                        elem.set("channel", channel_id)
+                        elem.tail = "\n"
+                        programme_file.write(ET.tostring(elem, encoding="unicode"))
+                        self.programme_count += 1
+                self._root.clear()
+
+    def _in_window(self, programme):
+        start = parse_xmltv_time(programme.get("start"))
+        stop = parse_xmltv_time(programme.get("stop")) or start
+        if start is None:
+            return False
+        return stop >= self.window_start and start <= self.window_end
+
+
+def build_epg(channel_names, epg_urls, output_path, past_hours=6, future_hours=48, timeout=60,
+              channel_ids=None, alias_index=None):
+    """
+    从 epg_urls 合并节目单，只保留 channel_names 中的频道，写出 gzip 压缩的 XMLTV
+    channel_ids 可指定 名称 -> 输出频道ID 的映射，默认使用频道名称本身作为ID
+    传入 alias_index 时，节目单中的频道名称也会通过别名解析后再匹配
+    没有收集到任何频道或节目时不写出，保留 output_path 原有的节目单
+    返回 (频道数, 节目数)
+    """
+    channel_ids = channel_ids or {}
+    wanted = {}
+    canonical_ids = {}
+    for name in channel_names:
+        channel_id = channel_ids.get(name, name)
+        wanted.setdefault(normalize_epg_name(name), channel_id)
+        if alias_index is not None:
+            canonical_id = alias_index.resolve(name)
+            if canonical_id:
+                canonical_ids.setdefault(canonical_id, channel_id)
+    aggregator = EpgAggregator(wanted, past_hours, future_hours,
+                               alias_index=alias_index, canonical_ids=canonical_ids)
+
+    output_dir = os.path.dirname(output_path) or "."
+    with tempfile.TemporaryFile("w+", encoding="utf-8", dir=output_dir) as programme_file:
+        with requests.Session() as session:
+            for url in epg_urls:
+                before = (len(aggregator.claimed), aggregator.programme_count)
+                try:
+                    with session.get(url, stream=True, timeout=timeout) as response:
+                        response.raise_for_status()
+                        aggregator.consume(iter_epg_chunks(response), programme_file)
+                except (requests.RequestException, ET.ParseError, OSError, zlib.error) as e:
+                    logging.error(f"节目单: {url} 失败❌, Error: {e}")
+                logging.info(f"节目单: {url} 新增频道 {len(aggregator.claimed) - before[0]} 个，"
+                             f"节目 {aggregator.programme_count - before[1]} 条")
+
+        if not aggregator.claimed or not aggregator.programme_count:
+            # 节目单源全部失败或没有匹配的频道时，保留上次生成的节目单，避免覆盖成空的 <tv/>
+            logging.warning(f"节目单: 未收集到任何频道或节目，保留原有节目单 {output_path}")
+            return len(aggregator.claimed), aggregator.programme_count
+
+        # XMLTV 要求频道定义在节目之前，频道先写出，再拼接暂存的节目
+        temp_path = f"{output_path}.tmp"
+        with open(temp_path, "wb") as raw_file, \
+                gzip.GzipFile(filename="", mode="wb", fileobj=raw_file, mtime=0) as gzip_file, \
+                io.TextIOWrapper(gzip_file, encoding="utf-8") as out:
+            out.write('<?xml version="1.0" encoding="UTF-8"?>\n<tv generator-info-name="iptv_api">\n')
+            out.writelines(aggregator.channel_elements)
+            programme_file.seek(0)
+            for chunk in iter(lambda: programme_file.read(64 * 1024), ""):
+                out.write(chunk)
+            out.write("</tv>\n")
+        os.replace(temp_path, output_path)
+
+    logging.info(f"节目单已生成: {output_path}，频道 {len(aggregator.claimed)} 个，节目 {aggregator.programme_count} 条")
+    return len(aggregator.claimed), aggregator.programme_count
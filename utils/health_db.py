@@ -0,0 +1,171 @@
+"""
+URL健康度数据库
+使用 SQLite 保存每个URL的测速历史（最近成功时间、滚动平均延迟/吞吐量、连续失败次数），
+据此跳过近期健康的URL、对持续失败的URL指数退避，并用历史可靠性修正排序。
+"""
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from utils.speed_test import SpeedTestResult, compute_score
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS url_health (
+    url TEXT PRIMARY KEY,
+    last_seen REAL,
+    last_probe REAL,
+    last_success REAL,
+    next_probe REAL,
+    consecutive_failures INTEGER NOT NULL DEFAULT 0,
+    probe_count INTEGER NOT NULL DEFAULT 0,
+    success_count INTEGER NOT NULL DEFAULT 0,
+    latency_avg REAL,
+    throughput_avg REAL,
+    score_avg REAL,
+    resolution TEXT
+)
+"""
+
+
+class HealthDB:
+    """URL健康度存储与测速调度"""
+
+    def __init__(self, path: str, healthy_ttl: float, backoff_base: float, backoff_max: float,
+                 alpha: float = 0.3, retention: float = 30 * 24 * 3600):
+        self.healthy_ttl = healthy_ttl
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.alpha = alpha  # 滚动平均的平滑系数
+        self.retention = retention  # 超过该时间未出现的URL将被清理
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.commit()
+        self.conn.close()
+
+    def _rows(self, urls: List[str]) -> Dict[str, sqlite3.Row]:
+        rows = {}
+        for offset in range(0, len(urls), 500):
+            batch = urls[offset:offset + 500]
+            placeholders = ",".join("?" * len(batch))
+            for row in self.conn.execute(f"SELECT * FROM url_health WHERE url IN ({placeholders})", batch):
+                rows[row["url"]] = row
+        return rows
+
+    def plan(self, urls: Iterable[str], now: Optional[float] = None) -> Tuple[List[str], List[str]]:
+        """
+        划分需要测速和可以跳过的URL
+        返回 (待测URL列表, 跳过的URL列表)，待测列表中可疑URL（近期失败过）排在最前
+        """
+        now = now or time.time()
+        urls = list(urls)
+        rows = self._rows(urls)
+        due, skipped = [], []
+        for url in urls:
+            row = rows.get(url)
+            if row is None or (row["next_probe"] or 0) <= now:
+                due.append(url)
+            else:
+                skipped.append(url)
+
+        def priority(url):
+            row = rows.get(url)
+            if row is None:
+                return 1
+            return 0 if row["consecutive_failures"] else 2
+
+        due.sort(key=priority)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO url_health (url, last_seen) VALUES (?, ?) "
+                "ON CONFLICT(url) DO UPDATE SET last_seen = excluded.last_seen",
+                [(url, now) for url in urls],
+            )
+        return due, skipped
+
+    def record(self, results: Iterable[SpeedTestResult], now: Optional[float] = None) -> None:
+        """写入本次测速结果，更新滚动统计和下次测速时间"""
+        now = now or time.time()
+        results = list(results)
+        rows = self._rows([result.url for result in results])
+        updates = []
+        for result in results:
+            row = rows.get(result.url)
+            failures = row["consecutive_failures"] if row else 0
+            if result.success:
+                failures = 0
+                next_probe = now + self.healthy_ttl
+                last_success = now
+                latency = self._average(row, "latency_avg", result.latency)
+                throughput = self._average(row, "throughput_avg", result.throughput)
+                score = self._average(row, "score_avg", result.score if result.score is not None else compute_score(result))
+                resolution = result.resolution or (row["resolution"] if row else None)
+            else:
+                failures += 1
+                next_probe = now + min(self.backoff_base * 2 ** (failures - 1), self.backoff_max)
+                last_success = row["last_success"] if row else None
+                latency = row["latency_avg"] if row else None
+                throughput = row["throughput_avg"] if row else None
+                score = row["score_avg"] if row else None
+                resolution = row["resolution"] if row else None
+            updates.append((
+                result.url, now, now, last_success, next_probe, failures, int(result.success),
+                latency, throughput, score, resolution,
+            ))
+        with self.conn:
+            self.conn.executemany(
+                """
+                INSERT INTO url_health (url, last_seen, last_probe, last_success, next_probe,
+                    consecutive_failures, probe_count, success_count,
+                    latency_avg, throughput_avg, score_avg, resolution)
+                VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    last_seen = excluded.last_seen,
+                    last_probe = excluded.last_probe,
+                    last_success = excluded.last_success,
+                    next_probe = excluded.next_probe,
+                    consecutive_failures = excluded.consecutive_failures,
+                    probe_count = url_health.probe_count + 1,
+                    success_count = url_health.success_count + excluded.success_count,
+                    latency_avg = excluded.latency_avg,
+                    throughput_avg = excluded.throughput_avg,
+                    score_avg = excluded.score_avg,
+                    resolution = excluded.resolution
+                """,
+                updates,
+            )
+            self.conn.execute("DELETE FROM url_health WHERE last_seen < ?", (now - self.retention,))
+
+    def _average(self, row: Optional[sqlite3.Row], column: str, value: Optional[float]) -> Optional[float]:
+        previous = row[column] if row else None
+        if value is None:
+            return previous
+        if previous is None:
+            return value
+        return previous * (1 - self.alpha) + value * self.alpha
+
+    def results(self, urls: Iterable[str]) -> Dict[str, SpeedTestResult]:
+        """根据历史记录生成测速结果，评分按历史可靠性加权"""
+        urls = list(urls)
+        rows = self._rows(urls)
+        results = {}
+        for url in urls:
+            row = rows.get(url)
+            result = SpeedTestResult(url=url)
+            if row is not None and row["probe_count"]:
+                result.success = row["consecutive_failures"] == 0 and row["last_success"] is not None
+                result.latency = row["latency_avg"]
+                result.ttfb = row["latency_avg"]
+                result.throughput = row["throughput_avg"]
+                result.resolution = row["resolution"]
+                result.test_time = row["last_probe"] or 0
+                if result.success and row["score_avg"] is not None:
+                    # 拉普拉斯平滑后的成功率，避免单次样本得到极端可靠性
+                    reliability = (row["success_count"] + 1) / (row["probe_count"] + 2)
+                    result.score = row["score_avg"] * reliability
+                if not result.success:
+                    result.error = f"连续失败 {row['consecutive_failures']} 次"
+            results[url] = result
+        return results
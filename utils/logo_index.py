@@ -0,0 +1,119 @@
+"""
+台标索引模块
+一次扫描台标目录，建立 归一化名称 -> 台标文件 的映射（结合别名索引中的 epgid/logo），
+扫描结果按目录修改时间缓存；内容相同的图片合并为同一个文件，
+可选地生成统一尺寸、重新压缩的小图供机顶盒使用（需要 Pillow）。
+"""
+import hashlib
+import json
+import logging
+import os
+from urllib.parse import quote
+
+from utils.alias_index import normalize_alias
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow 为可选依赖，未安装时不生成压缩台标
+    Image = None
+
+CACHE_VERSION = 1
+LOGO_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+
+
+class LogoIndex:
+    """台标文件索引"""
+
+    def __init__(self, logos, files):
+        self.logos = logos  # 归一化名称 -> 台标相对路径
+        self.files = files  # 台标相对路径 -> 内容哈希
+
+    @classmethod
+    def scan(cls, directories):
+        """扫描台标目录，靠前目录中的同名台标优先；内容相同的文件统一指向第一个"""
+        logos = {}
+        files = {}
+        path_by_hash = {}
+        for directory in directories:
+            if not os.path.isdir(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                stem, extension = os.path.splitext(filename)
+                if extension.lower() not in LOGO_EXTENSIONS:
+                    continue
+                path = f"{directory}/{filename}"
+                with open(path, "rb") as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()
+                canonical_path = path_by_hash.setdefault(digest, path)
+                files[canonical_path] = digest
+                logos.setdefault(normalize_alias(stem), canonical_path)
+        return cls(logos, files)
+
+    @classmethod
+    def load(cls, directories, cache_path):
+        """加载台标索引，目录修改时间未变化时直接使用缓存"""
+        signature = {directory: os.path.getmtime(directory) for directory in directories if os.path.isdir(directory)}
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached.get("version") == CACHE_VERSION and cached.get("signature") == signature:
+                return cls(cached["logos"], cached["files"])
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = cls.scan(directories)
+        try:
+            os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+            with open(f"{cache_path}.tmp", "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "signature": signature,
+                           "logos": index.logos, "files": index.files}, f, ensure_ascii=False)
+            os.replace(f"{cache_path}.tmp", cache_path)
+        except OSError as e:
+            logging.warning(f"台标索引缓存写入失败: {e}")
+        return index
+
+    def find(self, channel_name, alias_index=None):
+        """查找频道台标的相对路径：先按 epgid 对应的台标名，再按 epgid，最后按频道名称"""
+        candidates = []
+        if alias_index is not None:
+            epgid = alias_index.resolve(channel_name)
+            if epgid:
+                candidates.append(alias_index.logos.get(epgid, epgid))
+                candidates.append(epgid)
+        candidates.append(channel_name)
+        for candidate in candidates:
+            path = self.logos.get(normalize_alias(candidate))
+            if path:
+                return path
+        return None
+
+    def optimize(self, output_dir, max_size):
+        """
+        生成最长边不超过 max_size 的压缩台标，文件名为内容哈希
+        返回 原路径 -> 压缩后路径；未安装 Pillow 时返回空字典
+        """
+        if Image is None:
+            logging.warning("未安装 Pillow，跳过台标压缩")
+            return {}
+        os.makedirs(output_dir, exist_ok=True)
+        optimized = {}
+        for path, digest in self.files.items():
+            target = f"{output_dir}/{digest[:16]}.png"
+            if not os.path.exists(target):
+                try:
+                    with Image.open(path) as image:
+                        image.thumbnail((max_size, max_size))
+                        if image.mode not in ("RGBA", "LA"):
+                            image = image.convert("RGBA")
+                        image.save(f"{target}.tmp", format="PNG", optimize=True)
+                    os.replace(f"{target}.tmp", target)
+                except OSError as e:
+                    logging.warning(f"台标压缩失败: {path}, Error: {e}")
+                    continue
+            optimized[path] = target
+        return optimized
+
+
+def logo_url(base_url, path):
+    """拼接台标访问地址，文件名中的中文和空格做 URL 编码"""
+    return f"{base_url.rstrip('/')}/{quote(path)}"
@@ -0,0 +1,130 @@
+"""
+频道匹配模块
+对抓取到的频道名称建立倒排索引：能经别名索引归一到规范ID的名称按ID字典查找，
+其余名称精确命中 O(1) 查找，仅对剩下的名称做模糊匹配，并在相似度计算前按长度和字符重叠剪枝。
+模糊匹配结果与 difflib.get_close_matches(name, names, n=1, cutoff) 完全一致。
+"""
+from collections import OrderedDict, defaultdict
+from difflib import SequenceMatcher
+
+
+class ChannelMatcher:
+    """频道名称索引：名称 -> URL 列表，附带长度分桶和字符倒排索引；all_channels 为 分类 -> [ChannelRecord]"""
+
+    def __init__(self, all_channels, cutoff=0.6, alias_index=None):
+        self.cutoff = cutoff
+        self.alias_index = alias_index
+        self.urls_by_name = index_urls_by_name(all_channels)
+
+        # 规范ID -> 在线频道名称列表（按首次出现顺序）
+        self.names_by_id = OrderedDict()
+        if alias_index is not None:
+            for name in self.urls_by_name:
+                canonical_id = alias_index.resolve(name)
+                if canonical_id:
+                    self.names_by_id.setdefault(canonical_id, []).append(name)
+
+        self.names = list(self.urls_by_name)
+        self._names_by_length = defaultdict(list)
+        self._char_index = defaultdict(list)
+        for name_id, name in enumerate(self.names):
+            self._names_by_length[len(name)].append(name_id)
+            for char, count in _char_counts(name).items():
+                self._char_index[char].append((name_id, count))
+        self._cache = {}
+
+    def find(self, target_name):
+        """返回与目标名称最相似的在线频道名称，未找到时返回 None"""
+        if target_name in self.urls_by_name:
+            return target_name
+        if target_name not in self._cache:
+            self._cache[target_name] = self._fuzzy_find(target_name)
+        return self._cache[target_name]
+
+    def match_names(self, target_name):
+        """
+        返回模板频道匹配到的在线频道名称列表
+        能通过别名索引解析为规范ID时，取所有同ID的在线频道；否则退回名称匹配
+        """
+        if self.alias_index is not None:
+            canonical_id = self.alias_index.resolve(target_name)
+            if canonical_id in self.names_by_id:
+                return self.names_by_id[canonical_id]
+        similar_name = self.find(target_name)
+        return [similar_name] if similar_name else []
+
+    def match_urls(self, target_name):
+        """返回模板频道对应的全部URL（按匹配名称的顺序合并）"""
+        urls = []
+        for name in self.match_names(target_name):
+            urls.extend(self.urls_by_name[name])
+        return urls
+
+    def update(self, all_channels):
+        """
+        用新的抓取结果替换 名称 -> URL 列表
+        名称及其顺序不变时保留规范ID分组、倒排索引和模糊匹配缓存并返回 True；名称有增删时返回 False，调用方应重建匹配器
+        """
+        urls_by_name = index_urls_by_name(all_channels)
+        if list(urls_by_name) != self.names:
+            return False
+        self.urls_by_name = urls_by_name
+        return True
+
+    def urls(self, name):
+        """返回指定在线频道名称的全部URL（保持抓取顺序）"""
+        return self.urls_by_name.get(name, [])
+
+    def _fuzzy_find(self, target_name):
+        target_length = len(target_name)
+        if not target_length or not self.names:
+            return None
+
+        # 相似度 2M/(la+lb) 不超过 2*min(la,lb)/(la+lb)（即 real_quick_ratio），据此限定候选名称的长度范围；
+        # 按与 difflib 相同的浮点表达式逐个长度判断，恰好等于阈值的长度不会因舍入误差被排除
+        cutoff = self.cutoff
+        candidate_lengths = {
+            length for length in self._names_by_length
+            if 2.0 * min(length, target_length) / (length + target_length) >= cutoff
+        }
+
+        # 统计每个候选与目标的字符多重集交集大小，即 quick_ratio 的分子
+        overlaps = defaultdict(int)
+        for char, target_count in _char_counts(target_name).items():
+            for name_id, count in self._char_index.get(char, ()):
+                overlaps[name_id] += min(target_count, count)
+
+        matcher = SequenceMatcher()
+        matcher.set_seq2(target_name)
+        best = None
+        for name_id, overlap in overlaps.items():
+            name = self.names[name_id]
+            total_length = target_length + len(name)
+            if len(name) not in candidate_lengths or 2.0 * overlap / total_length < cutoff:
+                continue
+            matcher.set_seq1(name)
+            score = matcher.ratio()
+            # 与 get_close_matches 的 heapq.nlargest 规则一致：分数相同时取字符串较大者
+            if score >= cutoff and (best is None or (score, name) > best):
+                best = (score, name)
+
+        return best[1] if best else None
+
+
+def index_urls_by_name(all_channels):
+    """在线频道名称 -> URL 列表（按抓取顺序）"""
+    urls_by_name = OrderedDict()
+    for channel_list in all_channels.values():
+        for record in channel_list:
+            urls = urls_by_name.get(record.name)
+            if urls is None:
+                urls = urls_by_name[record.name] = []
+            urls.append(record.url)
+    return urls_by_name
+
+
+def _char_counts(text):
+    counts = defaultdict(int)
+    for char in text:
+        counts[char] += 1
+    return counts
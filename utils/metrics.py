@@ -0,0 +1,182 @@
+"""
+运行指标模块
+记录一次运行中各阶段的耗时和 CPU 时间、每个直播源的下载字节数/解析行数/有效线路数、
+匹配与筛选的计数，以及测速延迟直方图；运行结束后写出 JSON 报告，可选写出 Prometheus 文本格式。
+"""
+import json
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from utils.output_writer import write_atomic
+
+# 测速延迟直方图的桶上界（毫秒）
+LATENCY_BUCKETS = (50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+class Histogram:
+    """固定分桶直方图，桶计数不累计，导出 Prometheus 格式时再累加"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        bounds = [str(bucket) for bucket in self.buckets] + ["+Inf"]
+        return {"buckets": dict(zip(bounds, self.counts)), "sum": round(self.sum, 3), "count": self.count}
+
+
+class RunMetrics:
+    """一次运行的全部指标，抓取线程会并发写入，修改均在锁内进行"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """清空全部指标，常驻模式每轮刷新前调用，各模块持有的 metrics 引用保持有效"""
+        with self._lock:
+            self.started_at = time.time()
+            self.stages = OrderedDict()
+            self.sources = OrderedDict()
+            self.counters = OrderedDict()
+            self.histograms = OrderedDict()
+            self.probe_outcomes = None
+            self._source_urls = {}
+
+    @contextmanager
+    def stage(self, name):
+        """记录一个阶段的墙钟时间和进程 CPU 时间"""
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.stages[name] = {
+                    "wall_seconds": round(time.perf_counter() - wall_start, 4),
+                    "cpu_seconds": round(time.process_time() - cpu_start, 4),
+                }
+
+    def source(self, url, **fields):
+        """更新直播源的统计字段，如 status、elapsed_seconds"""
+        with self._lock:
+            self.sources.setdefault(url, {"bytes": 0, "lines": 0}).update(fields)
+
+    def count_bytes(self, url, chunks):
+        """包装字节块迭代器，统计直播源的下载字节数"""
+        self.source(url)
+        record = self.sources[url]
+        for chunk in chunks:
+            record["bytes"] += len(chunk)
+            yield chunk
+
+    def count_lines(self, url, lines):
+        """包装文本行迭代器，统计直播源解析的行数"""
+        self.source(url)
+        record = self.sources[url]
+        for line in lines:
+            record["lines"] += 1
+            yield line
+
+    def source_channels(self, url, channels):
+        """记录直播源解析出的频道条目数，并保存其线路集合用于统计有效线路"""
+        self.source(url, records=sum(len(channel_list) for channel_list in channels.values()))
+        with self._lock:
+            self._source_urls[url] = {record.url for channel_list in channels.values() for record in channel_list}
+
+    def source_url_sets(self):
+        """直播源 -> 本次解析出的线路集合"""
+        with self._lock:
+            return dict(self._source_urls)
+
+    def record_probes(self, outcomes):
+        """记录测速结论：去重键 -> 是否可用，用于统计各直播源线路的测速成功率"""
+        with self._lock:
+            self.probe_outcomes = dict(outcomes)
+
+    def attribute_urls(self, written_urls):
+        """统计每个直播源有多少条线路最终写入了播放列表"""
+        for url, channel_urls in self._source_urls.items():
+            self.source(url, usable_urls=len(channel_urls & written_urls))
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS):
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def report(self):
+        return OrderedDict([
+            ("started_at", round(self.started_at, 3)),
+            ("finished_at", round(time.time(), 3)),
+            ("stages", self.stages),
+            ("sources", self.sources),
+            ("counters", self.counters),
+            ("histograms", OrderedDict((name, histogram.to_dict()) for name, histogram in self.histograms.items())),
+        ])
+
+    def write_json(self, path):
+        write_atomic(path, json.dumps(self.report(), ensure_ascii=False, indent=2))
+
+    def write_prometheus(self, path, prefix="iptv"):
+        """写出 Prometheus 文本格式（供 node_exporter textfile 收集器读取）"""
+        lines = []
+
+        def metric(name, metric_type, help_text, samples):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {metric_type}")
+            for labels, value in samples:
+                lines.append(f"{prefix}_{name}{_format_labels(labels)} {value}")
+
+        metric("run_timestamp_seconds", "gauge", "Run start time.", [({}, round(self.started_at, 3))])
+        metric("stage_wall_seconds", "gauge", "Wall time per pipeline stage.",
+               [({"stage": name}, stage["wall_seconds"]) for name, stage in self.stages.items()])
+        metric("stage_cpu_seconds", "gauge", "CPU time per pipeline stage.",
+               [({"stage": name}, stage["cpu_seconds"]) for name, stage in self.stages.items()])
+        for field, help_text in (("bytes", "Bytes downloaded per source."),
+                                 ("lines", "Lines parsed per source."),
+                                 ("records", "Channel records parsed per source."),
+                                 ("usable_urls", "URLs per source written to the playlists.")):
+            metric(f"source_{field}", "gauge", help_text,
+                   [({"source": url}, record[field]) for url, record in self.sources.items() if field in record])
+        for name, value in self.counters.items():
+            metric(name, "gauge", f"Run counter {name}.", [({}, value)])
+        for name, histogram in self.histograms.items():
+            lines.append(f"# HELP {prefix}_{name} Histogram {name}.")
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            cumulative = 0
+            for bound, count in zip([str(bucket) for bucket in histogram.buckets] + ["+Inf"], histogram.counts):
+                cumulative += count
+                lines.append(f"{prefix}_{name}_bucket{_format_labels({'le': bound})} {cumulative}")
+            lines.append(f"{prefix}_{name}_sum {round(histogram.sum, 3)}")
+            lines.append(f"{prefix}_{name}_count {histogram.count}")
+        write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# 当前运行的指标，各模块共享
+metrics = RunMetrics()
@@ -0,0 +1,65 @@
+"""
+输出文件写入模块
+在内存中构建输出内容，按忽略易变行（如更新日期）的哈希判断是否变化，
+只对变化的文件写临时文件后用 os.replace 原子替换，客户端不会读到写了一半的文件。
+"""
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+
+class PlaylistBuffer:
+    """内存中的输出文件，记录内容并同步计算稳定哈希"""
+
+    def __init__(self, path):
+        self.path = path
+        self.parts = []
+        self.digest = hashlib.sha256()
+
+    def write(self, text, volatile=False):
+        """写入文本；volatile 为 True 的内容不参与变化判断"""
+        self.parts.append(text)
+        if not volatile:
+            self.digest.update(text.encode("utf-8"))
+
+    def getvalue(self):
+        return "".join(self.parts)
+
+    def stable_hash(self):
+        return self.digest.hexdigest()
+
+
+def commit_outputs(buffers, manifest_path):
+    """
+    将内容有变化的缓冲区原子写入磁盘
+    返回 {文件路径: 是否写入}，稳定哈希记录在 manifest_path 中供下次比较
+    """
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    changes = OrderedDict()
+    for buffer in buffers:
+        key = os.path.basename(buffer.path)
+        stable_hash = buffer.stable_hash()
+        if manifest.get(key) == stable_hash and os.path.exists(buffer.path):
+            changes[buffer.path] = False
+            continue
+        write_atomic(buffer.path, buffer.getvalue())
+        manifest[key] = stable_hash
+        changes[buffer.path] = True
+
+    if any(changes.values()) or not os.path.exists(manifest_path):
+        write_atomic(manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True))
+    return changes
+
+
+def write_atomic(path, content):
+    """先写入同目录临时文件，再原子替换目标文件"""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(temp_path, path)
@@ -3,7 +3,12 @@
 包含模板解析、输入源解析等功能
 """
 import re
-from config import URL_BLACKLIST, IP_VERSION_PRIORITY
+
+import config
+from utils.records import iter_m3u_records, iter_txt_records
+from utils.urls import IPV6_URL_PATTERN, UrlClassifier
+
+VALID_IP_PATTERN = re.compile(r"\b(?:\d{1,3}\.){3}\d{1,3}\b|\[([0-9a-fA-F:]+)\]")
 
 def parse_template(template_path):
     """
@@ -26,51 +31,42 @@ def parse_template(template_path):
     
     return categories
 
-def parse_source_content(content, source_type):
+def parse_source_content(content, source_type, classifier=None):
     """
     解析不同格式的数据源内容（M3U/TXT）
     返回频道名称到URL列表的映射
+    classifier 由调用方传入；未传入时按当前 config.url_blacklist 构建，配置热加载后同样生效
     """
-    channels = {}
+    classifier = classifier or UrlClassifier(config.url_blacklist)
     if source_type == "m3u":
-        return _parse_m3u(content)
+        return _parse_m3u(content, classifier)
     elif source_type == "txt":
-        return _parse_txt(content)
-    return channels
+        return _parse_txt(content, classifier)
+    return {}
 
-def _parse_m3u(content):
-    """解析M3U格式内容"""
-    entries = content.split("#EXTINF:-1,")
-    for entry in entries[1:]:  # 跳过第一个空元素
-        parts = entry.split("\n", 1)
-        channel_name = parts[0].strip()
-        url = parts[1].strip()
-        if not _is_blacklisted(url) and _has_valid_ip(url):
-            _add_channel(channels, channel_name, url)
-    return channels
+def _parse_m3u(content, classifier):
+    """解析M3U格式内容，没有分组的条目同样保留"""
+    return _collect(iter_m3u_records(content.splitlines(), default_category=""), classifier)
+
+def _parse_txt(content, classifier):
+    """解析TXT格式内容（每行格式：频道名,URL），没有分类行的条目同样保留"""
+    return _collect(iter_txt_records(content.splitlines(), default_category=""), classifier)
 
-def _parse_txt(content):
-    """解析TXT格式内容（每行格式：频道名,URL）"""
-    for line in content.splitlines():
-        if "," in line:
-            channel_name, url = line.split(",", 1)
-            channel_name = channel_name.strip()
-            url = url.strip()
-            if not _is_blacklisted(url) and _has_valid_ip(url):
-                _add_channel(channels, channel_name, url)
+def _collect(records, classifier):
+    """过滤黑名单和不含IP地址的URL，按频道名称汇总"""
+    channels = {}
+    for record in records:
+        if not classifier.is_blacklisted(record.url) and _has_valid_ip(record.url):
+            _add_channel(channels, record.name, record.url)
     return channels
 
 def _add_channel(channels, name, url):
     """添加频道到映射，按IP版本分类"""
-    ip_version = "IPV6" if "[" in url else "IPV4"  # 判断IPv6格式
+    ip_version = "IPV6" if IPV6_URL_PATTERN.match(url) else "IPV4"
     if name not in channels:
         channels[name] = {"IPV4": [], "IPV6": []}
     channels[name][ip_version].append(url)
 
-def _is_blacklisted(url):
-    """检查URL是否在黑名单中"""
-    return any(bl in url for bl in URL_BLACKLIST)
-
 def _has_valid_ip(url):
     """检查URL是否包含有效IP地址"""
-    return re.search(r"\b(?:\d{1,3}\.){3}\d{1,3}\b|\[([0-9a-fA-F:]+)\]", url) is not None
+    return VALID_IP_PATTERN.search(url) is not None
@@ -0,0 +1,169 @@
+"""
+多进程分片测速
+单个事件循环只能用满一个核，测速加入播放列表解析、分片下载和码流嗅探后，CPU 先于网络成为瓶颈。
+ShardedSpeedTester 把待测URL按主机分成若干片，每片交给一个独立进程（各自的事件循环和连接池）测速，
+同一主机只在一个进程中，每主机并发限制和连续失败短路照常生效；全局并发上限按进程数均分。
+每测完一个URL，结果即通过该进程的管道发回主进程合并。进程崩溃，或超过 stall_timeout 秒没有发回任何结果
+（视为挂起，强制结束）时，已收到的结果保留，剩余URL由新进程重测；再次异常时对半拆分重测，
+逐步把导致崩溃或挂起的URL隔离出来，超过重启轮数的记为测速失败。
+"""
+import asyncio
+import logging
+import multiprocessing
+import signal
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from multiprocessing.connection import wait
+
+from utils.metrics import metrics
+from utils.speed_test import SpeedTester, SpeedTestResult, rank_key, url_host
+
+# 分片进程异常后最多重启的轮数，超过后剩余URL记为失败
+SHARD_RESTARTS = 5
+
+
+def shard_by_host(urls, shard_count):
+    """按主机分片：URL 多的主机先分配，每次放入当前URL最少的分片"""
+    by_host = OrderedDict()
+    for url in urls:
+        by_host.setdefault(url_host(url), []).append(url)
+    shards = [[] for _ in range(max(1, min(shard_count, len(by_host))))]
+    for host_urls in sorted(by_host.values(), key=len, reverse=True):
+        min(shards, key=len).extend(host_urls)
+    return [shard for shard in shards if shard]
+
+
+def split_shard(urls):
+    """把异常分片一分为二：有多个主机时按主机分，只有一个主机时按URL对半分"""
+    parts = shard_by_host(urls, 2)
+    if len(parts) == 1 and len(urls) > 1:
+        parts = [urls[:len(urls) // 2], urls[len(urls) // 2:]]
+    return parts
+
+
+def _shard_worker(urls, options, conn):
+    """分片进程：测完一个URL发回一个结果字典，全部完成后发送 None"""
+    # 由主进程统一处理中断，SIGTERM 恢复默认行为（常驻模式在主进程中注册了自己的处理函数）
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    async def run():
+        async with SpeedTester(**options) as tester:
+            await tester.batch_speed_test(urls, on_result=lambda result: conn.send(asdict(result)))
+
+    try:
+        asyncio.run(run())
+        conn.send(None)
+    finally:
+        conn.close()
+
+
+class ShardedSpeedTester(SpeedTester):
+    """与 SpeedTester 接口相同，batch_speed_test 分给多个进程执行；本进程的会话仍可用于重定向解析等请求"""
+
+    def __init__(self, processes, stall_timeout=120, **kwargs):
+        super().__init__(**kwargs)
+        self.processes = processes
+        self.stall_timeout = stall_timeout
+
+    def worker_options(self, shard_count):
+        return {
+            "timeout": self.timeout,
+            "concurrent_limit": max(1, -(-self.concurrent_limit // shard_count)),
+            "retry_times": self.retry_times,
+            "probe_mode": self.probe_mode,
+            "per_host_limit": self.per_host_limit,
+        }
+
+    async def batch_speed_test(self, urls, on_result=None):
+        shards = shard_by_host(urls, self.processes)
+        if len(shards) <= 1:
+            return await super().batch_speed_test(urls, on_result)
+        # 等待子进程的循环是阻塞的，放到线程中执行，不占用本进程的事件循环
+        results = await asyncio.get_running_loop().run_in_executor(None, self.run_shards, shards, on_result)
+        return sorted(results, key=rank_key)
+
+    def run_shards(self, shards, on_result=None):
+        """运行全部分片，返回合并后的结果列表（顺序同输入）"""
+        results = {}
+        options = self.worker_options(len(shards))
+        # 本方法在线程池中运行，此时进程里还有事件循环和其他线程，fork 可能继承到被占用的锁，改用 spawn 启动全新的解释器
+        context = multiprocessing.get_context("spawn")
+        running = {}  # 管道 -> _Shard
+
+        def start(index, urls, restarts=0):
+            reader, writer = context.Pipe(duplex=False)
+            process = context.Process(target=_shard_worker, args=(urls, options, writer), daemon=True)
+            process.start()
+            writer.close()  # 只保留子进程中的写端，子进程退出时读端即收到 EOF
+            running[reader] = _Shard(index, process, urls, restarts, time.monotonic())
+
+        def finish(reader, reason=None):
+            shard = running.pop(reader)
+            reader.close()
+            shard.process.join(5)
+            if shard.process.is_alive():
+                shard.process.kill()
+                shard.process.join()
+            remaining = [url for url in shard.urls if url not in results]
+            if shard.done or not remaining:
+                return
+            metrics.count("probe_shards_failed")
+            reason = reason or f"进程退出码 {shard.process.exitcode}"
+            if shard.restarts >= SHARD_RESTARTS or (shard.restarts and len(remaining) == 1):
+                logging.error(f"测速分片 {shard.index} 多次异常（{reason}），剩余 {len(remaining)} 个URL记为失败")
+                for url in remaining:
+                    results[url] = SpeedTestResult(url=url, test_time=time.time(), error=f"测速进程异常: {reason}")
+                    if on_result:
+                        on_result(results[url])
+                return
+            # 首次异常整体重测；再次异常多半是个别URL导致，对半拆开重测，逐步隔离出问题URL
+            parts = [remaining] if not shard.restarts else split_shard(remaining)
+            logging.warning(f"测速分片 {shard.index} 异常（{reason}），已收到 {len(shard.urls) - len(remaining)} 个结果，"
+                            f"剩余 {len(remaining)} 个URL分 {len(parts)} 片重新测速")
+            for part in parts:
+                start(shard.index, part, shard.restarts + 1)
+
+        logging.info(f"分片测速: {sum(map(len, shards))} 个URL分为 {len(shards)} 片，"
+                     f"每片最多 {options['concurrent_limit']} 个并发")
+        for index, urls in enumerate(shards):
+            start(index, urls)
+        while running:
+            for reader in wait(list(running), timeout=1):
+                shard = running[reader]
+                try:
+                    message = reader.recv()
+                except (EOFError, OSError):
+                    finish(reader)  # 进程已退出
+                    continue
+                except Exception as e:
+                    # 进程在发送途中被杀死时可能收到不完整的数据
+                    shard.process.terminate()
+                    finish(reader, f"结果无法读取: {e}")
+                    continue
+                if message is None:
+                    shard.done = True
+                    finish(reader)
+                    continue
+                result = SpeedTestResult(**message)
+                results[result.url] = result
+                shard.last_result = time.monotonic()
+                if on_result:
+                    on_result(result)
+            now = time.monotonic()
+            for reader, shard in list(running.items()):
+                if now - shard.last_result > self.stall_timeout:
+                    shard.process.terminate()
+                    finish(reader, f"{self.stall_timeout} 秒内没有结果")
+        return [results[url] for urls in shards for url in urls]
+
+
+@dataclass
+class _Shard:
+    index: int
+    process: multiprocessing.Process
+    urls: list
+    restarts: int
+    last_result: float
+    done: bool = False
@@ -0,0 +1,198 @@
+"""
+频道记录解析核心
+M3U 和 TXT 直播源统一解析为紧凑的 ChannelRecord（使用 __slots__，不带实例字典），
+频道名称、分类和主机经过字符串驻留，同一频道的多条线路共享同一个字符串对象；
+EXTINF 属性（tvg-id、tvg-logo、group-title、catchup 等）以原始文本完整保留，读取时再解析。
+main.py、utils/parser.py 和 utils/speed_test.py 均使用这里的解析函数。
+"""
+import re
+import sys
+from collections import OrderedDict
+from functools import lru_cache
+
+# 频道名称清洗用到的正则，预编译后在解析热循环中复用
+CLEAN_CHARS_PATTERN = re.compile(r'[$「」-]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+NUMBER_PATTERN = re.compile(r'(\D*)(\d+)')
+EXTINF_ATTR_PATTERN = re.compile(r'([\w-]+)="([^"]*)"')
+HOST_END_PATTERN = re.compile(r'[?#$]')
+EXTINF_PREFIX = "#EXTINF"
+GROUP_TITLE_PREFIX = 'group-title="'
+EXTINF_CACHE_SIZE = 4096
+
+intern = sys.intern
+
+
+def clean_channel_name(channel_name):
+    """频道名称清洗：去掉'$'、「」和'-'及空白字符，数字去前导零，转为大写"""
+    cleaned_name = CLEAN_CHARS_PATTERN.sub('', channel_name)
+    cleaned_name = WHITESPACE_PATTERN.sub('', cleaned_name)
+    cleaned_name = NUMBER_PATTERN.sub(lambda m: m.group(1) + str(int(m.group(2))), cleaned_name)
+    return cleaned_name.upper()
+
+
+def url_host(url):
+    """取URL的主机（含端口）并驻留，不做完整的URL解析"""
+    _, separator, rest = url.partition("://")
+    if not separator:
+        return ""
+    host = rest.split("/", 1)[0]
+    if "?" in host or "#" in host or "$" in host:
+        host = HOST_END_PATTERN.split(host, 1)[0]
+    return intern(host.lower())
+
+
+class ChannelRecord:
+    """
+    一条频道线路：分类、名称、URL，以及原始的 EXTINF 属性文本
+    属性在读取时才解析，解析几十万条线路时不必为每条线路建立属性字典
+    """
+
+    __slots__ = ("category", "name", "url", "extinf")
+
+    def __init__(self, category, name, url, extinf=""):
+        self.category = category
+        self.name = name
+        self.url = url
+        self.extinf = extinf
+
+    @property
+    def host(self):
+        """URL的主机（含端口），按需解析且结果已驻留，不占用记录本身的空间"""
+        return url_host(self.url)
+
+    @property
+    def attrs(self):
+        """EXTINF 属性 ((键, 值), ...)，如 tvg-id、tvg-logo、group-title、catchup"""
+        return tuple(EXTINF_ATTR_PATTERN.findall(self.extinf))
+
+    def attr(self, key, default=None):
+        """读取单个 EXTINF 属性，如 record.attr("tvg-logo")"""
+        for attr_key, value in EXTINF_ATTR_PATTERN.findall(self.extinf):
+            if attr_key == key:
+                return value
+        return default
+
+    def to_row(self):
+        """序列化为 [名称, URL, 属性文本]，用于 JSON 缓存"""
+        return [self.name, self.url, self.extinf] if self.extinf else [self.name, self.url]
+
+    @classmethod
+    def from_row(cls, category, row):
+        return cls(intern(category), intern(row[0]), row[1], row[2] if len(row) > 2 else "")
+
+    def __reduce__(self):
+        return ChannelRecord, (self.category, self.name, self.url, self.extinf)
+
+    def __eq__(self, other):
+        if not isinstance(other, ChannelRecord):
+            return NotImplemented
+        return (self.category, self.name, self.url, self.extinf) == (other.category, other.name, other.url, other.extinf)
+
+    def __hash__(self):
+        return hash((self.category, self.name, self.url))
+
+    def __repr__(self):
+        return f"ChannelRecord({self.category!r}, {self.name!r}, {self.url!r})"
+
+
+@lru_cache(maxsize=16384)
+def normalize_record_name(channel_name):
+    """与原解析逻辑一致：只有以 CCTV 开头的名称做清洗；同名频道反复出现，结果按名称缓存"""
+    if channel_name and channel_name.startswith("CCTV"):
+        channel_name = clean_channel_name(channel_name)
+    return intern(channel_name)
+
+
+def parse_extinf(line, default_category=None):
+    """解析 #EXTINF 行，返回 (分类, 频道名称, 属性文本)"""
+    # 名称从第一个不在引号内的逗号之后开始，属性值中可以含有逗号
+    separator = line.find(",")
+    while separator != -1 and line.count('"', 0, separator) % 2:
+        separator = line.find(",", separator + 1)
+    extinf = line[len(EXTINF_PREFIX):separator] if separator != -1 else line[len(EXTINF_PREFIX):]
+
+    category = default_category
+    start = extinf.find(GROUP_TITLE_PREFIX)
+    if start != -1:
+        start += len(GROUP_TITLE_PREFIX)
+        end = extinf.find('"', start)
+        if end != -1 and extinf[start:end].strip():
+            category = intern(extinf[start:end].strip())
+    name = normalize_record_name(line[separator + 1:].strip() if separator != -1 else "")
+    return category, name, extinf
+
+
+def iter_m3u_records(lines, default_category=None):
+    """
+    逐行解析 M3U，生成 ChannelRecord
+    没有 group-title 的条目使用 default_category，为 None 时跳过
+    """
+    # 同一频道的多条线路常带有完全相同的 #EXTINF 行，近期的解析结果按整行缓存，属性文本也随之共享
+    extinf_cache = {}
+    category = None
+    channel_name = None
+    extinf = ""
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith(EXTINF_PREFIX):
+            parsed = extinf_cache.get(line)
+            if parsed is None:
+                if len(extinf_cache) >= EXTINF_CACHE_SIZE:
+                    extinf_cache.clear()
+                parsed = extinf_cache[line] = parse_extinf(line, default_category)
+            category, channel_name, extinf = parsed
+        elif line and not line.startswith("#"):
+            if category is not None and channel_name:
+                yield ChannelRecord(category, channel_name, line, extinf)
+
+
+def iter_txt_records(lines, default_category=None):
+    """
+    逐行解析 '频道名,URL' 格式，'分类,#genre#' 开始新的分类，一行中以'#'分隔的多个URL逐个输出
+    第一个分类行之前的条目使用 default_category，为 None 时跳过
+    """
+    category = default_category
+
+    for line in lines:
+        line = line.strip()
+        if "#genre#" in line:
+            category = intern(line.split(",")[0].strip())
+        elif category is not None:
+            channel_name, separator, channel_urls = line.partition(",")
+            if separator:
+                channel_name = normalize_record_name(channel_name.strip())
+                for channel_url in channel_urls.split('#'):
+                    yield ChannelRecord(category, channel_name, channel_url.strip())
+            elif line:
+                yield ChannelRecord(category, intern(line), '')
+
+
+def iter_chunk_lines(chunks, encoding="utf-8"):
+    """将字节块流切分为文本行，只缓存尚未结束的最后一行"""
+    pending = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        pending += chunk
+        end = pending.rfind(b"\n")
+        if end == -1:
+            continue
+        # 换行符不会出现在多字节字符中间，完整的行整段解码后再切分，避免逐行解码
+        text = pending[:end].decode(encoding, errors="replace")
+        pending = pending[end + 1:]
+        yield from text.split("\n")
+    if pending:
+        yield pending.decode(encoding, errors="replace")
+
+
+def group_records(records):
+    """按分类分组：分类 -> [ChannelRecord, ...]"""
+    channels = OrderedDict()
+    for record in records:
+        channel_list = channels.get(record.category)
+        if channel_list is None:
+            channel_list = channels[record.category] = []
+        channel_list.append(record)
+    return channels
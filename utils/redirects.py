@@ -0,0 +1,127 @@
+"""
+重定向链缓存
+大量线路是 PHP 等跳转接口（如 http://host/tv/xxx.php?id=0001），每次测速、每次重试都要先经过几跳重定向才到真正的 m3u8。
+测速时跟随重定向，从响应的跳转历史中记录最终地址、跳数和跳转耗时，缓存在 output/redirect_cache.json 中，
+有效期内直接测最终地址，不再经过跳转；最终地址相同的多个跳转接口只测一次，结果分发给每个接口，并加上各自的跳转耗时，
+排序仍反映播放器实际需要的时间。
+最终地址常带有会过期的鉴权参数，缓存的地址测速失败时改测原跳转接口并更新缓存；播放列表中仍写原始的跳转接口地址。
+"""
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import replace
+from urllib.parse import urlsplit
+
+from utils.metrics import metrics
+from utils.output_writer import write_atomic
+from utils.speed_test import compute_score
+
+CACHE_VERSION = 1
+# 以这些扩展名结尾的地址视为媒体地址，不作为跳转接口缓存
+MEDIA_EXTENSIONS = (".m3u8", ".m3u", ".ts", ".flv", ".mp4", ".mpd", ".aac", ".mp3")
+
+
+def needs_resolving(url):
+    """只有 http(s) 且不是媒体文件的地址才可能是跳转接口"""
+    parts = urlsplit(url)
+    return parts.scheme in ("http", "https") and not parts.path.lower().endswith(MEDIA_EXTENSIONS)
+
+
+class RedirectCache:
+    """去重键 -> 最终地址、跳数和跳转耗时，超过 ttl 秒的记录失效"""
+
+    def __init__(self, path, ttl=3 * 24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CACHE_VERSION:
+                self.entries = data["entries"]
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    def get(self, key, now=None):
+        entry = self.entries.get(key)
+        if entry and (now or time.time()) - entry["resolved_at"] < self.ttl:
+            return entry
+        return None
+
+    def put(self, key, final_url, hops, elapsed_ms, now=None):
+        self.entries[key] = {"final": final_url, "hops": hops, "elapsed_ms": round(elapsed_ms, 1),
+                             "resolved_at": round(now or time.time())}
+
+    def invalidate(self, key):
+        self.entries.pop(key, None)
+
+    def save(self, now=None):
+        """过期记录不再保存"""
+        now = now or time.time()
+        self.entries = {key: entry for key, entry in self.entries.items() if now - entry["resolved_at"] < self.ttl}
+        write_atomic(self.path, json.dumps({"version": CACHE_VERSION, "entries": self.entries},
+                                           ensure_ascii=False, separators=(",", ":")))
+
+    def record(self, targets, urls, results, now=None):
+        """把直接测速（跟随重定向）时经过跳转的地址写入缓存，返回写入的条数"""
+        recorded = 0
+        for url in urls:
+            result = results[url]
+            if result.success and result.redirect_hops and needs_resolving(url):
+                self.put(targets[url], result.final_url, result.redirect_hops, result.redirect_ms or 0, now)
+                recorded += 1
+        return recorded
+
+    async def probe(self, tester, targets):
+        """
+        targets 为 测速URL -> 去重键。缓存命中的跳转接口按最终地址分组测速，其余地址直接测速并记录跳转，
+        返回测速结果列表（url 为原测速URL）；缓存的最终地址测速失败时改测原地址
+        """
+        now = time.time()
+        entries = OrderedDict()
+        for url, key in targets.items():
+            entry = self.get(key, now)
+            if entry:
+                entries[url] = entry
+
+        finals = OrderedDict((url, entries[url]["final"] if url in entries else url) for url in targets)
+        results = await self._probe_targets(tester, finals.values())
+        recorded = self.record(targets, [url for url in targets if url not in entries], results, now)
+        logging.info(f"重定向缓存: 缓存命中 {len(entries)} 个跳转接口，本次测速新记录 {recorded} 个，"
+                     f"合并最终地址后测速 {len(results)} 个URL")
+        metrics.count("redirect_cache_hits", len(entries))
+        metrics.count("redirects_recorded", recorded)
+        metrics.count("urls_probe_merged", len(targets) - len(results))
+
+        # 缓存的最终地址可能已过期（鉴权参数失效），改测原跳转接口，重新记录跳转
+        stale = [url for url in entries if not results[finals[url]].success]
+        if stale:
+            for url in stale:
+                self.invalidate(targets[url])
+                del entries[url]
+                finals[url] = url
+            results.update(await self._probe_targets(tester, stale))
+            recorded = self.record(targets, stale, results, now)
+            metrics.count("redirects_recorded", recorded)
+            logging.info(f"重定向缓存: {len(stale)} 个缓存的最终地址测速失败，改测原地址，重新记录 {recorded} 个")
+
+        probed = []
+        for url, final in finals.items():
+            result = replace(results[final], url=url)
+            entry = entries.get(url)
+            if entry and entry["hops"] and result.success:
+                # 直接测最终地址时没有经过跳转，而播放器仍需经过跳转，首字节时间计入缓存的跳转耗时
+                if result.ttfb is not None:
+                    result.ttfb += entry["elapsed_ms"]
+                if result.latency is not None:
+                    result.latency += entry["elapsed_ms"]
+                result.score = compute_score(result)
+            probed.append(result)
+        return probed
+
+    @staticmethod
+    async def _probe_targets(tester, urls):
+        """同一URL只测一次"""
+        results = await tester.batch_speed_test(list(OrderedDict.fromkeys(urls)))
+        return OrderedDict((result.url, result) for result in results)
@@ -0,0 +1,310 @@
+"""
+内置 HTTP 服务模块
+将 output 目录下生成的播放列表和节目单载入内存，预先计算 gzip/brotli 压缩版本和强 ETag，
+请求时只做字典查找：If-None-Match 命中返回 304，支持 Range 断点续传，
+并可通过 ?ip=ipv6、?category=央视频道 在内存中筛选，不额外写文件。
+/changes/ 下提供播放列表的变更记录（index.json 和按代号命名的增量）。
+后台定时检查文件修改时间，文件被流水线原子替换后整体换入新内容。
+"""
+import asyncio
+import gzip
+import hashlib
+import logging
+import os
+import re
+from collections import OrderedDict
+from email.utils import formatdate
+
+from aiohttp import web
+
+try:
+    import brotli
+except ImportError:  # brotli 为可选依赖，未安装时只提供 gzip
+    brotli = None
+
+BROTLI_QUALITY = 9
+MAX_VIEWS_PER_ASSET = 64
+GROUP_TITLE_PATTERN = re.compile(r'group-title="([^"]*)"')
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+CATEGORY_DECORATION_PATTERN = re.compile(r'^.*┃|^[^\w]+')
+CHANGE_FEED_NAME_PATTERN = re.compile(r'^(index|\d+)\.json$')
+
+# 对外提供的文件 -> Content-Type
+SERVED_FILES = OrderedDict([
+    ("live_ipv4.m3u", "audio/x-mpegurl; charset=utf-8"),
+    ("live_ipv4.txt", "text/plain; charset=utf-8"),
+    ("live_ipv6.m3u", "audio/x-mpegurl; charset=utf-8"),
+    ("live_ipv6.txt", "text/plain; charset=utf-8"),
+    ("epg.xml.gz", "application/gzip"),
+])
+
+
+class Asset:
+    """一个可下载的文件：原始内容、各压缩版本及对应的强 ETag"""
+
+    __slots__ = ("content_type", "last_modified", "variants", "etags", "views")
+
+    def __init__(self, body, content_type, mtime, compress=True):
+        self.content_type = content_type
+        self.last_modified = formatdate(mtime, usegmt=True)
+        self.variants = {"identity": body}
+        if compress:
+            self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        # 不同编码是不同的表示，ETag 必须不同
+        self.etags = {encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+                      for encoding in self.variants}
+        self.views = OrderedDict()  # 筛选参数 -> 筛选后的 Asset
+
+    def text(self):
+        return self.variants["identity"].decode("utf-8")
+
+
+class OutputStore:
+    """内存中的输出文件快照，整体替换保证请求看到的是同一代内容"""
+
+    def __init__(self, output_dir, files=SERVED_FILES):
+        self.output_dir = output_dir
+        self.files = files
+        self.assets = {}
+        self.mtimes = {}
+
+    def changed_files(self):
+        """返回修改时间与当前快照不一致的文件"""
+        changed = {}
+        for name in self.files:
+            try:
+                mtime = os.stat(os.path.join(self.output_dir, name)).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime != self.mtimes.get(name):
+                changed[name] = mtime
+        return changed
+
+    def build(self, changed):
+        """读取并压缩变化的文件，返回新的 (assets, mtimes)，未变化的文件沿用原对象"""
+        assets = dict(self.assets)
+        mtimes = dict(self.mtimes)
+        for name, mtime in changed.items():
+            mtimes[name] = mtime
+            if mtime is None:
+                assets.pop(name, None)
+                continue
+            with open(os.path.join(self.output_dir, name), "rb") as f:
+                body = f.read()
+            assets[name] = Asset(body, self.files[name], mtime / 1e9, compress=not name.endswith(".gz"))
+        return assets, mtimes
+
+    async def reload(self):
+        """检查并换入新生成的文件，压缩在线程池中完成，不阻塞请求处理"""
+        changed = self.changed_files()
+        if not changed:
+            return False
+        loop = asyncio.get_running_loop()
+        try:
+            assets, mtimes = await loop.run_in_executor(None, self.build, changed)
+        except OSError as e:
+            # 文件正在被替换等情况，下一轮再试
+            logging.warning(f"输出文件载入失败: {e}")
+            return False
+        self.assets, self.mtimes = assets, mtimes
+        logging.info(f"已载入新的输出文件: {', '.join(sorted(changed))}")
+        return True
+
+    async def view(self, name, ip_version, categories):
+        """返回请求对应的 Asset，live.m3u/live.txt 按 ip 参数选择文件，按 category 参数筛选"""
+        if name in ("live.m3u", "live.txt"):
+            name = f"live_{ip_version}{name[4:]}"
+        asset = self.assets.get(name)
+        if asset is None or not categories:
+            return asset
+        if name.endswith(".gz"):
+            return None
+
+        key = tuple(sorted(categories))
+        view = asset.views.get(key)
+        if view is None:
+            filter_lines = filter_m3u if name.endswith(".m3u") else filter_txt
+            body = filter_lines(asset.text(), set(categories))
+            if body is None:
+                return None
+            loop = asyncio.get_running_loop()
+            view = await loop.run_in_executor(
+                None, Asset, body.encode("utf-8"), asset.content_type, self.mtimes[name] / 1e9)
+            asset.views[key] = view
+            if len(asset.views) > MAX_VIEWS_PER_ASSET:
+                asset.views.popitem(last=False)
+        return view
+
+
+def category_matches(category, categories):
+    """分组名称匹配，允许省略 "🥝┃" 这类装饰前缀"""
+    return category in categories or CATEGORY_DECORATION_PATTERN.sub("", category) in categories
+
+
+def filter_m3u(text, categories):
+    """只保留指定分组的 M3U 条目（含文件头），没有匹配的条目时返回 None"""
+    lines = text.splitlines(keepends=True)
+    result = []
+    matched = False
+    keep = True
+    for line in lines:
+        if line.startswith("#EXTINF"):
+            match = GROUP_TITLE_PATTERN.search(line)
+            keep = bool(match) and category_matches(match.group(1), categories)
+            matched = matched or keep
+        if keep:
+            result.append(line)
+    return "".join(result) if matched else None
+
+
+def filter_txt(text, categories):
+    """只保留指定分组的 TXT 段落，没有匹配的段落时返回 None"""
+    result = []
+    keep = False
+    for line in text.splitlines(keepends=True):
+        if "#genre#" in line:
+            keep = category_matches(line.split(",", 1)[0], categories)
+        if keep:
+            result.append(line)
+    return "".join(result) if result else None
+
+
+def choose_encoding(asset, accept_encoding):
+    """按 Accept-Encoding 选择压缩版本，优先 br，其次 gzip"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        token, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token.strip().lower()] = quality
+    for encoding in ("br", "gzip"):
+        if encoding in asset.variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return "identity"
+
+
+def parse_range(header, size):
+    """解析单个字节范围，返回 (start, end)；不支持的格式返回 None，无法满足时返回 False"""
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if start == "":
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+# 应用状态的键，使用 web.AppKey 以获得类型检查，避免 aiohttp 对字符串键的 NotAppKeyWarning
+STORE_KEY = web.AppKey("store", OutputStore)
+RELOAD_INTERVAL_KEY = web.AppKey("reload_interval", float)
+CHANGES_DIR_KEY = web.AppKey("changes_dir", str)
+WATCHER_KEY = web.AppKey("watcher", asyncio.Task)
+
+
+async def handle_file(request):
+    store = request.app[STORE_KEY]
+    query = request.query
+    ip_version = query.get("ip", "ipv4").lower()
+    if ip_version not in ("ipv4", "ipv6"):
+        raise web.HTTPBadRequest(text="ip 参数只能为 ipv4 或 ipv6")
+    categories = [name for value in query.getall("category", []) for name in value.split(",") if name]
+
+    asset = await store.view(request.match_info["name"], ip_version, categories)
+    if asset is None:
+        raise web.HTTPNotFound()
+
+    range_header = request.headers.get("Range")
+    # 断点续传只针对原始内容，避免压缩版本的偏移与客户端理解不一致
+    encoding = "identity" if range_header else choose_encoding(asset, request.headers.get("Accept-Encoding", ""))
+    etag = asset.etags[encoding]
+    headers = {
+        "ETag": etag,
+        "Last-Modified": asset.last_modified,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+        "Accept-Ranges": "bytes",
+    }
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return web.Response(status=304, headers=headers)
+
+    body = asset.variants[encoding]
+    headers["Content-Type"] = asset.content_type
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    # If-Range 与当前 ETag 不一致说明内容已更新，返回完整内容
+    if range_header and request.headers.get("If-Range", etag) == etag:
+        byte_range = parse_range(range_header, len(body))
+        if byte_range is False:
+            headers["Content-Range"] = f"bytes */{len(body)}"
+            return web.Response(status=416, headers=headers)
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            return web.Response(status=206, body=body[start:end + 1], headers=headers)
+    return web.Response(body=body, headers=headers)
+
+
+async def handle_change(request):
+    """变更记录：增量文件按代号命名、内容不再改变，可长期缓存；index.json 每次都需向服务端验证"""
+    name = request.match_info["name"]
+    path = os.path.join(request.app[CHANGES_DIR_KEY], name)
+    if not CHANGE_FEED_NAME_PATTERN.match(name) or not os.path.isfile(path):
+        raise web.HTTPNotFound()
+    cache_control = "no-cache" if name == "index.json" else "public, max-age=31536000, immutable"
+    return web.FileResponse(path, headers={"Cache-Control": cache_control,
+                                           "Content-Type": "application/json; charset=utf-8"})
+
+
+async def watch_outputs(app):
+    store = app[STORE_KEY]
+    interval = app[RELOAD_INTERVAL_KEY]
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await store.reload()
+        except Exception as e:
+            logging.error(f"输出文件检查失败: {e}")
+
+
+async def start_watcher(app):
+    await app[STORE_KEY].reload()
+    app[WATCHER_KEY] = asyncio.create_task(watch_outputs(app))
+
+
+async def stop_watcher(app):
+    app[WATCHER_KEY].cancel()
+
+
+def create_app(output_dir, reload_interval=5, changes_dir=None):
+    app = web.Application()
+    app[STORE_KEY] = OutputStore(output_dir)
+    app[RELOAD_INTERVAL_KEY] = reload_interval
+    app[CHANGES_DIR_KEY] = changes_dir or os.path.join(output_dir, "changes")
+    app.router.add_get("/changes/{name}", handle_change)
+    app.router.add_get("/{name}", handle_file)
+    app.on_startup.append(start_watcher)
+    app.on_cleanup.append(stop_watcher)
+    return app
+
+
+def serve(output_dir, host="0.0.0.0", port=8080, reload_interval=5, changes_dir=None):
+    """启动服务，关闭访问日志以降低每个请求的开销"""
+    logging.info(f"开始提供服务: http://{host}:{port}/ ，目录: {output_dir}")
+    web.run_app(create_app(output_dir, reload_interval, changes_dir), host=host, port=port,
+                access_log=None, print=None)
@@ -0,0 +1,144 @@
+"""
+直播源缓存模块
+为每个直播源URL保存 ETag、Last-Modified、内容哈希和解析结果，
+下次抓取时发送条件请求，未变化时直接复用已解析的频道数据；
+源不可用时在有效期内回退到最近一次成功的解析结果。
+正文只在下载和解析期间写入临时文件，解析完成后即删除，不保留原始正文。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from utils.records import ChannelRecord
+
+
+class SourceCache:
+    """基于磁盘的直播源缓存，索引文件记录元数据，解析结果按URL哈希分文件存放"""
+
+    def __init__(self, cache_dir, max_age):
+        self.cache_dir = cache_dir
+        self.max_age = max_age
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def _path(self, url, suffix):
+        key = hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{key}.{suffix}")
+
+    def conditional_headers(self, url):
+        """返回条件请求头，只有已存在解析结果时才发送"""
+        entry = self.entries.get(url)
+        if not entry or not os.path.exists(self._path(url, "json")):
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def download(self, url, chunks):
+        """将正文写入临时快照文件并计算 SHA-256，返回 (临时文件路径, 哈希, 字节数)"""
+        temp_path = self._path(url, f"body.{threading.get_ident()}.tmp")
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            with open(temp_path, "wb") as f:
+                for chunk in chunks:
+                    if chunk:
+                        digest.update(chunk)
+                        size += len(chunk)
+                        f.write(chunk)
+        except BaseException:
+            self.discard(temp_path)
+            raise
+        return temp_path, digest.hexdigest(), size
+
+    def is_unchanged(self, url, sha256):
+        """内容哈希与上次一致且解析结果仍在时视为未变化"""
+        entry = self.entries.get(url)
+        return bool(entry) and entry.get("sha256") == sha256 and os.path.exists(self._path(url, "json"))
+
+    def snapshot_chunks(self, path, chunk_size=64 * 1024):
+        """按块读取快照文件"""
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def load_channels(self, url):
+        """读取已解析的频道数据，失败时返回 None"""
+        try:
+            with open(self._path(url, "json"), "r", encoding="utf-8") as f:
+                data = json.load(f, object_pairs_hook=OrderedDict)
+        except (OSError, ValueError):
+            return None
+        return OrderedDict(
+            (category, [ChannelRecord.from_row(category, row) for row in rows])
+            for category, rows in data.items()
+        )
+
+    def store(self, url, headers, sha256, temp_path, channels):
+        """保存新的解析结果和响应元数据，删除临时正文"""
+        self.discard(temp_path)
+        self.discard(self._path(url, "body"))  # 旧版本保留的原始正文
+        parsed_path = self._path(url, "json")
+        with open(parsed_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({category: [record.to_row() for record in channel_list]
+                       for category, channel_list in channels.items()}, f, ensure_ascii=False)
+        os.replace(parsed_path + ".tmp", parsed_path)
+        with self._lock:
+            self.entries[url] = {
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "sha256": sha256,
+                "fetched_at": time.time(),
+            }
+
+    def touch(self, url, headers=None):
+        """源未变化时刷新成功时间，并更新服务器返回的新校验信息"""
+        with self._lock:
+            entry = self.entries.setdefault(url, {})
+            entry["fetched_at"] = time.time()
+            if headers:
+                entry["etag"] = headers.get("ETag", entry.get("etag"))
+                entry["last_modified"] = headers.get("Last-Modified", entry.get("last_modified"))
+
+    def invalidate(self, url):
+        """删除URL的缓存记录和解析结果，下次抓取不再发送条件请求"""
+        with self._lock:
+            self.entries.pop(url, None)
+        self.discard(self._path(url, "json"))
+
+    def discard(self, temp_path):
+        """删除临时正文文件"""
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+
+    def fallback(self, url):
+        """源不可用时，在有效期内返回最近一次成功的解析结果，否则返回 None"""
+        entry = self.entries.get(url)
+        if not entry or time.time() - entry.get("fetched_at", 0) > self.max_age:
+            return None
+        return self.load_channels(url)
+
+    def save(self):
+        """写回索引文件"""
+        with self._lock:
+            data = json.dumps(self.entries, ensure_ascii=False, indent=2)
+        with open(self.index_path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(self.index_path + ".tmp", self.index_path)
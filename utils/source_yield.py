@@ -0,0 +1,164 @@
+"""
+直播源产出统计
+每次完整运行后记录每个直播源的下载字节数、抓取解析耗时、匹配到的频道数、匹配线路数、
+独有线路数（归属于该直播源的去重键：多个直播源提供同一线路时，按配置顺序归属于第一个提供者）
+以及这些线路的测速成功率，跨运行保存在 output/source_yield.json。
+共有线路总有一个提供者得到计数，内容相同的几个直播源不会因互相重复而同时被降级。
+最近若干次的平均独有可用线路数低于阈值的直播源被降级：在重试间隔内跳过抓取，到期后再抓取一次，
+产出恢复即重新启用。每个直播源的决定和原因写在同一文件中。
+"""
+import json
+import logging
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from utils.output_writer import write_atomic
+
+YIELD_VERSION = 1
+ACTIVE = "active"
+DEPRIORITIZED = "deprioritized"
+
+
+def attribute_sources(source_url_sets, matched_channels, classify, probe_outcomes=None):
+    """
+    按去重键把匹配结果归属到直播源
+    source_url_sets 为 直播源 -> 原始线路集合，按配置顺序排列，多个直播源提供的线路只计入第一个提供者的独有线路；
+    probe_outcomes 为 去重键 -> 是否可用（未测速时为 None）
+    返回 直播源 -> {matched_urls, channels_matched, unique_urls, probed_urls, alive_urls, unique_alive_urls}
+    """
+    key_by_url = {}
+    channels_by_key = defaultdict(set)
+    for category, channel_map in matched_channels.items():
+        for channel_name, urls in channel_map.items():
+            for url in urls:
+                url_info = classify(url)
+                if url_info:
+                    key_by_url[url] = url_info[0]
+                    channels_by_key[url_info[0]].add((category, channel_name))
+
+    source_keys = OrderedDict(
+        (source, {key_by_url[url] for url in urls if url in key_by_url}) for source, urls in source_url_sets.items())
+    owners = {}
+    for source, keys in source_keys.items():
+        for key in keys:
+            owners.setdefault(key, source)
+
+    stats = OrderedDict()
+    for source, keys in source_keys.items():
+        unique_keys = {key for key in keys if owners[key] == source}
+        channels = set()
+        for key in keys:
+            channels |= channels_by_key[key]
+        record = {"matched_urls": len(keys), "channels_matched": len(channels), "unique_urls": len(unique_keys)}
+        if probe_outcomes is not None:
+            probed = [key for key in keys if key in probe_outcomes]
+            record["probed_urls"] = len(probed)
+            record["alive_urls"] = sum(1 for key in probed if probe_outcomes[key])
+            record["unique_alive_urls"] = sum(1 for key in unique_keys if probe_outcomes.get(key))
+        stats[source] = record
+    return stats
+
+
+def source_yield(stats):
+    """产出：测速后仍可用的独有线路数；未测速时为独有线路数"""
+    return stats.get("unique_alive_urls", stats["unique_urls"])
+
+
+class SourceYield:
+    """跨运行的直播源产出记录，以及据此决定的抓取计划"""
+
+    def __init__(self, path, window=5, min_runs=3, min_yield=1, retry_interval=7 * 24 * 3600):
+        self.path = path
+        self.window = window
+        self.min_runs = min_runs
+        self.min_yield = min_yield
+        self.retry_interval = retry_interval
+        self.sources = OrderedDict()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == YIELD_VERSION:
+                self.sources = OrderedDict(data["sources"])
+        except (OSError, ValueError, KeyError, AttributeError):
+            pass
+
+    def plan(self, source_urls, now=None):
+        """返回 (本次抓取的直播源, 跳过的直播源)，降级的直播源在重试间隔内跳过"""
+        now = now or time.time()
+        fetch_urls, skipped = [], []
+        for url in source_urls:
+            entry = self.sources.get(url)
+            if (entry and entry.get("decision") == DEPRIORITIZED
+                    and now - entry.get("last_fetched", 0) < self.retry_interval):
+                skipped.append(url)
+            else:
+                fetch_urls.append(url)
+        if not fetch_urls:
+            # 全部被降级时多半是之前的网络故障造成的，照常抓取
+            return list(source_urls), []
+        if skipped:
+            logging.info(f"跳过 {len(skipped)} 个低产出直播源，详见 {self.path}")
+        return fetch_urls, skipped
+
+    def record(self, source_urls, source_metrics, source_stats, now=None):
+        """
+        记录本次运行抓取过的直播源的统计，重新计算每个直播源的决定
+        source_metrics 为 metrics.sources（字节数、耗时、状态等），source_stats 为 attribute_sources 的结果
+        """
+        now = now or time.time()
+        for url in list(self.sources):
+            if url not in source_urls:
+                del self.sources[url]  # 已从配置中移除
+        if source_stats and not any(source_yield(stats) for stats in source_stats.values()):
+            # 所有直播源都没有产出，多半是网络故障，本次样本不计入，避免把全部直播源降级
+            logging.warning("本次运行所有直播源均无产出，不记录产出样本")
+            return
+
+        for url in source_urls:
+            entry = self.sources.setdefault(url, {"runs": []})
+            stats = source_stats.get(url)
+            if stats is None:
+                entry["skipped_runs"] = entry.get("skipped_runs", 0) + 1
+                continue
+            fetched = source_metrics.get(url, {})
+            sample = OrderedDict([
+                ("at", round(now)),
+                ("status", fetched.get("status")),
+                ("bytes", fetched.get("bytes", 0)),
+                ("elapsed_seconds", fetched.get("elapsed_seconds")),
+                ("records", fetched.get("records", 0)),
+                ("usable_urls", fetched.get("usable_urls", 0)),
+            ])
+            sample.update(stats)
+            sample["yield"] = source_yield(stats)
+            entry["runs"] = (entry["runs"] + [sample])[-self.window:]
+            entry["last_fetched"] = round(now)
+            entry["skipped_runs"] = 0
+            entry["decision"], entry["reason"] = self.decide(entry["runs"])
+
+    def decide(self, runs):
+        """根据最近的样本决定是否降级，返回 (决定, 原因)"""
+        if len(runs) < self.min_runs:
+            return ACTIVE, f"样本不足（{len(runs)}/{self.min_runs} 次），保持正常抓取"
+        latest = runs[-1]["yield"]
+        average = sum(run["yield"] for run in runs) / len(runs)
+        if latest >= self.min_yield:
+            return ACTIVE, f"最近一次独有可用线路 {latest} 条，近 {len(runs)} 次平均 {average:.1f} 条"
+        if average < self.min_yield:
+            megabytes = sum(run["bytes"] for run in runs) / len(runs) / 1024 / 1024
+            return DEPRIORITIZED, (f"近 {len(runs)} 次平均独有可用线路 {average:.1f} 条，低于阈值 {self.min_yield}；"
+                                   f"平均下载 {megabytes:.2f}MB，"
+                                   f"改为每 {self.retry_interval / 3600:g} 小时抓取一次")
+        return ACTIVE, f"最近一次没有独有可用线路，但近 {len(runs)} 次平均 {average:.1f} 条，暂不降级"
+
+    def save(self):
+        summary = Counter(entry.get("decision", ACTIVE) for entry in self.sources.values())
+        write_atomic(self.path, json.dumps({
+            "version": YIELD_VERSION,
+            "updated_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "summary": dict(summary),
+            "sources": self.sources,
+        }, ensure_ascii=False, indent=2))
+        for url, entry in self.sources.items():
+            if entry.get("decision") == DEPRIORITIZED:
+                logging.info(f"低产出直播源: {url}，{entry['reason']}")
@@ -3,47 +3,170 @@ import aiohttp
 import time
 import logging
 import os
+import random
+import re
+import sys
 from dataclasses import dataclass, asdict
-from typing import List, Dict, Tuple, Optional
+from typing import Callable, List, Dict, Tuple, Optional
+from collections import defaultdict
+from urllib.parse import urljoin, urlsplit
+
+if __name__ == "__main__":
+    # 作为脚本运行（python utils/speed_test.py）时，把仓库根目录加入模块搜索路径，使 utils 包可以导入
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.bitstream import StreamSniffer
+from utils.records import iter_m3u_records
 
 # 配置类
 class Config:
     CONCURRENT_LIMIT = 20  # 并发限制
+    PER_HOST_LIMIT = 4  # 同一主机的并发限制
     TIMEOUT = 10  # 超时时间（秒）
+    CONNECT_TIMEOUT = 5  # 建立连接的超时时间（秒）
     RETRY_TIMES = 3  # 重试次数
+    RETRY_BACKOFF = 0.5  # 重试退避的基础时间（秒），按指数增长并加随机抖动
+    HOST_FAILURE_LIMIT = 3  # 同一主机连续连接失败达到该次数后，其余URL直接判定失败
+    KEEPALIVE_TIMEOUT = 30  # 空闲连接保活时间（秒）
+    DNS_CACHE_TTL = 300  # DNS缓存时间（秒）
+    PROBE_MODE = "hls"  # 测速模式：hls 下载分片测吞吐量，latency 仅测响应头延迟
+    PROBE_SEGMENTS = 2  # HLS 测速下载的分片数
+    SEGMENT_BYTE_CAP = 512 * 1024  # 每个分片/直连流最多读取的字节数
+    PLAYLIST_MAX_BYTES = 1024 * 1024  # m3u8 播放列表最多读取的字节数
+    SNIFF_ENABLED = True  # 测速时从读取的正文中嗅探视频编码、分辨率和帧率
+    SNIFF_MAX_BYTES = 384 * 1024  # 每个URL最多交给嗅探器解析的字节数
+    SNIFF_TIME_BUDGET = 0.05  # 每个URL嗅探的CPU时间上限（秒）
     OUTPUT_DIR = "output"  # 输出目录
     LOG_FILE = "output/speed_test.log"  # 日志文件
 
 config = Config()
 
-# 日志配置
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(config.LOG_FILE),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+# 日志配置：只在独立运行时配置，作为模块导入时沿用调用方的日志设置，不在导入时创建文件
+def setup_logging():
+    os.makedirs(config.OUTPUT_DIR, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(config.LOG_FILE, encoding="utf-8"),
+            logging.StreamHandler()
+        ]
+    )
+
 # 数据类
 @dataclass
 class SpeedTestResult:
     url: str
     latency: Optional[float] = None  # 延迟（毫秒）
     resolution: Optional[str] = None  # 分辨率
+    codec: Optional[str] = None  # 视频编码（从码流中嗅探）
+    fps: Optional[float] = None  # 帧率（从码流中嗅探）
     success: bool = False  # 是否成功
     error: Optional[str] = None  # 错误信息
     test_time: float = 0  # 测试时间戳
+    ttfb: Optional[float] = None  # 首字节时间（毫秒）
+    throughput: Optional[float] = None  # 下载速度（KB/s）
+    bandwidth: Optional[int] = None  # m3u8 声明的码率（bps）
+    score: Optional[float] = None  # 综合评分，越高越好
+    final_url: Optional[str] = None  # 跟随重定向后的最终地址
+    redirect_hops: int = 0  # 重定向跳数
+    redirect_ms: Optional[float] = None  # 重定向耗时（毫秒），即收到最后一次跳转响应的时间
+
+class ProbeError(Exception):
+    """测速过程中可预期的失败（状态码异常、空播放列表等）"""
+
+# 直连流返回这些类型时多为错误页，不作为可用的流
+NON_STREAM_CONTENT_TYPES = ("text/html", "text/plain")
+
+STREAM_INF_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+def parse_hls_playlist(text: str, base_url: str) -> Tuple[List[Tuple[Dict[str, str], str]], List[str]]:
+    """解析m3u8，返回 (子播放列表 [(属性, URL)], 媒体分片URL列表)"""
+    variants = []
+    segments = []
+    pending_attrs = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-STREAM-INF:"):
+            pending_attrs = {
+                key: value.strip('"')
+                for key, value in STREAM_INF_PATTERN.findall(line[len("#EXT-X-STREAM-INF:"):])
+            }
+        elif not line.startswith("#"):
+            if pending_attrs is not None:
+                variants.append((pending_attrs, urljoin(base_url, line)))
+                pending_attrs = None
+            else:
+                segments.append(urljoin(base_url, line))
+    return variants, segments
+
+def resolution_height(resolution: Optional[str]) -> int:
+    """从 1920x1080 形式的分辨率中取高度，无法识别时返回 0"""
+    if not resolution or "x" not in resolution:
+        return 0
+    try:
+        return int(resolution.lower().split("x", 1)[1])
+    except ValueError:
+        return 0
+
+def compute_score(result: SpeedTestResult) -> float:
+    """综合评分：以吞吐量为主，分辨率加权，首字节时间作为惩罚项"""
+    if not result.success:
+        return 0.0
+    delay_seconds = (result.ttfb if result.ttfb is not None else result.latency or 0) / 1000
+    if result.throughput is None:
+        # 仅测了延迟时，延迟越低分数越高
+        return 1 / (1 + delay_seconds)
+    height = min(resolution_height(result.resolution), 2160)
+    quality = 1 + height / 1080
+    return result.throughput * quality / (1 + delay_seconds)
+
+def rank_key(result: SpeedTestResult):
+    """排序键：有综合评分时按评分降序，否则按延迟升序"""
+    if result.score is not None:
+        return (0, -result.score)
+    return (1, result.latency if result.latency is not None else float('inf'))
+
+# 视为主机不可达的连接类异常
+CONNECT_ERRORS = (aiohttp.ClientConnectorError, getattr(aiohttp, "ConnectionTimeoutError", aiohttp.ClientConnectorError))
+
+def url_host(url: str) -> str:
+    """取URL的主机（含端口），用于按主机限流"""
+    return urlsplit(url).netloc.lower()
 
 # 速度测试工具类
 class SpeedTester:
-    def __init__(self):
+    def __init__(self, timeout: Optional[float] = None, concurrent_limit: Optional[int] = None,
+                 retry_times: Optional[int] = None, probe_mode: Optional[str] = None,
+                 per_host_limit: Optional[int] = None):
         self.session = None
+        self.timeout = timeout or config.TIMEOUT
+        self.concurrent_limit = concurrent_limit or config.CONCURRENT_LIMIT
+        self.retry_times = retry_times or config.RETRY_TIMES
+        self.probe_mode = probe_mode or config.PROBE_MODE
+        self.per_host_limit = per_host_limit or config.PER_HOST_LIMIT
+        self.host_failures = defaultdict(int)  # 主机 -> 连续连接失败次数
     
     async def __aenter__(self):
-        self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=config.TIMEOUT))
+        connector = aiohttp.TCPConnector(
+            limit=self.concurrent_limit,
+            limit_per_host=self.per_host_limit,
+            keepalive_timeout=config.KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=config.DNS_CACHE_TTL,
+            use_dns_cache=True,
+        )
+        # 记录每次跳转响应的时间，用于计算重定向耗时
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_redirect.append(self._on_redirect)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=min(config.CONNECT_TIMEOUT, self.timeout)),
+            trace_configs=[trace_config],
+        )
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
@@ -55,12 +178,18 @@ class SpeedTester:
         result = SpeedTestResult(url=url, test_time=time.time())
         
         for attempt in range(retry_times):
+            if self.host_blocked(url):
+                result.error = result.error or "主机连续连接失败，已跳过"
+                break
             try:
-                start_time = time.time()
-                async with self.session.get(url, headers={"User-Agent": "Mozilla/5.0"}) as response:
+                start_time = time.perf_counter()
+                trace = {}
+                async with self.session.get(url, headers={"User-Agent": "Mozilla/5.0"},
+                                            trace_request_ctx=trace) as response:
+                    self._record_redirects(result, response, trace, start_time)
                     if response.status == 200:
                         # 简单测量响应时间作为延迟
-                        latency = (time.time() - start_time) * 1000  # 转换为毫秒
+                        latency = (time.perf_counter() - start_time) * 1000  # 转换为毫秒
                         
                         # 尝试从响应头或内容中提取分辨率信息（简化处理）
                         resolution = None
@@ -79,26 +208,171 @@ class SpeedTester:
             except Exception as e:
                 result.error = str(e)
                 logger.warning(f"URL: {url} 尝试 {attempt+1}/{retry_times} 失败: {e}")
-                await asyncio.sleep(1)  # 重试前等待1秒
+                await self._backoff(url, e, attempt, retry_times)
         
         return result
     
-    async def batch_speed_test(self, urls: List[str]) -> List[SpeedTestResult]:
-        """批量测速（带并发控制）"""
-        results = []
-        semaphore = asyncio.Semaphore(config.CONCURRENT_LIMIT)
+    async def probe_stream(self, url: str, retry_times: int = 3) -> SpeedTestResult:
+        """HLS感知测速：跟随主播放列表到子列表，下载前几个分片，测量首字节时间、吞吐量和分辨率"""
+        result = SpeedTestResult(url=url, test_time=time.time())
+
+        for attempt in range(retry_times):
+            if self.host_blocked(url):
+                result.error = result.error or "主机连续连接失败，已跳过"
+                break
+            try:
+                sniffer = StreamSniffer(config.SNIFF_MAX_BYTES, config.SNIFF_TIME_BUDGET) if config.SNIFF_ENABLED else None
+                await self._probe_once(url, result, sniffer=sniffer)
+                if sniffer:
+                    self._apply_sniffed(result, sniffer.finish())
+                result.success = True
+                result.error = None
+                result.score = compute_score(result)
+                logger.info(f"URL: {url} 测试成功，首字节: {result.ttfb:.2f}ms，"
+                            f"速度: {result.throughput or 0:.1f}KB/s，分辨率: {result.resolution}，"
+                            f"编码: {result.codec}，帧率: {result.fps}")
+                break
+            except Exception as e:
+                result.error = str(e) or type(e).__name__
+                logger.warning(f"URL: {url} 尝试 {attempt+1}/{retry_times} 失败: {result.error}")
+                await self._backoff(url, e, attempt, retry_times)
+
+        return result
+
+    def host_blocked(self, url: str) -> bool:
+        """主机连续连接失败次数达到上限时，不再测其余URL"""
+        return self.host_failures[url_host(url)] >= config.HOST_FAILURE_LIMIT
+
+    async def _backoff(self, url: str, error: Exception, attempt: int, retry_times: int) -> None:
+        """记录连接失败，并在下次重试前按指数退避加随机抖动等待"""
+        if isinstance(error, CONNECT_ERRORS):
+            self.host_failures[url_host(url)] += 1
+        if attempt + 1 < retry_times and not self.host_blocked(url):
+            delay = config.RETRY_BACKOFF * 2 ** attempt
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+
+    async def _probe_once(self, url: str, result: SpeedTestResult, depth: int = 0,
+                          sniffer: Optional[StreamSniffer] = None) -> None:
+        start_time = time.perf_counter()
+        trace = {}
+        async with self.session.get(url, headers={"User-Agent": "Mozilla/5.0"}, trace_request_ctx=trace) as response:
+            if depth == 0:
+                self._record_redirects(result, response, trace, start_time)
+            if response.status != 200:
+                raise ProbeError(f"HTTP状态码: {response.status}")
+            first_chunk = await response.content.read(64 * 1024)
+            ttfb = (time.perf_counter() - start_time) * 1000
+            if depth == 0:
+                result.ttfb = ttfb
+                result.latency = ttfb
+
+            content_type = response.headers.get("Content-Type", "").lower()
+            if not first_chunk.lstrip().startswith(b"#EXTM3U") and "mpegurl" not in content_type:
+                # 非播放列表，直接按直连流读取一段测吞吐量；网页、文本（多为错误页）和空响应不算可用的流
+                if content_type.startswith(NON_STREAM_CONTENT_TYPES):
+                    raise ProbeError(f"响应不是媒体流: {content_type}")
+                if sniffer:
+                    sniffer.feed(first_chunk)
+                size = len(first_chunk) + await self._read_capped(
+                    response, config.SEGMENT_BYTE_CAP - len(first_chunk), sniffer)
+                if not size:
+                    raise ProbeError("媒体流为空")
+                result.throughput = self._throughput(size, start_time)
+                return
+
+            body = first_chunk + await response.content.read(config.PLAYLIST_MAX_BYTES - len(first_chunk))
+            base_url = str(response.url)
+
+        variants, segments = parse_hls_playlist(body.decode("utf-8", errors="replace"), base_url)
+        if variants:
+            if depth >= 2:
+                raise ProbeError("播放列表嵌套过深")
+            # 选择码率最高的子播放列表，记录其分辨率和码率
+            attrs, variant_url = max(variants, key=lambda item: int(item[0].get("BANDWIDTH", 0) or 0))
+            result.resolution = attrs.get("RESOLUTION") or result.resolution
+            if attrs.get("BANDWIDTH", "").isdigit():
+                result.bandwidth = int(attrs["BANDWIDTH"])
+            await self._probe_once(variant_url, result, depth + 1, sniffer)
+            return
+        if not segments:
+            raise ProbeError("播放列表中没有媒体分片")
+
+        total_size = 0
+        segment_start = time.perf_counter()
+        # 直播列表中靠前的分片最先过期，测最新的几个分片
+        for segment_url in segments[max(len(segments) - config.PROBE_SEGMENTS, 0):]:
+            async with self.session.get(segment_url, headers={"User-Agent": "Mozilla/5.0"}) as response:
+                if response.status != 200:
+                    raise ProbeError(f"分片HTTP状态码: {response.status}")
+                total_size += await self._read_capped(response, config.SEGMENT_BYTE_CAP, sniffer)
+        if not total_size:
+            raise ProbeError("媒体分片为空")
+        result.throughput = self._throughput(total_size, segment_start)
+
+    @staticmethod
+    async def _on_redirect(session, context, params) -> None:
+        if context.trace_request_ctx is not None:
+            context.trace_request_ctx["redirected_at"] = time.perf_counter()
+
+    @staticmethod
+    def _record_redirects(result: SpeedTestResult, response, trace: dict, start_time: float) -> None:
+        """记录跟随重定向后的最终地址、跳数和跳转耗时，供重定向缓存使用"""
+        result.final_url = str(response.url)
+        result.redirect_hops = len(response.history)
+        redirected_at = trace.get("redirected_at")
+        result.redirect_ms = (redirected_at - start_time) * 1000 if redirected_at else 0.0
+
+    @staticmethod
+    async def _read_capped(response, byte_cap: int, sniffer: Optional[StreamSniffer] = None) -> int:
+        """读取响应正文直到结束或达到字节上限，返回读取的字节数；嗅探未完成时顺带交给嗅探器"""
+        size = 0
+        while size < byte_cap:
+            chunk = await response.content.read(min(64 * 1024, byte_cap - size))
+            if not chunk:
+                break
+            size += len(chunk)
+            if sniffer and not sniffer.done:
+                sniffer.feed(chunk)
+        return size
+
+    @staticmethod
+    def _apply_sniffed(result: SpeedTestResult, info) -> None:
+        """码流中的实际分辨率比播放列表声明的更可靠，识别到时覆盖"""
+        result.resolution = info.resolution or result.resolution
+        result.codec = info.codec
+        result.fps = info.fps
+
+    @staticmethod
+    def _throughput(size: int, start_time: float) -> float:
+        elapsed = max(time.perf_counter() - start_time, 1e-6)
+        return size / 1024 / elapsed
+
+    async def batch_speed_test(self, urls: List[str],
+                               on_result: Optional[Callable[[SpeedTestResult], None]] = None) -> List[SpeedTestResult]:
+        """批量测速：先按主机限流再受全局并发上限约束，连续连接失败的主机直接短路；on_result 在每个URL测完时调用"""
+        global_semaphore = asyncio.Semaphore(self.concurrent_limit)
+        host_semaphores = defaultdict(lambda: asyncio.Semaphore(self.per_host_limit))
 
         async def worker(url):
-            nonlocal results
-            async with semaphore:
-                result = await self.measure_latency(url, config.RETRY_TIMES)
-                results.append(result)
+            host = url_host(url)
+            # 先占用主机名额再占用全局名额，避免等待繁忙主机的任务占住全局并发
+            async with host_semaphores[host]:
+                if self.host_blocked(url):
+                    result = SpeedTestResult(url=url, test_time=time.time(), error="主机连续连接失败，已跳过")
+                else:
+                    async with global_semaphore:
+                        result = await probe(url, self.retry_times)
+            if result.success:
+                self.host_failures[host] = 0
+            if on_result:
+                on_result(result)
+            return result
 
-        tasks = [worker(url) for url in urls]
-        await asyncio.gather(*tasks)
+        probe = self.probe_stream if self.probe_mode == "hls" else self.measure_latency
+        results = await asyncio.gather(*(worker(url) for url in urls))
         
-        # 按延迟排序结果（升序）
-        return sorted(results, key=lambda x: x.latency if x.latency is not None else float('inf'))
+        # 按综合评分（或延迟）排序结果
+        return sorted(results, key=rank_key)
 
 # M3U文件处理类
 class M3UProcessor:
@@ -107,23 +381,9 @@ class M3UProcessor:
         """解析M3U文件，返回[(名称, URL), ...]"""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            
-            live_sources = []
-            current_name = None
-            
-            for line in lines:
-                line = line.strip()
-                if line.startswith('#EXTINF:'):
-                    # 提取名称
-                    name_start = line.find(',') + 1
-                    current_name = line[name_start:] if name_start > 0 else "未知频道"
-                elif line.startswith('http') and current_name:
-                    # 添加到源列表
-                    live_sources.append((current_name, line))
-                    current_name = None
-            
-            return live_sources
+                return [(record.name, record.url)
+                        for record in iter_m3u_records(f, default_category="")
+                        if record.url.startswith('http')]
         except Exception as e:
             logger.error(f"解析M3U文件失败: {e}")
             return []
@@ -182,7 +442,7 @@ async def main():
     logger.info("前5个最快的直播源:")
     for i, (name, url) in enumerate(sorted_live_sources[:5], 1):
         latency = url_to_result[url].latency
-        logger.info(f"{i}. {name} - 延迟: {latency:.2f}ms")
+        logger.info(f"{i}. {name} - 延迟: {f'{latency:.2f}' if latency is not None else 'N/A'}ms")
     
     # 生成排序后的M3U文件
     m3u_processor.generate_m3u(sorted_live_sources, output_file)
@@ -208,4 +468,5 @@ async def main():
         logger.error(f"生成测试报告失败: {e}")
 
 if __name__ == "__main__":
+    setup_logging()
     asyncio.run(main())    
@@ -0,0 +1,82 @@
+"""
+URL处理模块
+对每个唯一URL只做一次分类（规范化去重键、IP版本、黑名单）并缓存结果，
+黑名单合并为一个预编译正则，一次扫描即可判断是否命中。
+规范化去掉 '$' 后的显示后缀和 '#' 片段，协议和主机转小写，去掉默认端口，查询参数排序，
+写法不同但指向同一地址的URL得到相同的去重键，只测速、写入一次。
+"""
+import re
+from urllib.parse import urlsplit, urlunsplit
+
+IPV6_URL_PATTERN = re.compile(r'^https?://\[[0-9a-fA-F:]+\]')
+DEFAULT_PORTS = {"http": 80, "https": 443, "rtsp": 554, "rtmp": 1935}
+
+
+def canonicalize_url(url):
+    """返回URL的规范形式，无法解析的URL只去掉显示后缀"""
+    url = url.split('$', 1)[0].strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    if not parts.scheme or not parts.netloc:
+        return url
+
+    scheme = parts.scheme.lower()
+    host = parts.hostname or ""
+    if ":" in host:
+        host = f"[{host}]"
+    userinfo = parts.netloc.rpartition("@")[0]
+    netloc = f"{userinfo}@{host}" if userinfo else host
+    if port is not None and port != DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{port}"
+    query = "&".join(sorted(item for item in parts.query.split("&") if item))
+    path = parts.path or ("/" if scheme in ("http", "https") else "")
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+def compile_blacklist(patterns):
+    """将黑名单子串合并为一个正则，较长的模式优先匹配；黑名单为空时返回 None"""
+    patterns = sorted({pattern for pattern in patterns if pattern}, key=len, reverse=True)
+    if not patterns:
+        return None
+    return re.compile("|".join(re.escape(pattern) for pattern in patterns))
+
+
+class UrlClassifier:
+    """URL分类器，结果按原始URL缓存"""
+
+    def __init__(self, blacklist):
+        self.blacklist = list(blacklist)
+        self._blacklist_pattern = compile_blacklist(self.blacklist)
+        self._cache = {}
+        self._representatives = {}
+
+    def classify(self, url):
+        """
+        返回 (规范化去重键, IP版本)，IP版本为 "IPV4" 或 "IPV6"
+        空URL或命中黑名单时返回 None
+        """
+        try:
+            return self._cache[url]
+        except KeyError:
+            pass
+
+        info = None
+        stripped = url.split('$', 1)[0].strip() if url else ""
+        if stripped and not self.is_blacklisted(stripped):
+            key = canonicalize_url(stripped)
+            if not self.is_blacklisted(key):
+                info = (key, "IPV6" if IPV6_URL_PATTERN.match(key) else "IPV4")
+                # 每组规范化相同的URL以最先出现的写法作为代表，测速时请求的就是这个地址
+                self._representatives.setdefault(key, stripped)
+        self._cache[url] = info
+        return info
+
+    def representative(self, key):
+        """返回去重键对应的代表URL（去掉显示后缀的原始写法）"""
+        return self._representatives.get(key, key)
+
+    def is_blacklisted(self, url):
+        return bool(self._blacklist_pattern and self._blacklist_pattern.search(url))